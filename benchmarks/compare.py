@@ -0,0 +1,92 @@
+import argparse
+import json
+import sys
+
+
+def load_results(path: str):
+    with open(path) as f:
+        report = json.load(f)
+
+    return {
+        (result["width"], result["height"], result["iterations"]): result
+        for result in report["results"]
+    }
+
+
+def compare_results(baseline: dict, candidate: dict, threshold: float):
+    # Positive change is always an improvement, steps/s is the only metric
+    # where higher is better
+    rows = []
+
+    for key in sorted(baseline.keys() & candidate.keys()):
+        before = baseline[key]
+        after = candidate[key]
+
+        metrics = [
+            (
+                "steps/s",
+                before["steps_per_second"],
+                after["steps_per_second"],
+                True,
+            )
+        ]
+        for stage, seconds in before["stages"].items():
+            if stage in after["stages"]:
+                metrics.append((stage, seconds, after["stages"][stage], False))
+        if before.get("particles") and after.get("particles"):
+            metrics.append(
+                ("particles", before["particles"], after["particles"], False)
+            )
+
+        for name, old, new, higher_is_better in metrics:
+            if old <= 0.0:
+                continue
+
+            change = (new - old) / old
+            if not higher_is_better:
+                change = -change
+
+            rows.append((key, name, old, new, change, change < -threshold))
+
+    return rows
+
+
+def format_row(row: tuple):
+    (width, height, iterations), name, old, new, change, regressed = row
+
+    if name == "steps/s":
+        values = f"{old:10.1f} {new:10.1f}"
+    else:
+        values = f"{old * 1000.0:10.3f} {new * 1000.0:10.3f}"
+
+    flag = "  REGRESSION" if regressed else ""
+    return (
+        f"{width}x{height} it={iterations:<4} {name:<12} {values} "
+        f"{change * 100.0:+7.1f}%{flag}"
+    )
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark runs")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="relative slowdown reported as a regression",
+    )
+    args = parser.parse_args(args)
+
+    rows = compare_results(
+        load_results(args.baseline), load_results(args.candidate), args.threshold
+    )
+
+    for row in rows:
+        print(format_row(row))
+
+    return 1 if any(row[-1] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,298 @@
+import argparse
+import json
+import platform
+import time
+from datetime import datetime
+
+import numpy as np
+
+from natrix.core.common.constants import Precision, PressureSolver
+from natrix.core.numpy_fluid_simulator import NumpyFluidSimulator
+
+# Names of the bgfx.RendererType values
+RENDERERS = {
+    "auto": "Count",
+    "noop": "Noop",
+    "vulkan": "Vulkan",
+    "opengl": "OpenGL",
+    "direct3d11": "Direct3D11",
+    "direct3d12": "Direct3D12",
+}
+
+# Same order as FluidSimulator.update
+STAGES = (
+    ("boundaries", "_init_boundaries"),
+    ("advect", "_advect_velocity"),
+    ("vorticity", "_apply_vorticity_confinement"),
+    ("viscosity", "_apply_viscosity"),
+    ("divergence", "_calc_divergence"),
+    ("poisson", "_solve_pressure"),
+    ("gradient", "_subtract_gradient"),
+)
+
+
+class NumpyBackend:
+    name = "numpy"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def create_simulator(self, width: int, height: int, **kwargs):
+        return NumpyFluidSimulator(width, height, **kwargs)
+
+    def create_particles(self, simulator):
+        return None
+
+    def step(self, simulator, particles, time_delta: float):
+        simulator.update(time_delta)
+
+    def time_stage(self, simulator, method: str, time_delta: float, frames: int):
+        elapsed = 0.0
+
+        for _ in range(frames):
+            simulator._begin_update(time_delta)
+
+            start = time.perf_counter()
+            getattr(simulator, method)()
+            elapsed += time.perf_counter() - start
+
+        return elapsed / frames
+
+    def time_particles(self, particles, time_delta: float, frames: int):
+        return None
+
+    def gpu_memory(self):
+        return None
+
+
+class GpuBackend:
+    name = "gpu"
+
+    def __init__(self, renderer: str):
+        # pybgfx is only needed by this backend
+        from pybgfx import bgfx
+
+        from natrix.core.headless_runner import HeadlessRunner
+
+        self._bgfx = bgfx
+        self._runner = HeadlessRunner(
+            renderer_type=getattr(bgfx.RendererType, RENDERERS[renderer])
+        )
+
+    def __enter__(self):
+        self._runner.init()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._runner.shutdown()
+
+    def create_simulator(self, width: int, height: int, **kwargs):
+        return self._runner.create_simulator(width, height, **kwargs)
+
+    def create_particles(self, simulator):
+        from demo.smooth_particles_area import SmoothParticlesArea
+
+        return SmoothParticlesArea(
+            simulator.width, simulator.height, simulator, self._runner.vertex_layout
+        )
+
+    def step(self, simulator, particles, time_delta: float):
+        simulator.update(time_delta)
+        particles.update(time_delta)
+        self._bgfx.frame()
+
+    def time_stage(self, simulator, method: str, time_delta: float, frames: int):
+        def dispatch():
+            simulator._begin_update(time_delta)
+            getattr(simulator, method)()
+
+        return self._time_frames(dispatch, frames)
+
+    def time_particles(self, particles, time_delta: float, frames: int):
+        return self._time_frames(lambda: particles.update(time_delta), frames)
+
+    def gpu_memory(self):
+        used = self._bgfx.getStats().gpuMemoryUsed
+
+        # Negative when the renderer can not report it
+        return used if used > 0 else None
+
+    def _time_frames(self, dispatch, frames: int):
+        # One isolated stage per frame, the stats of a frame hold the GPU time
+        # of the previous one, hence the extra frame at the end
+        gpu_time = 0.0
+        cpu_start = time.perf_counter()
+
+        for frame in range(frames + 1):
+            if frame < frames:
+                dispatch()
+            self._bgfx.frame()
+
+            stats = self._bgfx.getStats()
+            if frame > 0 and stats.gpuTimerFreq > 0:
+                gpu_time += (stats.gpuTimeEnd - stats.gpuTimeBegin) / float(
+                    stats.gpuTimerFreq
+                )
+
+        if gpu_time > 0.0:
+            return gpu_time / frames
+
+        # No GPU timer (e.g. Noop renderer), fall back to the CPU submit time
+        return (time.perf_counter() - cpu_start) / frames
+
+
+def add_splat(simulator, step: int):
+    # A rotating splat, so that every stage has some work to do
+    angle = step * 0.1
+    simulator.add_velocity(
+        (0.5 + 0.25 * np.cos(angle), 0.5 + 0.25 * np.sin(angle)),
+        (0.1 * np.sin(angle), -0.1 * np.cos(angle)),
+        simulator.width / 16.0,
+    )
+
+
+def run_case(
+    backend,
+    width: int,
+    height: int,
+    iterations: int,
+    solver: PressureSolver,
+    precision: Precision,
+    steps: int,
+    stage_frames: int,
+    warmup: int,
+    time_delta: float,
+):
+    simulator = backend.create_simulator(
+        width, height, pressure_solver=solver, precision=precision
+    )
+    simulator.iterations = iterations
+    particles = backend.create_particles(simulator)
+
+    for step in range(warmup):
+        add_splat(simulator, step)
+        backend.step(simulator, particles, time_delta)
+
+    start = time.perf_counter()
+    for step in range(steps):
+        add_splat(simulator, step)
+        backend.step(simulator, particles, time_delta)
+    elapsed = time.perf_counter() - start
+
+    stages = {}
+    for name, method in STAGES:
+        stages[name] = backend.time_stage(simulator, method, time_delta, stage_frames)
+
+    buffer_memory = simulator.buffer_memory
+    if particles is not None:
+        buffer_memory += particles.buffer_memory
+
+    result = {
+        "width": width,
+        "height": height,
+        "iterations": iterations,
+        "steps": steps,
+        "steps_per_second": steps / elapsed,
+        "step_time": elapsed / steps,
+        "stages": stages,
+        "particles": backend.time_particles(particles, time_delta, stage_frames),
+        "buffer_memory": buffer_memory,
+        "gpu_memory": backend.gpu_memory(),
+    }
+
+    simulator.destroy()
+    if particles is not None:
+        particles.destroy()
+
+    return result
+
+
+def format_result(result: dict):
+    stages = " ".join(
+        f"{name}={seconds * 1000.0:.3f}" for name, seconds in result["stages"].items()
+    )
+    return (
+        f"{result['width']}x{result['height']} it={result['iterations']}: "
+        f"{result['steps_per_second']:.1f} steps/s, "
+        f"{result['buffer_memory'] / 2 ** 20:.1f} MiB, stages (ms) {stages}"
+    )
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the fluid simulation across grid sizes"
+    )
+    parser.add_argument("--backend", choices=["gpu", "numpy"], default="gpu")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[256, 512, 1024, 2048])
+    parser.add_argument("--iterations", type=int, nargs="+", default=[10, 50])
+    parser.add_argument(
+        "--solver",
+        choices=[solver.name.lower() for solver in PressureSolver],
+        default="jacobi",
+    )
+    parser.add_argument(
+        "--precision",
+        choices=[precision.name.lower() for precision in Precision],
+        default="fp32",
+    )
+    parser.add_argument("--steps", type=int, default=100)
+    parser.add_argument("--stage-frames", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--dt", type=float, default=1.0 / 60.0)
+    parser.add_argument("--renderer", choices=list(RENDERERS), default="auto")
+    parser.add_argument("--output", "-o", default=None)
+    args = parser.parse_args(args)
+
+    solver = PressureSolver[args.solver.upper()]
+    precision = Precision[args.precision.upper()]
+
+    if args.backend == "gpu":
+        backend = GpuBackend(args.renderer)
+    else:
+        backend = NumpyBackend()
+
+    results = []
+    with backend:
+        for size in args.sizes:
+            for iterations in args.iterations:
+                result = run_case(
+                    backend,
+                    size,
+                    size,
+                    iterations,
+                    solver,
+                    precision,
+                    args.steps,
+                    args.stage_frames,
+                    args.warmup,
+                    args.dt,
+                )
+                print(format_result(result))
+                results.append(result)
+
+    report = {
+        "meta": {
+            "backend": backend.name,
+            "solver": solver.name.lower(),
+            "precision": precision.name.lower(),
+            "renderer": args.renderer if args.backend == "gpu" else None,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+        },
+        "results": results,
+    }
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -49,13 +49,15 @@ class ExampleWindow(object):
         return (
             mouse_x,
             mouse_y,
-            1
-            if state_mbl == glfw.PRESS
-            else 0 | 2
-            if state_mbm == glfw.PRESS
-            else 0 | 4
-            if state_mbr == glfw.PRESS
-            else 0,
+            (
+                1
+                if state_mbl == glfw.PRESS
+                else (
+                    0 | 2
+                    if state_mbm == glfw.PRESS
+                    else 0 | 4 if state_mbr == glfw.PRESS else 0
+                )
+            ),
         )
 
     # noinspection PyProtectedMember
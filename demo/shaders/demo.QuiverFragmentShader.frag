@@ -2,9 +2,10 @@ $input v_texcoord0
 
 #include <bgfx_shader.sh>
 #include "bgfx_compute.sh"
+#include "velocity.sh"
 
 SAMPLER2D(s_texColor, 0);
-BUFFER_RO(_VelocityIn, vec2, 1);
+BUFFER_RO(_VelocityIn, VELOCITY_TYPE, 1);
 
 uniform float ArrowTileSize;
 uniform vec2 VelocitySize;
@@ -54,10 +55,10 @@ vec2 _field(vec2 pos) {
     ivec2 top_right = ivec2(clamp(ceil(fPos), vec2(zero), vec2(size_bounds)));
     ivec2 bottom_left = ivec2(clamp(floor(fPos), vec2(zero), vec2(size_bounds)));
     vec2 delta = fPos - vec2(bottom_left);
-    vec2 lt = _VelocityIn[uint(top_right.y) * VelocitySize.x + uint(bottom_left.x)];
-    vec2 rt = _VelocityIn[uint(top_right.y) * VelocitySize.x + uint(top_right.x)];
-    vec2 lb = _VelocityIn[uint(bottom_left.y) * VelocitySize.x + uint(bottom_left.x)];
-    vec2 rb = _VelocityIn[uint(bottom_left.y) * VelocitySize.x + uint(top_right.x)];
+    vec2 lt = LOAD_VELOCITY(_VelocityIn[uint(top_right.y) * VelocitySize.x + uint(bottom_left.x)]);
+    vec2 rt = LOAD_VELOCITY(_VelocityIn[uint(top_right.y) * VelocitySize.x + uint(top_right.x)]);
+    vec2 lb = LOAD_VELOCITY(_VelocityIn[uint(bottom_left.y) * VelocitySize.x + uint(bottom_left.x)]);
+    vec2 rb = LOAD_VELOCITY(_VelocityIn[uint(bottom_left.y) * VelocitySize.x + uint(top_right.x)]);
     vec2 h1 = mix(lt, rt, vec2(delta.x, 0));
     vec2 h2 = mix(lb, rb, vec2(delta.x, 0));
     return -1.0 * mix(h2, h1, vec2(delta.y, 0)) * (WindowSize / VelocitySize);
@@ -0,0 +1,12 @@
+#ifndef GROUP_SIZE_SH_HEADER_GUARD
+#define GROUP_SIZE_SH_HEADER_GUARD
+
+// Same workgroup size as the simulator kernels, see natrix constants.sh
+#ifndef GROUP_SIZE_X
+#define GROUP_SIZE_X 16
+#endif
+#ifndef GROUP_SIZE_Y
+#define GROUP_SIZE_Y 16
+#endif
+
+#endif // GROUP_SIZE_SH_HEADER_GUARD
@@ -0,0 +1,13 @@
+#ifndef VELOCITY_SH_HEADER_GUARD
+#define VELOCITY_SH_HEADER_GUARD
+
+// Same storage as the simulator kernels, see natrix constants.sh
+#if NATRIX_FP16
+#define VELOCITY_TYPE uint
+#define LOAD_VELOCITY(_value) unpackHalf2x16(_value)
+#else
+#define VELOCITY_TYPE vec2
+#define LOAD_VELOCITY(_value) (_value)
+#endif
+
+#endif // VELOCITY_SH_HEADER_GUARD
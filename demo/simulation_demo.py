@@ -22,15 +22,18 @@ from pybgfx.constants import (
     BGFX_STATE_BLEND_ALPHA,
 )
 from pybgfx.utils import as_void_ptr
-from pybgfx.utils.shaders_utils import ShaderType, load_shader
+from pybgfx.utils.shaders_utils import ShaderType
 from loguru import logger
 
 from demo.example_window import ExampleWindow
 from demo.smooth_particles_area import SmoothParticlesArea
+
 # from demo.utils.imgui_utils import show_properties_dialog
 from demo.utils.imgui_utils import show_properties_dialog
 from demo.utils.matrix_utils import look_at, proj
 from natrix.core.fluid_simulator import FluidSimulator
+from natrix.core.scheduler import StepScheduler
+from natrix.core.utils.shaders_utils import load_cached_shader, shader_variant_path
 
 logger.enable("bgfx")
 
@@ -90,7 +93,7 @@ class SimulationDemo(ExampleWindow):
 
         bgfx.setDebug(BGFX_DEBUG_TEXT)
         # bgfx.setViewClear(0, BGFX_CLEAR_COLOR | BGFX_CLEAR_DEPTH, 0xFFFFFFFF, 1.0, 0)
-        bgfx.setViewClear(0, BGFX_CLEAR_COLOR | BGFX_CLEAR_DEPTH, 0x1a0427FF, 1.0, 0)
+        bgfx.setViewClear(0, BGFX_CLEAR_COLOR | BGFX_CLEAR_DEPTH, 0x1A0427FF, 1.0, 0)
 
         self.vertex_layout = bgfx.VertexLayout()
         self.vertex_layout.begin().add(
@@ -103,12 +106,18 @@ class SimulationDemo(ExampleWindow):
         self.fluid_simulator.vorticity = 1.0
         self.fluid_simulator.viscosity = 0.5
         self.fluid_simulator.iterations = 50
+        self.fluid_simulator.add_circle_obstacle((0.5, 0.5), 40.0, static=True)
 
         self.particle_area = SmoothParticlesArea(
             self.fb_width, self.fb_height, self.fluid_simulator, self.vertex_layout
         )
         self.particle_area.dissipation = 0.980
 
+        # Frame hitches become several stable substeps instead of a huge one
+        self.scheduler = StepScheduler(
+            self.fluid_simulator, on_step=self.particle_area.update
+        )
+
         # Create static vertex buffer
         vb_memory = bgfx.copy(as_void_ptr(cube_vertices), sizeof(PosColorVertex) * 4)
         self.vertex_buffer = bgfx.createVertexBuffer(vb_memory, self.vertex_layout)
@@ -140,29 +149,33 @@ class SimulationDemo(ExampleWindow):
 
         # Create program from shaders.
         self.main_program = bgfx.createProgram(
-            load_shader(
+            load_cached_shader(
                 "demo.VertexShader.vert", ShaderType.VERTEX, root_path=root_path
             ),
-            load_shader(
+            load_cached_shader(
                 "demo.FieldFragmentShader.frag",
                 ShaderType.FRAGMENT,
                 root_path=root_path,
             ),
             True,
         )
+        # Reads the velocity buffer, in the simulator storage format
+        quiver_path = shader_variant_path(
+            root_path, self.fluid_simulator.shader_defines
+        )
         self.quiver_program = bgfx.createProgram(
-            load_shader(
-                "demo.VertexShader.vert", ShaderType.VERTEX, root_path=root_path
+            load_cached_shader(
+                "demo.VertexShader.vert", ShaderType.VERTEX, root_path=quiver_path
             ),
-            load_shader(
+            load_cached_shader(
                 "demo.QuiverFragmentShader.frag",
                 ShaderType.FRAGMENT,
-                root_path=root_path,
+                root_path=quiver_path,
             ),
             True,
         )
         self.cs_program = bgfx.createProgram(
-            load_shader(
+            load_cached_shader(
                 "demo.ComputeShader.comp", ShaderType.COMPUTE, root_path=root_path
             ),
             True,
@@ -217,13 +230,12 @@ class SimulationDemo(ExampleWindow):
         bgfx.setState(BGFX_STATE_DEFAULT)
         bgfx.setImage(0, self.output_texture, 0, bgfx.Access.Write)
 
-        self.fluid_simulator.add_circle_obstacle((0.5, 0.5), 40.0)
+        self.scheduler.advance(dt)
 
-        self.fluid_simulator.update(dt)
-        self.particle_area.update(dt)
-
-        if glfw.get_mouse_button(self.window, glfw.MOUSE_BUTTON_LEFT) == glfw.PRESS\
-                and not ImGui.GetIO().WantCaptureMouse:
+        if (
+            glfw.get_mouse_button(self.window, glfw.MOUSE_BUTTON_LEFT) == glfw.PRESS
+            and not ImGui.GetIO().WantCaptureMouse
+        ):
             n_mouse_x, n_mouse_y = self._get_normalized_mouse_coords(mouse_x, mouse_y)
             n_old_mouse_x, n_old_mouse_y = self._get_normalized_mouse_coords(
                 self.old_mouse_x, self.old_mouse_y
@@ -234,7 +246,9 @@ class SimulationDemo(ExampleWindow):
             self.fluid_simulator.add_velocity(
                 (n_mouse_x, n_mouse_y), (vel_x * 10, vel_y * 10), 32.0
             )
-            self.particle_area.add_particles((n_mouse_x, n_mouse_y), self.particles_diameter, self.particles_strength)
+            self.particle_area.add_particles(
+                (n_mouse_x, n_mouse_y), self.particles_diameter, self.particles_strength
+            )
 
         self.old_mouse_x = mouse_x
         self.old_mouse_y = mouse_y
@@ -273,7 +287,9 @@ class SimulationDemo(ExampleWindow):
             )
             bgfx.submit(0, self.quiver_program, 0, False)
 
-        bgfx.frame()
+        frame = bgfx.frame()
+        self.fluid_simulator.poll_readback(frame)
+        self.particle_area.poll_readback(frame)
 
     def resize(self):
         bgfx.reset(
@@ -357,7 +373,10 @@ class SimulationDemo(ExampleWindow):
         ImGui.SameLine()
         ImGui.PushItemWidth(200.0)
         ImGui.Combo(
-            "", self.quiver_plot_resolution, ["Very Small", "Small", "Medium", "Large"], 4,
+            "",
+            self.quiver_plot_resolution,
+            ["Very Small", "Small", "Medium", "Large"],
+            4,
         )
         ImGui.PopItemWidth()
         ImGui.End()
@@ -1,13 +1,22 @@
-from ctypes import c_float
+from ctypes import c_float, sizeof
 from math import ceil
 from pathlib import Path
 
+import numpy as np
 from pybgfx import bgfx
 from pybgfx.utils import as_void_ptr
-from pybgfx.utils.shaders_utils import ShaderType, load_shader
-from natrix.core.common.constants import TemplateConstants
+from pybgfx.utils.shaders_utils import ShaderType
+from natrix.core.common.constants import ScratchSlots, TemplateConstants
 from natrix.core.fluid_simulator import FluidSimulator
-from natrix.core.utils.shaders_utils import create_buffer
+from natrix.core.readback import ReadbackRing
+from natrix.core.utils.obstacle_utils import bounding_box_groups
+from natrix.core.utils.shaders_utils import (
+    create_buffer,
+    load_cached_shader,
+    shader_variant_path,
+    update_buffer_reference,
+)
+from natrix.core.utils.state_utils import read_state, write_state_when_done
 
 root_path = Path(__file__).parent / "shaders"
 
@@ -19,12 +28,19 @@ class SmoothParticlesArea:
     _width = 512
     _height = 512
     _particles_buffer = None
+    _readback_ring = None
+    _upload = None
 
     _speed = 500.0
     _dissipation = 1.0
 
     simulate = True
 
+    readback_slots = 3
+
+    # Saved and restored by save_state and load_state, on top of the particles
+    _state_parameters = ("speed", "dissipation", "simulate")
+
     def __init__(
         self,
         width: int,
@@ -40,6 +56,10 @@ class SmoothParticlesArea:
 
         self._create_uniforms()
 
+        # The kernels read the velocity in the simulator storage format
+        self._shader_path = shader_variant_path(
+            root_path, fluid_simulation.shader_defines
+        )
         self._load_compute_kernels()
         self._set_size()
         self._create_buffers()
@@ -67,8 +87,24 @@ class SmoothParticlesArea:
         else:
             raise ValueError("'Dissipation' should be grater than zero")
 
+    @property
+    def buffer_memory(self):
+        return sizeof(c_float) * self._num_cells * len(self._particles_buffer)
+
     def add_particles(self, position: tuple, radius: float, strength: float):
-        if self.simulate:
+        x = position[0] * self._width
+        y = position[1] * self._height
+        region = bounding_box_groups(
+            x - radius,
+            y - radius,
+            x + radius,
+            y + radius,
+            self._width,
+            self._height,
+            self.fluid_simulation.group_size,
+        )
+
+        if self.simulate and region is not None:
             self._init_compute_kernels()
             bgfx.setUniform(
                 self.position_uniform,
@@ -77,10 +113,99 @@ class SmoothParticlesArea:
             bgfx.setUniform(self.value_uniform, as_void_ptr((c_float * 1)(strength)))
             bgfx.setUniform(self.radius_uniform, as_void_ptr((c_float * 1)(radius)))
 
-            bgfx.dispatch(
-                0, self._add_particles_kernel, self._num_groups_x, self._num_groups_x, 1
+            bgfx.setUniform(
+                self.offset_uniform, as_void_ptr((c_float * 2)(region[0], region[1]))
             )
-            self._flip_buffer()
+
+            # Updated in place, only the workgroups overlapping the splat
+            bgfx.setBuffer(
+                TemplateConstants.PARTICLES_IN.value,
+                self._particles_buffer[self.PARTICLES_IN],
+                bgfx.Access.ReadWrite,
+            )
+            bgfx.dispatch(0, self._add_particles_kernel, region[2], region[3], 1)
+
+    # (height, width) float32 array, uploaded by reference like
+    # FluidSimulator.set_velocity
+    def set_particles(self, particles):
+        particles = np.ascontiguousarray(particles, dtype=np.float32).reshape(-1)
+        if particles.shape[0] != self._num_cells:
+            raise ValueError("'Particles' should have one value per cell")
+
+        self._upload = particles
+        update_buffer_reference(self._particles_buffer[self.PARTICLES_IN], particles)
+
+    # Future of a (height, width) array, see FluidSimulator.read_field. None while
+    # all the staging slots are still in flight
+    def read_particles(self):
+        if self._readback_ring is None:
+            self._readback_ring = ReadbackRing(
+                self._width,
+                self._height,
+                bgfx.TextureFormat.R32F,
+                slots=self.readback_slots,
+                view=self.fluid_simulation.readback_view,
+            )
+
+        slot = self._readback_ring.acquire()
+        if slot is None:
+            return None
+
+        self._init_compute_kernels()
+        bgfx.setBuffer(
+            TemplateConstants.PARTICLES_IN.value,
+            self._particles_buffer[self.PARTICLES_IN],
+            bgfx.Access.Read,
+        )
+        bgfx.setImage(ScratchSlots.READBACK, slot.texture, 0, bgfx.Access.Write)
+        bgfx.dispatch(
+            0,
+            self._readback_particles_kernel,
+            self._num_groups_x,
+            self._num_groups_y,
+            1,
+        )
+
+        return self._readback_ring.submit(slot)
+
+    # Call after bgfx.frame(), with the frame number it returned
+    def poll_readback(self, frame: int):
+        if self._readback_ring is not None:
+            self._readback_ring.poll(frame)
+
+    # Same format as FluidSimulator.save_state, the simulator is saved separately
+    def save_state(self, path: Path):
+        particles = self.read_particles()
+        if particles is None:
+            raise RuntimeError("Too many readbacks in flight to save the state")
+
+        metadata = {
+            "width": self._width,
+            "height": self._height,
+            "particles_in": self.PARTICLES_IN,
+            "parameters": {
+                name: getattr(self, name) for name in self._state_parameters
+            },
+        }
+
+        return write_state_when_done(path, metadata, {"particles": particles})
+
+    def load_state(self, path: Path):
+        metadata, arrays = read_state(path)
+        if (metadata["width"], metadata["height"]) != (self._width, self._height):
+            raise ValueError(
+                f"'State' is {metadata['width']}x{metadata['height']}, "
+                f"the particles area {self._width}x{self._height}"
+            )
+
+        for name, value in metadata["parameters"].items():
+            if name in self._state_parameters:
+                setattr(self, name, value)
+
+        self.PARTICLES_IN = metadata["particles_in"]
+        self.PARTICLES_OUT = 1 - self.PARTICLES_IN
+
+        self.set_particles(arrays["particles"])
 
     def update(self, time_delta: float):
         self._init_compute_kernels()
@@ -109,8 +234,8 @@ class SmoothParticlesArea:
             self.fluid_simulation.width,
             self.fluid_simulation.height,
         )
-        group_size_x = TemplateConstants.NUM_THREADS.value
-        group_size_y = TemplateConstants.NUM_THREADS.value
+        # The kernels are compiled with the simulator workgroup size
+        group_size_x, group_size_y = self.fluid_simulation.group_size
 
         self._num_cells = self._width * self._height
         self._num_groups_x = int(ceil(float(self._width) / float(group_size_x)))
@@ -133,6 +258,7 @@ class SmoothParticlesArea:
         self.velocity_size_uniform = bgfx.createUniform(
             "_VelocitySize", bgfx.UniformType.Vec4
         )
+        self.offset_uniform = bgfx.createUniform("_Offset", bgfx.UniformType.Vec4)
 
     def _init_compute_kernels(self):
         bgfx.setUniform(
@@ -163,14 +289,27 @@ class SmoothParticlesArea:
 
     def _load_compute_kernels(self):
         self._add_particles_kernel = bgfx.createProgram(
-            load_shader(
-                "shader.AddParticle.comp", ShaderType.COMPUTE, root_path=root_path
+            load_cached_shader(
+                "shader.AddParticle.comp",
+                ShaderType.COMPUTE,
+                root_path=self._shader_path,
             ),
             True,
         )
         self._advect_particles_kernel = bgfx.createProgram(
-            load_shader(
-                "shader.AdvectParticle.comp", ShaderType.COMPUTE, root_path=root_path
+            load_cached_shader(
+                "shader.AdvectParticle.comp",
+                ShaderType.COMPUTE,
+                root_path=self._shader_path,
+            ),
+            True,
+        )
+
+        self._readback_particles_kernel = bgfx.createProgram(
+            load_cached_shader(
+                "shader.ReadbackParticles.comp",
+                ShaderType.COMPUTE,
+                root_path=self._shader_path,
             ),
             True,
         )
@@ -201,11 +340,17 @@ class SmoothParticlesArea:
         bgfx.destroy(self.elapsed_time_uniform)
         bgfx.destroy(self.speed_uniform)
         bgfx.destroy(self.velocity_size_uniform)
+        bgfx.destroy(self.offset_uniform)
 
         # Destroy buffers
         bgfx.destroy(self._particles_buffer[0])
         bgfx.destroy(self._particles_buffer[1])
 
+        if self._readback_ring is not None:
+            self._readback_ring.destroy()
+        self._upload = None
+
         # Destroy compute shaders
         bgfx.destroy(self._add_particles_kernel)
         bgfx.destroy(self._advect_particles_kernel)
+        bgfx.destroy(self._readback_particles_kernel)
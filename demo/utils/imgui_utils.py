@@ -99,12 +99,15 @@ def resource_bar(name, tooltip, num, _max, max_width, height):
 def show_properties_dialog(fb_width, fb_height, hidpi: bool):
     res_multiplier = 2 if hidpi else 1
 
-    ImGui.SetNextWindowPos(ImGui.ImVec2(
-        20.0 * res_multiplier, fb_height - fb_height / 1.7 - 20.0 * res_multiplier
-    ), ImGui.ImGuiCond_FirstUseEver)
-    ImGui.SetNextWindowSize(ImGui.ImVec2(
-        fb_width / 4.3, fb_height / 1.7
-    ), ImGui.ImGuiCond_FirstUseEver)
+    ImGui.SetNextWindowPos(
+        ImGui.ImVec2(
+            20.0 * res_multiplier, fb_height - fb_height / 1.7 - 20.0 * res_multiplier
+        ),
+        ImGui.ImGuiCond_FirstUseEver,
+    )
+    ImGui.SetNextWindowSize(
+        ImGui.ImVec2(fb_width / 4.3, fb_height / 1.7), ImGui.ImGuiCond_FirstUseEver
+    )
 
     ImGui.Begin("\uf080 Statistics")
     renderer_name = bgfx.getRendererName(bgfx.getRendererType())
@@ -0,0 +1,164 @@
+import argparse
+import logging
+import time
+from pathlib import Path
+from typing import Callable, Dict, NamedTuple, Optional, Sequence, Tuple
+
+from pybgfx import bgfx
+
+from natrix.core.common.constants import Precision, PressureSolver
+from natrix.core.headless_runner import HeadlessRunner
+from natrix.core.utils.tuning_utils import save_group_size, tuning_path
+
+logger = logging.getLogger(__name__)
+
+# Powers of two up to the 1024 threads every renderer supports
+GROUP_SIZES = (
+    (8, 8),
+    (16, 8),
+    (8, 16),
+    (16, 16),
+    (32, 8),
+    (8, 32),
+    (32, 16),
+    (16, 32),
+    (32, 32),
+    (64, 4),
+)
+
+
+class GroupSizeResult(NamedTuple):
+    group_size: Tuple[int, int]
+    # Milliseconds per frame, GPU time when the renderer has timer queries
+    frame_time: float
+    # Milliseconds per frame of each pipeline stage, empty without timer queries
+    stages: Dict[str, float]
+
+
+# create_simulator builds a FluidSimulator for the given group_size, each one is
+# stepped for warmup + frames frames. The simulator kernels share a single
+# workgroup size, so the fastest whole frame wins. Sizes the device can not
+# compile or run are logged and skipped. Needs bgfx to be initialized
+def autotune(
+    create_simulator: Callable[[tuple], object],
+    frames: int = 30,
+    warmup: int = 5,
+    time_delta: float = 1.0 / 60.0,
+    group_sizes: Sequence[tuple] = GROUP_SIZES,
+    path: Optional[Path] = tuning_path,
+):
+    if frames <= 0:
+        raise ValueError("'Frames' should be greater than zero")
+
+    results = []
+    for group_size in group_sizes:
+        simulator = None
+        try:
+            simulator = create_simulator(group_size)
+            results.append(_time_simulator(simulator, frames, warmup, time_delta))
+        except Exception:
+            x, y = group_size
+            logger.warning(f"Skipping workgroup size {x}x{y}", exc_info=True)
+        finally:
+            if simulator is not None:
+                simulator.disable_profiling()
+                simulator.destroy()
+
+    if not results:
+        raise RuntimeError("No workgroup size could be timed")
+
+    best = min(results, key=lambda result: result.frame_time)
+
+    if path is not None:
+        save_group_size(best.group_size, [result._asdict() for result in results], path)
+
+    return best, results
+
+
+def _time_simulator(simulator, frames: int, warmup: int, time_delta: float):
+    profiles = []
+    simulator.enable_profiling(on_frame=profiles.append)
+
+    start = 0.0
+    for frame in range(warmup + frames):
+        if frame == warmup:
+            start = time.perf_counter()
+
+        # A splat every frame, so that every stage has some work to do
+        simulator.add_velocity((0.5, 0.5), (0.1, 0.0), simulator.width / 16.0)
+        simulator.update(time_delta)
+        bgfx.frame()
+        simulator.profiler.collect()
+
+    elapsed = (time.perf_counter() - start) * 1000.0 / frames
+    profiles = profiles[warmup:]
+
+    # No GPU timer (e.g. Noop renderer), fall back to the wall clock time
+    if any(profile.gpu_time is None for profile in profiles):
+        return GroupSizeResult(tuple(simulator.group_size), elapsed, {})
+
+    stages = {}
+    for profile in profiles:
+        for stage, stage_profile in profile.stages.items():
+            if stage_profile.gpu_time is None:
+                continue
+
+            name = stage.name.lower()
+            stages[name] = stages.get(name, 0.0) + stage_profile.gpu_time / frames
+
+    return GroupSizeResult(
+        tuple(simulator.group_size),
+        sum(profile.gpu_time for profile in profiles) / frames,
+        stages,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Find the fastest workgroup size of this device"
+    )
+    parser.add_argument("--width", type=int, default=1024)
+    parser.add_argument("--height", type=int, default=1024)
+    parser.add_argument("--frames", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument(
+        "--solver",
+        choices=[solver.name.lower() for solver in PressureSolver],
+        default="jacobi",
+    )
+    parser.add_argument(
+        "--precision",
+        choices=[precision.name.lower() for precision in Precision],
+        default="fp32",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="do not save the fastest size"
+    )
+    args = parser.parse_args()
+
+    def create_simulator(group_size: tuple):
+        simulator = runner.create_simulator(
+            args.width,
+            args.height,
+            pressure_solver=PressureSolver[args.solver.upper()],
+            precision=Precision[args.precision.upper()],
+            group_size=group_size,
+        )
+        simulator.iterations = args.iterations
+        return simulator
+
+    with HeadlessRunner(args.width, args.height) as runner:
+        best, results = autotune(
+            create_simulator,
+            args.frames,
+            args.warmup,
+            path=None if args.dry_run else tuning_path,
+        )
+
+    for result in results:
+        x, y = result.group_size
+        print(f"{x:>3}x{y:<3} {result.frame_time:.3f} ms")
+
+    x, y = best.group_size
+    print(f"fastest: {x}x{y}" + ("" if args.dry_run else f", saved to {tuning_path}"))
@@ -15,3 +15,68 @@ class TemplateConstants(IntEnum):
     GENERIC = 8
     PARTICLES_IN = 9
     PARTICLES_OUT = 10
+    RESIDUAL = 11
+
+
+# Bind slots past RESIDUAL, each only bound by the kernels of one feature, so
+# the values are shared. Plain ints, an IntEnum would make the repeats aliases
+class ScratchSlots:
+    # Multigrid
+    COARSE_PRESSURE = 12
+    COARSE_DIVERGENCE = 13
+    COARSE_OBSTACLES = 14
+    # Convergence check
+    RESIDUAL_PARTIALS = 12
+    INDIRECT_ARGS = 13
+    CONVERGENCE_STATE = 14
+    CONVERGENCE_STATS = 15
+    # Batched splats
+    SPLATS = 12
+    # Obstacle scene
+    OBSTACLE_PRIMITIVES = 12
+    OBSTACLE_TILES = 13
+    OBSTACLE_TILE_PRIMITIVES = 14
+    # Readback, the field itself is bound at GENERIC
+    READBACK = 15
+    MAX_VELOCITY_PARTIALS = 12
+
+
+# Bits of the obstacles buffer
+class ObstacleLayer(IntEnum):
+    DYNAMIC = 1
+    STATIC = 2
+
+
+class PressureSolver(IntEnum):
+    JACOBI = 0
+    MULTIGRID = 1
+    SOR = 2
+
+
+# Storage of the velocity buffers, FP16 packs both components in 32 bits
+class Precision(IntEnum):
+    FP32 = 0
+    FP16 = 1
+
+
+# Fields FluidSimulator.read_field can copy to the host
+class Field(IntEnum):
+    VELOCITY = 0
+    PRESSURE = 1
+    DIVERGENCE = 2
+    VORTICITY = 3
+    OBSTACLES = 4
+
+
+class PipelineStage(IntEnum):
+    INPUT = 0
+    BOUNDARIES = 1
+    ADVECT = 2
+    VORTICITY = 3
+    VISCOSITY = 4
+    DIVERGENCE = 5
+    POISSON = 6
+    GRADIENT = 7
+    OBSTACLES = 8
+    # read_field and measure_max_velocity, after the stages of the update
+    READBACK = 9
@@ -1,13 +1,52 @@
-from ctypes import c_float
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from ctypes import c_float, sizeof
 from math import ceil
 from pathlib import Path
+from time import perf_counter
+from typing import Callable, Optional
 
+import numpy as np
 from pybgfx import bgfx
+from pybgfx.constants import (
+    BGFX_DEBUG_NONE,
+    BGFX_DEBUG_PROFILER,
+    BGFX_TEXTURE_BLIT_DST,
+    BGFX_TEXTURE_COMPUTE_WRITE,
+    BGFX_TEXTURE_READ_BACK,
+)
 from pybgfx.utils import as_void_ptr
-from pybgfx.utils.shaders_utils import ShaderType, load_shader
 
-from natrix.core.common.constants import TemplateConstants
-from natrix.core.utils.shaders_utils import create_buffer
+from natrix.core.common.constants import (
+    Field,
+    ObstacleLayer,
+    PipelineStage,
+    Precision,
+    PressureSolver,
+    ScratchSlots,
+    TemplateConstants,
+)
+from natrix.core.multigrid import MultigridLevel
+from natrix.core.profiler import FrameProfile, Profiler, StartupReport
+from natrix.core.readback import ReadbackRing
+from natrix.core.utils.obstacle_utils import (
+    bin_primitives,
+    bounding_box_groups,
+    circle_bounds,
+    mesh_triangles,
+    pack_primitives,
+    triangle_bounds,
+    union_bounds,
+)
+from natrix.core.utils.shaders_utils import (
+    DynamicBuffer,
+    LazyKernel,
+    create_buffer,
+    shader_variant_path,
+    update_buffer_reference,
+)
+from natrix.core.utils.state_utils import read_state, write_state_when_done
+from natrix.core.utils.tuning_utils import load_group_size
 
 root_path = Path(__file__).parent / "shaders" / "originals"
 
@@ -22,31 +61,142 @@ class FluidSimulator:
     _num_cells = 0
     _num_groups_x = 0
     _num_groups_y = 0
+    _num_sor_groups_x = 0
     _width = 512
     _height = 512
 
     _speed = 500.0
     _iterations = 50
+    _omega = 1.7
     _dissipation = 1.0
     _vorticity = 0.0
     _viscosity = 0.1
+    _pressure_decay = 1.0
+
+    _pressure_solver = PressureSolver.JACOBI
+    _v_cycles = 2
+    _multigrid_levels = None
+    _multigrid_smoothing = 2
+    _multigrid_coarse_iterations = 16
+    _multigrid_coarsest_size = 16
+
+    _tolerance = 0.0
+    _residual_check_interval = 4
+
+    # Jacobi iterations per tiled dispatch, TILED_SWEEPS in constants.sh
+    _max_tiled_sweeps = 4
+    _last_iterations = None
+    _last_residual = None
+    _indirect_buffer = None
+    _convergence_pending = False
+
+    # Largest speed measured by measure_max_velocity, see max_velocity
+    _max_velocity = None
+    _max_velocity_ring = None
+
+    _profiler = None
+    _view_id = 0
+
+    # Box of the dynamic obstacles added since the last update, in cells
+    _dynamic_region = None
 
     has_borders = True
     simulate = True
+    warm_start = False
+
+    # Runs the boundaries with the advection, both vorticity passes and the
+    # divergence with the pressure reset as combined kernels, same results
+    fused = False
+
+    # Stencil kernels load their neighbourhood into groupshared memory once per
+    # workgroup, and Jacobi runs several iterations per dispatch, same results
+    tiled = False
+
+    # Saved and restored by save_state and load_state, on top of the fields
+    _state_parameters = (
+        "speed",
+        "iterations",
+        "tolerance",
+        "residual_check_interval",
+        "omega",
+        "dissipation",
+        "vorticity",
+        "viscosity",
+        "pressure_decay",
+        "pressure_solver",
+        "v_cycles",
+        "has_borders",
+        "simulate",
+        "warm_start",
+        "fused",
+        "tiled",
+    )
+
+    # Staging textures per field of read_field, and the view they are read back
+    # in, after the ones of the simulation
+    readback_slots = 3
+    readback_view = 255
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        vertex_layout: bgfx.VertexLayout,
+        pressure_solver: PressureSolver = PressureSolver.JACOBI,
+        precision: Precision = Precision.FP32,
+        group_size: Optional[tuple] = None,
+        preload: bool = False,
+    ):
+        self._startup = perf_counter()
+        self._first_step_time = None
 
-    def __init__(self, width: int, height: int, vertex_layout: bgfx.VertexLayout):
         self._width = width
         self._height = height
+        self.pressure_solver = pressure_solver
+
+        # Fixed for the lifetime of the simulator, buffers and kernels depend on it
+        self._precision = Precision(precision)
+        self._velocity_dimensions = 1 if self._precision == Precision.FP16 else 2
+
+        # The (x, y) workgroup size, compiled into the kernels. By default the
+        # one saved by the autotuner for this device, or NATRIX__NUM_THREADS
+        if group_size is None:
+            group_size = load_group_size() or (TemplateConstants.NUM_THREADS.value,) * 2
+        self._group_size = tuple(group_size)
+
+        x, y = self._group_size
+        if x <= 0 or y <= 0 or x & (x - 1) or y & (y - 1) or x * y > 1024:
+            raise ValueError(
+                "'Group size' should be powers of two with at most 1024 threads"
+            )
+
+        self._shader_path = shader_variant_path(root_path, self.shader_defines)
 
         self.vertex_layout = vertex_layout
 
         self._create_uniforms()
 
+        # Kernels are created on their first dispatch. With preload their blobs
+        # are compiled, or read from the cache, in parallel in the meantime
+        self._kernels = []
+        self._kernel_executor = ThreadPoolExecutor() if preload else None
         self._load_compute_kernels()
+        if self._kernel_executor is not None:
+            self._kernel_executor.shutdown(wait=False)
+            self._kernel_executor = None
+
         self._set_size(width, height)
         self._create_buffers()
         self._init_compute_kernels()
 
+        # Created on the first read_field of each field
+        self._readback_rings = {}
+
+        # Arrays passed to bgfx by reference, kept alive until replaced
+        self._uploads = {}
+
+        self._construction_time = perf_counter() - self._startup
+
     @property
     def width(self):
         return self._width
@@ -55,6 +205,27 @@ class FluidSimulator:
     def height(self):
         return self._height
 
+    @property
+    def precision(self):
+        return self._precision
+
+    @property
+    def group_size(self):
+        return self._group_size
+
+    # Defines of the kernels, for shaders reading the simulator buffers
+    @property
+    def shader_defines(self):
+        defines = {}
+        if self._precision == Precision.FP16:
+            defines["NATRIX_FP16"] = 1
+
+        # 16x16 is the default of constants.sh
+        if self._group_size != (16, 16):
+            defines["GROUP_SIZE_X"], defines["GROUP_SIZE_Y"] = self._group_size
+
+        return defines
+
     @property
     def speed(self):
         return self._speed
@@ -77,6 +248,52 @@ class FluidSimulator:
         else:
             raise ValueError("'Iterations' should be grater than zero")
 
+    @property
+    def tolerance(self):
+        return self._tolerance
+
+    @tolerance.setter
+    def tolerance(self, value):
+        if value >= 0.0:
+            self._tolerance = value
+        else:
+            raise ValueError("'Tolerance' should be greater or equal than zero")
+
+    @property
+    def residual_check_interval(self):
+        return self._residual_check_interval
+
+    @residual_check_interval.setter
+    def residual_check_interval(self, value):
+        if value > 0:
+            self._residual_check_interval = value
+        else:
+            raise ValueError("'Residual check interval' should be greater than zero")
+
+    # Iterations (V-cycles with multigrid) of a recent solve. With a tolerance
+    # they are read back from the GPU, so they lag the solve by a couple of
+    # frames, None until the first readback arrives
+    @property
+    def last_iterations(self):
+        return self._last_iterations
+
+    # Largest residual of a recent solve with a tolerance, None without one.
+    # Read back like last_iterations, from the same solve
+    @property
+    def last_residual(self):
+        return self._last_residual
+
+    @property
+    def omega(self):
+        return self._omega
+
+    @omega.setter
+    def omega(self, value):
+        if 0.0 < value < 2.0:
+            self._omega = value
+        else:
+            raise ValueError("'Omega' should be between zero and two")
+
     @property
     def dissipation(self):
         return self._dissipation
@@ -110,11 +327,238 @@ class FluidSimulator:
         else:
             raise ValueError("'Viscosity' should be greater or equal than zero")
 
+    @property
+    def pressure_decay(self):
+        return self._pressure_decay
+
+    @pressure_decay.setter
+    def pressure_decay(self, value):
+        if 0.0 <= value <= 1.0:
+            self._pressure_decay = value
+        else:
+            raise ValueError("'Pressure decay' should be between zero and one")
+
+    @property
+    def pressure_solver(self):
+        return self._pressure_solver
+
+    @pressure_solver.setter
+    def pressure_solver(self, value):
+        self._pressure_solver = PressureSolver(value)
+
+    @property
+    def v_cycles(self):
+        return self._v_cycles
+
+    @v_cycles.setter
+    def v_cycles(self, value):
+        if value > 0:
+            self._v_cycles = value
+        else:
+            raise ValueError("'V-cycles' should be greater than zero")
+
+    @property
+    def buffer_memory(self):
+        # Velocity, divergence, vorticity, obstacles and pressure
+        floats = self._num_cells * (2 * self._velocity_dimensions + 1 + 1 + 1)
+        floats += self._num_cells * sum(p is not None for p in self._pressure_buffer)
+
+        if self._multigrid_levels is not None:
+            floats += self._num_cells
+        if self._indirect_buffer is not None:
+            floats += self._num_groups_x * self._num_groups_y + 4
+
+        memory = sizeof(c_float) * floats
+        memory += self._splats_buffer.memory
+        memory += self._obstacle_primitives_buffer.memory
+        memory += self._obstacle_tiles_buffer.memory
+        memory += self._obstacle_tile_primitives_buffer.memory
+        memory += self._obstacle_mask_buffer.memory
+        if self._multigrid_levels is not None:
+            memory += sum(level.memory for level in self._multigrid_levels)
+
+        return memory
+
     def get_velocity_buffer(self):
         return self._velocity_buffer[self.VELOCITY_READ]
 
+    # Copies a field to the host without stalling. Returns a Future of a
+    # (height, width) array, (height, width, 2) for the velocity, completed by
+    # poll_readback a couple of frames later. None while all the staging slots
+    # of the field are still in flight
+    def read_field(self, field: Field):
+        field = Field(field)
+
+        ring = self._readback_rings.get(field)
+        if ring is None:
+            ring = self._readback_rings[field] = self._create_readback_ring(field)
+
+        slot = ring.acquire()
+        if slot is None:
+            return None
+
+        if field == Field.VELOCITY:
+            buffer = self._velocity_buffer[self.VELOCITY_READ]
+            kernel = self._readback_velocity_kernel
+        elif field == Field.OBSTACLES:
+            buffer = self._obstacles_buffer
+            kernel = self._readback_obstacles_kernel
+        else:
+            buffer = {
+                Field.PRESSURE: self._pressure_buffer[self.PRESSURE_READ],
+                Field.DIVERGENCE: self._divergence_buffer,
+                Field.VORTICITY: self._vorticity_buffer,
+            }[field]
+            kernel = self._readback_scalar_kernel
+
+        bgfx.setBuffer(TemplateConstants.GENERIC.value, buffer, bgfx.Access.Read)
+        bgfx.setImage(ScratchSlots.READBACK, slot.texture, 0, bgfx.Access.Write)
+        with self._stage(PipelineStage.READBACK):
+            self._dispatch(kernel, self._num_groups_x, self._num_groups_y, 1)
+
+        return ring.submit(slot)
+
+    # Call after bgfx.frame(), with the frame number it returned
+    def poll_readback(self, frame: int):
+        for ring in self._readback_rings.values():
+            ring.poll(frame)
+        if self._max_velocity_ring is not None:
+            self._max_velocity_ring.poll(frame)
+
+    # Largest speed of the velocity field, as of the last measure_max_velocity
+    # that has been read back, a couple of frames old. None before the first one
+    @property
+    def max_velocity(self):
+        return self._max_velocity
+
+    # Reduces the velocity to its largest speed on the GPU and reads it back like
+    # read_field, only 4 bytes instead of the whole field. Returns a Future of
+    # the speed, None while the previous measures are still in flight
+    def measure_max_velocity(self):
+        if self._max_velocity_ring is None:
+            self._max_velocity_partials_buffer = create_buffer(
+                self._num_groups_x * self._num_groups_y, 1, self.vertex_layout
+            )
+            self._max_velocity_ring = ReadbackRing(
+                1,
+                1,
+                bgfx.TextureFormat.R32F,
+                slots=self.readback_slots,
+                view=self.readback_view,
+            )
+
+        slot = self._max_velocity_ring.acquire()
+        if slot is None:
+            return None
+
+        with self._stage(PipelineStage.READBACK):
+            # Per-workgroup maxima
+            bgfx.setBuffer(
+                ScratchSlots.MAX_VELOCITY_PARTIALS,
+                self._max_velocity_partials_buffer,
+                bgfx.Access.Write,
+            )
+            self._dispatch(
+                self._max_velocity_reduce_kernel,
+                self._num_groups_x,
+                self._num_groups_y,
+                1,
+            )
+
+            # Final reduction
+            bgfx.setUniform(
+                self.dispatch_size_uniform,
+                as_void_ptr(
+                    (c_float * 4)(
+                        self._num_groups_x,
+                        self._num_groups_y,
+                        self._num_sor_groups_x,
+                        self._num_groups_x * self._num_groups_y,
+                    )
+                ),
+            )
+            bgfx.setBuffer(
+                ScratchSlots.MAX_VELOCITY_PARTIALS,
+                self._max_velocity_partials_buffer,
+                bgfx.Access.Read,
+            )
+            bgfx.setImage(ScratchSlots.READBACK, slot.texture, 0, bgfx.Access.Write)
+            self._dispatch(self._max_velocity_kernel, 1, 1, 1)
+
+        speed = Future()
+
+        def on_readback(future: Future):
+            if future.cancelled():
+                speed.cancel()
+                return
+
+            self._max_velocity = float(future.result()[0, 0])
+            speed.set_result(self._max_velocity)
+
+        self._max_velocity_ring.submit(slot).add_done_callback(on_readback)
+
+        return speed
+
+    # Checkpoints the velocity, pressure, obstacles, parameters and ping-pong
+    # indices of the latest update, see utils/state_utils.py. The fields are read
+    # back like read_field, so the file is written by poll_readback a couple of
+    # frames later. Returns a Future of the path
+    def save_state(self, path: Path):
+        # Checked before queuing any copy, a state missing a field is never written
+        # and its other readbacks would only hold slots
+        fields = (Field.VELOCITY, Field.PRESSURE, Field.OBSTACLES)
+        if not all(self._readback_available(field) for field in fields):
+            raise RuntimeError("Too many readbacks in flight to save the state")
+
+        fields = {field.name.lower(): self.read_field(field) for field in fields}
+
+        parameters = {name: getattr(self, name) for name in self._state_parameters}
+        parameters["pressure_solver"] = int(self.pressure_solver)
+
+        metadata = {
+            "width": self._width,
+            "height": self._height,
+            "precision": int(self._precision),
+            "velocity_read": self.VELOCITY_READ,
+            "pressure_read": self.PRESSURE_READ,
+            "parameters": parameters,
+        }
+
+        return write_state_when_done(path, metadata, fields)
+
+    # The fields are memory-mapped and uploaded by reference, see set_velocity.
+    # Velocities are stored as float32, so states move between precisions
+    def load_state(self, path: Path):
+        metadata, fields = read_state(path)
+        if (metadata["width"], metadata["height"]) != (self._width, self._height):
+            raise ValueError(
+                f"'State' is {metadata['width']}x{metadata['height']}, "
+                f"the simulator {self._width}x{self._height}"
+            )
+
+        for name, value in metadata["parameters"].items():
+            if name in self._state_parameters:
+                setattr(self, name, value)
+
+        self.VELOCITY_READ = metadata["velocity_read"]
+        self.VELOCITY_WRITE = 1 - self.VELOCITY_READ
+        self.PRESSURE_READ = metadata["pressure_read"]
+        self.PRESSURE_WRITE = 1 - self.PRESSURE_READ
+
+        # SOR simulators only have one pressure buffer
+        if self._pressure_buffer[self.PRESSURE_READ] is None:
+            self._pressure_buffer.reverse()
+
+        self._init_compute_kernels()
+
+        self.set_velocity(fields["velocity"])
+        self.set_pressure(fields["pressure"])
+        self.set_obstacles(fields["obstacles"])
+
     def add_velocity(self, position: tuple, velocity: tuple, radius: float):
-        if self.simulate:
+        region = self._circle_region(position, radius)
+
+        if self.simulate and region is not None:
             self._init_compute_kernels()
             bgfx.setUniform(
                 self.position_uniform,
@@ -124,16 +568,46 @@ class FluidSimulator:
                 self.value_uniform, as_void_ptr((c_float * 2)(velocity[0], velocity[1]))
             )
             bgfx.setUniform(self.radius_uniform, as_void_ptr((c_float * 1)(radius)))
+            bgfx.setBuffer(
+                TemplateConstants.GENERIC.value,
+                self._velocity_buffer[self.VELOCITY_READ],
+                bgfx.Access.ReadWrite,
+            )
+
+            with self._stage(PipelineStage.INPUT):
+                self._dispatch_region(self._add_velocity_kernel, region)
 
-            bgfx.dispatch(
-                0, self._add_velocity_kernel, self._num_groups_x, self._num_groups_y, 1
+    # splats is a sequence of (position, velocity, radius) records, with the same
+    # spaces as add_velocity, all applied in a single dispatch
+    def add_velocities(self, splats):
+        region = self._splats_region(splats)
+
+        if self.simulate and region is not None:
+            self._init_compute_kernels()
+            self._upload_splats(splats)
+            bgfx.setUniform(
+                self.splat_count_uniform, as_void_ptr((c_float * 1)(len(splats)))
+            )
+            bgfx.setBuffer(
+                ScratchSlots.SPLATS,
+                self._splats_buffer.handle,
+                bgfx.Access.Read,
+            )
+            bgfx.setBuffer(
+                TemplateConstants.GENERIC.value,
+                self._velocity_buffer[self.VELOCITY_READ],
+                bgfx.Access.ReadWrite,
             )
-            self._flip_velocity_buffer()
+
+            with self._stage(PipelineStage.INPUT):
+                self._dispatch_region(self._add_velocities_kernel, region)
 
     # position in normalised local space
     # radius in world space
     def add_circle_obstacle(self, position: tuple, radius: float, static=False):
-        if self.simulate:
+        region = self._circle_region(position, radius)
+
+        if self.simulate and region is not None:
             self._init_compute_kernels()
             bgfx.setUniform(
                 self.position_uniform,
@@ -144,17 +618,31 @@ class FluidSimulator:
                 self.static_uniform, as_void_ptr((c_float * 1)(1.0 if static else 0.0))
             )
 
-            bgfx.dispatch(
-                0,
-                self._add_circle_obstacle_kernel,
-                self._num_groups_x,
-                self._num_groups_y,
-                1,
-            )
+            with self._stage(PipelineStage.INPUT):
+                self._dispatch_region(self._add_circle_obstacle_kernel, region)
+
+            if not static:
+                x = position[0] * self._width
+                y = position[1] * self._height
+                self._extend_dynamic_region(
+                    x - radius, y - radius, x + radius, y + radius
+                )
 
     # points in normalised local space
     def add_triangle_obstacle(self, p1: tuple, p2: tuple, p3: tuple, static=False):
-        if self.simulate:
+        xs = [p[0] * self._width for p in (p1, p2, p3)]
+        ys = [p[1] * self._height for p in (p1, p2, p3)]
+        region = bounding_box_groups(
+            min(xs),
+            min(ys),
+            max(xs),
+            max(ys),
+            self._width,
+            self._height,
+            self._group_size,
+        )
+
+        if self.simulate and region is not None:
             self._init_compute_kernels()
             bgfx.setUniform(self.p1_uniform, as_void_ptr((c_float * 2)(p1[0], p1[1])))
             bgfx.setUniform(self.p2_uniform, as_void_ptr((c_float * 2)(p2[0], p2[1])))
@@ -163,125 +651,846 @@ class FluidSimulator:
                 self.static_uniform, as_void_ptr((c_float * 1)(1.0 if static else 0.0))
             )
 
-            bgfx.dispatch(
-                0,
-                self._add_triangle_obstacle_kernel,
+            with self._stage(PipelineStage.INPUT):
+                self._dispatch_region(self._add_triangle_obstacle_kernel, region)
+
+            if not static:
+                self._extend_dynamic_region(min(xs), min(ys), max(xs), max(ys))
+
+    # circles is a sequence of (position, radius) and triangles of (p1, p2, p3)
+    # records, with the same spaces as add_circle_obstacle and
+    # add_triangle_obstacle, all rasterized in a single dispatch
+    def add_obstacles(self, circles=(), triangles=(), static=False):
+        bounds = [
+            circle_bounds(position, radius, self._width, self._height)
+            for position, radius in circles
+        ] + [
+            triangle_bounds(p1, p2, p3, self._width, self._height)
+            for p1, p2, p3 in triangles
+        ]
+        if not bounds:
+            return
+
+        region = bounding_box_groups(
+            *union_bounds(bounds), self._width, self._height, self._group_size
+        )
+
+        if self.simulate and region is not None:
+            self._init_compute_kernels()
+            self._upload_obstacles(circles, triangles, bounds, region)
+            bgfx.setUniform(
+                self.tiles_uniform, as_void_ptr((c_float * 2)(region[2], region[3]))
+            )
+            bgfx.setUniform(
+                self.static_uniform, as_void_ptr((c_float * 1)(1.0 if static else 0.0))
+            )
+
+            with self._stage(PipelineStage.INPUT):
+                self._dispatch_region(self._add_obstacles_kernel, region)
+
+            if not static:
+                self._extend_dynamic_region(*union_bounds(bounds))
+
+    # vertices in normalised local space, indices a flat sequence of triangles
+    def add_obstacle_mesh(self, vertices, indices, static=False):
+        self.add_obstacles(triangles=mesh_triangles(vertices, indices), static=static)
+
+    # Mask helper, the cells where the signed distance field (see
+    # utils/sdf_utils.py) is below offset, in cells, become the obstacles of one
+    # layer. Boundaries stay on whole cells, the kernels never sample the
+    # distances. The other layer is kept as it is
+    def set_obstacle_sdf(self, sdf, offset: float = 0.0, static=True):
+        sdf = np.asarray(sdf, dtype=np.float32).reshape(-1)
+        if sdf.shape[0] != self._num_cells:
+            raise ValueError("'SDF' should have one value per cell")
+
+        layer, keep = ObstacleLayer.STATIC, ObstacleLayer.DYNAMIC
+        if not static:
+            layer, keep = keep, layer
+        mask = np.where(sdf <= offset, np.uint32(layer), np.uint32(0))
+        self._obstacle_mask_buffer.upload(np.ctypeslib.as_ctypes(mask), len(mask))
+
+        self._init_compute_kernels()
+        bgfx.setBuffer(
+            TemplateConstants.GENERIC.value,
+            self._obstacle_mask_buffer.handle,
+            bgfx.Access.Read,
+        )
+        bgfx.setUniform(self.keep_uniform, as_void_ptr((c_float * 1)(keep)))
+
+        with self._stage(PipelineStage.INPUT):
+            self._dispatch(
+                self._set_obstacle_layer_kernel,
                 self._num_groups_x,
                 self._num_groups_y,
                 1,
             )
 
+        if not static:
+            self._extend_dynamic_region(0, 0, self._width, self._height)
+
+    # velocity is a (height, width, 2) float32 array, or a memory-mapped file,
+    # uploaded by reference. Arrays of other types or layouts, and FP16
+    # simulators, need a converted copy
+    def set_velocity(self, velocity):
+        velocity = np.ascontiguousarray(velocity, dtype=np.float32).reshape(-1)
+        if velocity.shape[0] != 2 * self._num_cells:
+            raise ValueError("'Velocity' should have two values per cell")
+
+        if self._precision == Precision.FP16:
+            velocity = velocity.astype(np.float16).view(np.uint32)
+
+        self._upload_field(Field.VELOCITY, velocity)
+
+    # Only kept by the next update with warm_start, otherwise the solve clears it
+    def set_pressure(self, pressure):
+        pressure = np.ascontiguousarray(pressure, dtype=np.float32).reshape(-1)
+        if pressure.shape[0] != self._num_cells:
+            raise ValueError("'Pressure' should have one value per cell")
+
+        self._upload_field(Field.PRESSURE, pressure)
+
+    # Replaces all the obstacles. A boolean mask becomes static obstacles, integer
+    # arrays hold the ObstacleLayer bits of each cell, as read_field returns them
+    def set_obstacles(self, mask):
+        mask = np.asarray(mask)
+        if mask.dtype == np.bool_:
+            mask = np.where(mask, np.uint32(ObstacleLayer.STATIC), np.uint32(0))
+        else:
+            # Dynamic bits are cleared by the next update, as usual
+            self._extend_dynamic_region(0, 0, self._width, self._height)
+
+        mask = np.ascontiguousarray(mask, dtype=np.uint32).reshape(-1)
+        if mask.shape[0] != self._num_cells:
+            raise ValueError("'Obstacles' should have one value per cell")
+
+        self._upload_field(Field.OBSTACLES, mask)
+
+    # Static obstacles persist across frames until cleared
+    def clear_static_obstacles(self):
+        self._init_compute_kernels()
+        bgfx.setUniform(
+            self.keep_uniform, as_void_ptr((c_float * 1)(ObstacleLayer.DYNAMIC))
+        )
+
+        with self._stage(PipelineStage.INPUT):
+            self._dispatch_region(
+                self._clear_obstacles_kernel,
+                (0, 0, self._num_groups_x, self._num_groups_y),
+            )
+
     def update(self, time_delta: float):
         if self.simulate:
+            self._begin_update(time_delta)
 
-            self._init_compute_kernels()
-            self._update_params(time_delta)
-
-            # Init boundaries
-            if self.has_borders:
-                bgfx.dispatch(
-                    0,
-                    self._init_boundaries_kernel,
-                    self._num_groups_x,
-                    self._num_groups_y,
-                    1,
-                )
+            # Init boundaries, done by the advection when fused
+            if self.has_borders and not self.fused:
+                with self._stage(PipelineStage.BOUNDARIES):
+                    self._init_boundaries()
 
             # Advect
-            bgfx.dispatch(
-                0,
-                self._advect_velocity_kernel,
+            with self._stage(PipelineStage.ADVECT):
+                self._advect_velocity()
+
+            # Vorticity confinement
+            with self._stage(PipelineStage.VORTICITY):
+                self._apply_vorticity_confinement()
+
+            # Viscosity
+            if self.viscosity > 0.0:
+                with self._stage(PipelineStage.VISCOSITY):
+                    self._apply_viscosity()
+
+            # Divergence
+            with self._stage(PipelineStage.DIVERGENCE):
+                self._calc_divergence()
+
+            # Poisson
+            with self._stage(PipelineStage.POISSON):
+                self._solve_pressure()
+
+            # Subtract gradient
+            with self._stage(PipelineStage.GRADIENT):
+                self._subtract_gradient()
+
+            # Clear obstacles
+            with self._stage(PipelineStage.OBSTACLES):
+                self._clear_obstacles()
+
+            if self._first_step_time is None:
+                self._first_step_time = perf_counter() - self._startup
+
+    # Milliseconds from the construction to the first update, and spent loading
+    # each kernel dispatched so far
+    @property
+    def startup_report(self):
+        return StartupReport(
+            self._construction_time * 1000.0,
+            None if self._first_step_time is None else self._first_step_time * 1000.0,
+            {
+                kernel.name: kernel.load_time * 1000.0
+                for kernel in self._kernels
+                if kernel.loaded
+            },
+        )
+
+    @property
+    def profiler(self):
+        return self._profiler
+
+    # Every stage gets its own view, so that bgfx reports its GPU time. The views
+    # run after view 0, anything else dispatched there sees the previous frame
+    def enable_profiling(
+        self,
+        first_view: int = 1,
+        on_frame: Optional[Callable[[FrameProfile], None]] = None,
+        debug: int = BGFX_DEBUG_NONE,
+    ):
+        self._profiler = Profiler(first_view, on_frame)
+        bgfx.setDebug(debug | BGFX_DEBUG_PROFILER)
+
+    def disable_profiling(self, debug: int = BGFX_DEBUG_NONE):
+        self._profiler = None
+        bgfx.setDebug(debug)
+
+    @contextmanager
+    def _stage(self, stage: PipelineStage):
+        if self._profiler is None:
+            yield
+            return
+
+        self._view_id = self._profiler.begin(stage)
+        try:
+            yield
+        finally:
+            self._profiler.end()
+            self._view_id = 0
+
+    # Only the workgroups overlapping a shape, see bounding_box_groups
+    def _dispatch_region(self, kernel, region: tuple):
+        offset_x, offset_y, num_groups_x, num_groups_y = region
+
+        bgfx.setUniform(
+            self.offset_uniform, as_void_ptr((c_float * 2)(offset_x, offset_y))
+        )
+        self._dispatch(kernel, num_groups_x, num_groups_y, 1)
+
+    def _circle_region(self, position: tuple, radius: float):
+        x = position[0] * self._width
+        y = position[1] * self._height
+
+        return bounding_box_groups(
+            x - radius,
+            y - radius,
+            x + radius,
+            y + radius,
+            self._width,
+            self._height,
+            self._group_size,
+        )
+
+    def _splats_region(self, splats):
+        if len(splats) == 0:
+            return None
+
+        xs = [(position[0] * self._width, radius) for position, _, radius in splats]
+        ys = [(position[1] * self._height, radius) for position, _, radius in splats]
+
+        return bounding_box_groups(
+            min(x - radius for x, radius in xs),
+            min(y - radius for y, radius in ys),
+            max(x + radius for x, radius in xs),
+            max(y + radius for y, radius in ys),
+            self._width,
+            self._height,
+            self._group_size,
+        )
+
+    def _dispatch(self, kernel, *args):
+        if self._profiler is not None:
+            self._profiler.count_dispatch()
+
+        bgfx.dispatch(self._view_id, kernel.handle, *args)
+
+    def _begin_update(self, time_delta: float):
+        self._init_compute_kernels()
+        self._update_params(time_delta)
+
+    def _init_boundaries(self):
+        self._dispatch(
+            self._init_boundaries_kernel,
+            self._num_groups_x,
+            self._num_groups_y,
+            1,
+        )
+
+    def _advect_velocity(self):
+        if self.fused and self.has_borders:
+            kernel = self._fused_advect_velocity_kernel
+        else:
+            kernel = self._advect_velocity_kernel
+
+        self._dispatch(kernel, self._num_groups_x, self._num_groups_y, 1)
+        self._flip_velocity_buffer()
+
+    def _apply_vorticity_confinement(self):
+        if self.fused:
+            self._dispatch(
+                self._fused_vorticity_kernel,
                 self._num_groups_x,
                 self._num_groups_y,
                 1,
             )
             self._flip_velocity_buffer()
+            return
 
-            # Vorticity confinement 1 - Calculate vorticity
-            bgfx.dispatch(
-                0,
-                self._calc_vorticity_kernel,
+        # Vorticity confinement 1 - Calculate vorticity
+        self._dispatch(
+            (
+                self._tiled_calc_vorticity_kernel
+                if self.tiled
+                else self._calc_vorticity_kernel
+            ),
+            self._num_groups_x,
+            self._num_groups_y,
+            1,
+        )
+
+        # Vorticity confinement 2 - Apply vorticity force
+        self._dispatch(
+            self._apply_vorticity_kernel,
+            self._num_groups_x,
+            self._num_groups_y,
+            1,
+        )
+        self._flip_velocity_buffer()
+
+    def _apply_viscosity(self):
+        self._dispatch(
+            self._tiled_viscosity_kernel if self.tiled else self._viscosity_kernel,
+            self._num_groups_x,
+            self._num_groups_y,
+            1,
+        )
+        self._flip_velocity_buffer()
+
+    def _calc_divergence(self):
+        scale = self._pressure_reset_scale()
+        if not self.fused or scale is None:
+            kernel = (
+                self._tiled_divergence_kernel if self.tiled else self._divergence_kernel
+            )
+            self._dispatch(kernel, self._num_groups_x, self._num_groups_y, 1)
+            return
+
+        # The pressure reset of _solve_pressure happens here
+        bgfx.setBuffer(
+            TemplateConstants.GENERIC.value,
+            self._pressure_buffer[self.PRESSURE_READ],
+            bgfx.Access.ReadWrite,
+        )
+        bgfx.setUniform(self.scale_uniform, as_void_ptr((c_float * 1)(scale)))
+        self._dispatch(
+            self._fused_divergence_kernel, self._num_groups_x, self._num_groups_y, 1
+        )
+        bgfx.setBuffer(
+            TemplateConstants.PRESSURE_IN.value,
+            self._pressure_buffer[self.PRESSURE_READ],
+            bgfx.Access.Read,
+        )
+
+    # What the previous pressure is scaled by before the solve, 0 clears it and
+    # None keeps it as it is
+    def _pressure_reset_scale(self):
+        if not self.warm_start:
+            return 0.0
+        if self.pressure_decay < 1.0:
+            return self.pressure_decay
+        return None
+
+    def _solve_pressure(self):
+        # Clear pressure, or start from the previous solution
+        if not self.fused:
+            self._reset_pressure()
+
+        if self.pressure_solver == PressureSolver.SOR:
+            self._solve_pressure_sor()
+        elif self.pressure_solver == PressureSolver.MULTIGRID:
+            self._create_pressure_write_buffer()
+            self._solve_pressure_multigrid()
+        else:
+            self._create_pressure_write_buffer()
+            self._solve_pressure_jacobi()
+
+    def _reset_pressure(self):
+        scale = self._pressure_reset_scale()
+        if scale is None:
+            return
+
+        bgfx.setBuffer(
+            TemplateConstants.GENERIC.value,
+            self._pressure_buffer[self.PRESSURE_READ],
+            bgfx.Access.ReadWrite,
+        )
+        if scale == 0.0:
+            self._dispatch(
+                self._clear_buffer_kernel,
                 self._num_groups_x,
                 self._num_groups_y,
                 1,
             )
-
-            # Vorticity confinement 2 - Apply vorticity force
-            bgfx.dispatch(
-                0,
-                self._apply_vorticity_kernel,
+        else:
+            bgfx.setUniform(self.scale_uniform, as_void_ptr((c_float * 1)(scale)))
+            self._dispatch(
+                self._scale_buffer_kernel,
                 self._num_groups_x,
                 self._num_groups_y,
                 1,
             )
-            self._flip_velocity_buffer()
+        bgfx.setBuffer(
+            TemplateConstants.PRESSURE_IN.value,
+            self._pressure_buffer[self.PRESSURE_READ],
+            bgfx.Access.Read,
+        )
 
-            # Viscosity
-            if self.viscosity > 0.0:
-                bgfx.dispatch(
-                    0,
-                    self._viscosity_kernel,
+    def _subtract_gradient(self):
+        self._dispatch(
+            self._subtract_gradient_kernel,
+            self._num_groups_x,
+            self._num_groups_y,
+            1,
+        )
+        self._flip_velocity_buffer()
+
+    def _clear_obstacles(self):
+        # Only the cells covered by dynamic obstacles since the last update
+        if self._dynamic_region is None:
+            return
+
+        region = bounding_box_groups(
+            *self._dynamic_region, self._width, self._height, self._group_size
+        )
+        self._dynamic_region = None
+
+        bgfx.setUniform(
+            self.keep_uniform, as_void_ptr((c_float * 1)(ObstacleLayer.STATIC))
+        )
+        self._dispatch_region(self._clear_obstacles_kernel, region)
+
+    def _extend_dynamic_region(
+        self, x_min: float, y_min: float, x_max: float, y_max: float
+    ):
+        if self._dynamic_region is not None:
+            x1, y1, x2, y2 = self._dynamic_region
+            x_min = min(x_min, x1)
+            y_min = min(y_min, y1)
+            x_max = max(x_max, x2)
+            y_max = max(y_max, y2)
+
+        self._dynamic_region = (x_min, y_min, x_max, y_max)
+
+    def _solve_pressure_jacobi(self):
+        # An even interval keeps the converged result in PRESSURE_READ, as the
+        # skipped dispatches are still flipped on this side
+        check_interval = self._check_interval(even=True)
+        iterations = self._capped_iterations(check_interval)
+
+        if self.tiled:
+            self._solve_pressure_jacobi_tiled(check_interval, iterations)
+            return
+
+        for iteration in range(1, iterations + 1):
+            if check_interval:
+                self._dispatch(self._poisson_kernel, self._indirect_buffer, 0, 1)
+            else:
+                self._dispatch(
+                    self._poisson_kernel, self._num_groups_x, self._num_groups_y, 1
+                )
+            self._flip_pressure_buffer()
+
+            if check_interval and iteration % check_interval == 0:
+                self._check_residual(iteration)
+
+        self._update_convergence_stats(check_interval, iterations)
+
+    def _solve_pressure_jacobi_tiled(self, check_interval: int, iterations: int):
+        # The iterations between two checks, or all of them, split in dispatches
+        block = check_interval or iterations
+        sweeps = self._tiled_sweeps(block, even=bool(check_interval))
+
+        for iteration in range(block, iterations + 1, block):
+            for count in sweeps:
+                bgfx.setUniform(self.sweeps_uniform, as_void_ptr((c_float * 1)(count)))
+                if check_interval:
+                    self._dispatch(
+                        self._tiled_poisson_kernel, self._indirect_buffer, 0, 1
+                    )
+                else:
+                    self._dispatch(
+                        self._tiled_poisson_kernel,
+                        self._num_groups_x,
+                        self._num_groups_y,
+                        1,
+                    )
+                self._flip_pressure_buffer()
+
+            if check_interval:
+                self._check_residual(iteration)
+
+        self._update_convergence_stats(check_interval, iterations)
+
+    def _tiled_sweeps(self, iterations: int, even: bool):
+        full, rest = divmod(iterations, self._max_tiled_sweeps)
+        sweeps = [self._max_tiled_sweeps] * full + ([rest] if rest else [])
+
+        # Split a dispatch in two for an even count, see _solve_pressure_jacobi
+        if even and len(sweeps) % 2:
+            index = next(i for i, count in enumerate(sweeps) if count > 1)
+            count = sweeps[index]
+            sweeps[index : index + 1] = [count // 2, count - count // 2]
+
+        return sweeps
+
+    def _solve_pressure_sor(self):
+        check_interval = self._check_interval(even=False)
+        iterations = self._capped_iterations(check_interval)
+
+        bgfx.setUniform(self.omega_uniform, as_void_ptr((c_float * 1)(self.omega)))
+
+        for iteration in range(1, iterations + 1):
+            for parity in (0.0, 1.0):
+                bgfx.setUniform(self.parity_uniform, as_void_ptr((c_float * 1)(parity)))
+                bgfx.setBuffer(
+                    TemplateConstants.PRESSURE_IN.value,
+                    self._pressure_buffer[self.PRESSURE_READ],
+                    bgfx.Access.ReadWrite,
+                )
+                if check_interval:
+                    self._dispatch(
+                        self._poisson_sor_kernel, self._indirect_buffer, 1, 1
+                    )
+                else:
+                    self._dispatch(
+                        self._poisson_sor_kernel,
+                        self._num_sor_groups_x,
+                        self._num_groups_y,
+                        1,
+                    )
+
+            if check_interval and iteration % check_interval == 0:
+                self._check_residual(iteration)
+
+        bgfx.setBuffer(
+            TemplateConstants.PRESSURE_IN.value,
+            self._pressure_buffer[self.PRESSURE_READ],
+            bgfx.Access.Read,
+        )
+
+        self._update_convergence_stats(check_interval, iterations)
+
+    def _check_interval(self, even: bool):
+        if self.tolerance <= 0.0:
+            return 0
+
+        if self._indirect_buffer is None:
+            self._create_convergence_resources()
+
+        self._reset_convergence()
+
+        interval = self.residual_check_interval
+        return interval + interval % 2 if even else interval
+
+    def _capped_iterations(self, check_interval: int):
+        # 'iterations' is the hard cap, rounded down so it ends with a check
+        if check_interval:
+            return max(
+                check_interval, self.iterations - self.iterations % check_interval
+            )
+        return self.iterations
+
+    def _reset_convergence(self):
+        bgfx.setUniform(
+            self.dispatch_size_uniform,
+            as_void_ptr(
+                (c_float * 4)(
                     self._num_groups_x,
                     self._num_groups_y,
-                    1,
+                    self._num_sor_groups_x,
+                    self._num_groups_x * self._num_groups_y,
                 )
-                self._flip_velocity_buffer()
+            ),
+        )
+        bgfx.setUniform(
+            self.tolerance_uniform, as_void_ptr((c_float * 1)(self.tolerance))
+        )
+        bgfx.setBuffer(
+            ScratchSlots.INDIRECT_ARGS,
+            self._indirect_buffer,
+            bgfx.Access.ReadWrite,
+        )
+        bgfx.setBuffer(
+            ScratchSlots.CONVERGENCE_STATE,
+            self._convergence_state_buffer,
+            bgfx.Access.ReadWrite,
+        )
+        self._dispatch(self._residual_reset_kernel, 1, 1, 1)
 
-            # Divergence
-            bgfx.dispatch(
-                0, self._divergence_kernel, self._num_groups_x, self._num_groups_y, 1
-            )
+    def _check_residual(self, iteration: int):
+        # Per-workgroup maxima, skipped as well once converged
+        bgfx.setBuffer(
+            TemplateConstants.PRESSURE_IN.value,
+            self._pressure_buffer[self.PRESSURE_READ],
+            bgfx.Access.Read,
+        )
+        bgfx.setBuffer(
+            ScratchSlots.RESIDUAL_PARTIALS,
+            self._residual_partials_buffer,
+            bgfx.Access.Write,
+        )
+        self._dispatch(self._residual_reduce_kernel, self._indirect_buffer, 0, 1)
 
-            # Clear pressure
-            bgfx.setBuffer(
-                TemplateConstants.GENERIC.value,
-                self._pressure_buffer[self.PRESSURE_READ],
-                bgfx.Access.ReadWrite,
-            )
-            bgfx.dispatch(
-                0, self._clear_buffer_kernel, self._num_groups_x, self._num_groups_y, 1
+        # Final reduction and convergence test
+        bgfx.setUniform(self.iteration_uniform, as_void_ptr((c_float * 1)(iteration)))
+        bgfx.setBuffer(
+            ScratchSlots.RESIDUAL_PARTIALS,
+            self._residual_partials_buffer,
+            bgfx.Access.Read,
+        )
+        bgfx.setBuffer(
+            ScratchSlots.INDIRECT_ARGS,
+            self._indirect_buffer,
+            bgfx.Access.ReadWrite,
+        )
+        bgfx.setBuffer(
+            ScratchSlots.CONVERGENCE_STATE,
+            self._convergence_state_buffer,
+            bgfx.Access.ReadWrite,
+        )
+        bgfx.setImage(
+            ScratchSlots.CONVERGENCE_STATS,
+            self._convergence_texture,
+            0,
+            bgfx.Access.Write,
+        )
+        self._dispatch(self._residual_check_kernel, 1, 1, 1)
+
+    def _update_convergence_stats(self, check_interval: int, iterations: int):
+        if not check_interval:
+            self._last_iterations = iterations
+            self._last_residual = None
+            return
+
+        # Blits run before the dispatches of their own view, so the copy is made
+        # in the readback view, after the solve of this frame. The stats land in
+        # host memory a couple of frames later, the last component is -1 until then
+        if self._convergence_pending and self._convergence_stats[3] != -1.0:
+            self._convergence_pending = False
+
+            if self._convergence_stats[3] == 1.0:
+                self._last_residual = self._convergence_stats[1]
+                self._last_iterations = int(self._convergence_stats[2])
+
+        if not self._convergence_pending:
+            self._convergence_stats[3] = -1.0
+            bgfx.blit(
+                self.readback_view,
+                self._convergence_readback,
+                0,
+                0,
+                self._convergence_texture,
             )
-            bgfx.setBuffer(
-                TemplateConstants.PRESSURE_IN.value,
-                self._pressure_buffer[self.PRESSURE_READ],
-                bgfx.Access.Read,
+            bgfx.readTexture(
+                self._convergence_readback, as_void_ptr(self._convergence_stats)
             )
+            self._convergence_pending = True
 
-            # Poisson
-            for _ in range(self.iterations):
-                bgfx.dispatch(
-                    0, self._poisson_kernel, self._num_groups_x, self._num_groups_y, 1
-                )
-                self._flip_pressure_buffer()
+    def _create_convergence_resources(self):
+        self._residual_partials_buffer = create_buffer(
+            self._num_groups_x * self._num_groups_y, 1, self.vertex_layout
+        )
+        self._convergence_state_buffer = create_buffer(1, 4, self.vertex_layout)
+        self._indirect_buffer = bgfx.createIndirectBuffer(2)
+        self._convergence_texture = bgfx.createTexture2D(
+            1,
+            1,
+            False,
+            1,
+            bgfx.TextureFormat.RGBA32F,
+            BGFX_TEXTURE_COMPUTE_WRITE,
+        )
+        self._convergence_readback = bgfx.createTexture2D(
+            1,
+            1,
+            False,
+            1,
+            bgfx.TextureFormat.RGBA32F,
+            BGFX_TEXTURE_BLIT_DST | BGFX_TEXTURE_READ_BACK,
+        )
+        self._convergence_stats = (c_float * 4)(0.0, 0.0, 0.0, -1.0)
 
-            # Subtract gradient
-            bgfx.dispatch(
-                0,
-                self._subtract_gradient_kernel,
-                self._num_groups_x,
-                self._num_groups_y,
+    def _solve_pressure_multigrid(self):
+        if self._multigrid_levels is None:
+            self._create_multigrid_levels()
+
+        fine = self._multigrid_levels[0]
+        fine.PRESSURE_READ = self.PRESSURE_READ
+        fine.PRESSURE_WRITE = self.PRESSURE_WRITE
+
+        # No early exit, the residual is only checked after the last V-cycle
+        check_interval = self._check_interval(even=False)
+
+        for _ in range(self.v_cycles):
+            self._multigrid_v_cycle(0)
+
+        self.PRESSURE_READ = fine.PRESSURE_READ
+        self.PRESSURE_WRITE = fine.PRESSURE_WRITE
+
+        # Restore the full-size bindings for the gradient subtraction
+        self._init_compute_kernels()
+
+        if check_interval:
+            self._check_residual(self.v_cycles)
+        self._update_convergence_stats(check_interval, self.v_cycles)
+
+    def _multigrid_v_cycle(self, index: int):
+        level = self._multigrid_levels[index]
+
+        if index == len(self._multigrid_levels) - 1:
+            self._multigrid_smooth(level, self._multigrid_coarse_iterations)
+            return
+
+        coarse = self._multigrid_levels[index + 1]
+
+        # Pre-smoothing
+        self._multigrid_smooth(level, self._multigrid_smoothing)
+
+        # Residual restriction
+        self._bind_multigrid_level(level)
+        bgfx.setBuffer(
+            TemplateConstants.RESIDUAL.value, level.residual_buffer, bgfx.Access.Write
+        )
+        self._dispatch(
+            self._multigrid_residual_kernel,
+            level.num_groups_x,
+            level.num_groups_y,
+            1,
+        )
+
+        self._bind_multigrid_level(level)
+        self._bind_multigrid_coarse_level(coarse)
+        bgfx.setBuffer(
+            TemplateConstants.RESIDUAL.value, level.residual_buffer, bgfx.Access.Read
+        )
+        bgfx.setBuffer(
+            ScratchSlots.COARSE_DIVERGENCE,
+            coarse.divergence_buffer,
+            bgfx.Access.Write,
+        )
+        bgfx.setBuffer(
+            ScratchSlots.COARSE_OBSTACLES,
+            coarse.obstacles_buffer,
+            bgfx.Access.Write,
+        )
+        self._dispatch(
+            self._multigrid_restrict_kernel,
+            coarse.num_groups_x,
+            coarse.num_groups_y,
+            1,
+        )
+
+        # Coarse grid correction, starting from zero
+        bgfx.setUniform(
+            self.size_uniform, as_void_ptr((c_float * 2)(coarse.width, coarse.height))
+        )
+        bgfx.setBuffer(
+            TemplateConstants.GENERIC.value,
+            coarse.pressure_buffer[coarse.PRESSURE_READ],
+            bgfx.Access.ReadWrite,
+        )
+        self._dispatch(
+            self._clear_buffer_kernel, coarse.num_groups_x, coarse.num_groups_y, 1
+        )
+        self._multigrid_v_cycle(index + 1)
+
+        # Prolongation
+        self._bind_multigrid_level(level)
+        self._bind_multigrid_coarse_level(coarse)
+        bgfx.setBuffer(
+            ScratchSlots.COARSE_PRESSURE,
+            coarse.pressure_buffer[coarse.PRESSURE_READ],
+            bgfx.Access.Read,
+        )
+        self._dispatch(
+            self._multigrid_prolongate_kernel,
+            level.num_groups_x,
+            level.num_groups_y,
+            1,
+        )
+        level.flip_pressure_buffer()
+
+        # Post-smoothing
+        self._multigrid_smooth(level, self._multigrid_smoothing)
+
+    def _multigrid_smooth(self, level: MultigridLevel, iterations: int):
+        for _ in range(iterations):
+            self._bind_multigrid_level(level)
+            self._dispatch(
+                self._multigrid_smooth_kernel,
+                level.num_groups_x,
+                level.num_groups_y,
                 1,
             )
-            self._flip_velocity_buffer()
+            level.flip_pressure_buffer()
 
-            # Clear obstacles
-            bgfx.setBuffer(
-                TemplateConstants.GENERIC.value,
-                self._obstacles_buffer,
-                bgfx.Access.ReadWrite,
-            )
-            bgfx.dispatch(
-                0, self._clear_buffer_kernel, self._num_groups_x, self._num_groups_y, 1
-            )
-            bgfx.setBuffer(
-                TemplateConstants.OBSTACLES.value,
-                self._obstacles_buffer,
-                bgfx.Access.ReadWrite,
-            )
+    def _bind_multigrid_level(self, level: MultigridLevel):
+        bgfx.setUniform(
+            self.size_uniform, as_void_ptr((c_float * 2)(level.width, level.height))
+        )
+        bgfx.setBuffer(
+            TemplateConstants.PRESSURE_IN.value,
+            level.pressure_buffer[level.PRESSURE_READ],
+            bgfx.Access.Read,
+        )
+        bgfx.setBuffer(
+            TemplateConstants.PRESSURE_OUT.value,
+            level.pressure_buffer[level.PRESSURE_WRITE],
+            bgfx.Access.Write,
+        )
+        bgfx.setBuffer(
+            TemplateConstants.DIVERGENCE.value,
+            level.divergence_buffer,
+            bgfx.Access.Read,
+        )
+        bgfx.setBuffer(
+            TemplateConstants.OBSTACLES.value, level.obstacles_buffer, bgfx.Access.Read
+        )
+
+    def _bind_multigrid_coarse_level(self, coarse: MultigridLevel):
+        bgfx.setUniform(
+            self.coarse_size_uniform,
+            as_void_ptr((c_float * 2)(coarse.width, coarse.height)),
+        )
+
+    def _create_multigrid_levels(self):
+        self._residual_buffer = create_buffer(self._num_cells, 1, self.vertex_layout)
+
+        level = MultigridLevel(
+            self._width,
+            self._height,
+            self._pressure_buffer,
+            self._divergence_buffer,
+            self._obstacles_buffer,
+            self._residual_buffer,
+            self._group_size,
+        )
+        self._multigrid_levels = [level]
+
+        while min(level.width, level.height) > self._multigrid_coarsest_size:
+            level = level.coarser(self.vertex_layout)
+            self._multigrid_levels.append(level)
 
     def _set_size(self, width: int, height: int):
-        group_size_x = TemplateConstants.NUM_THREADS.value
-        group_size_y = TemplateConstants.NUM_THREADS.value
+        group_size_x, group_size_y = self._group_size
 
         self._width = width
         self._height = height
@@ -289,6 +1498,44 @@ class FluidSimulator:
         self._num_groups_x = int(ceil(float(width) / float(group_size_x)))
         self._num_groups_y = int(ceil(float(height) / float(group_size_y)))
 
+        # Red-black sweeps only touch every other cell of a row
+        self._num_sor_groups_x = int(ceil(ceil(width / 2.0) / float(group_size_x)))
+
+    # bgfx applies the update before any dispatch of the frame
+    def _upload_field(self, field: Field, array: np.ndarray):
+        if field == Field.VELOCITY:
+            buffer = self._velocity_buffer[self.VELOCITY_READ]
+        elif field == Field.PRESSURE:
+            buffer = self._pressure_buffer[self.PRESSURE_READ]
+        else:
+            buffer = self._obstacles_buffer
+
+        self._uploads[field] = array
+        update_buffer_reference(buffer, array)
+
+    def _readback_available(self, field: Field):
+        ring = self._readback_rings.get(field)
+        return ring is None or ring.acquire() is not None
+
+    def _create_readback_ring(self, field: Field):
+        if field == Field.VELOCITY:
+            texture_format, dtype, channels = bgfx.TextureFormat.RGBA32F, np.float32, 4
+        elif field == Field.OBSTACLES:
+            texture_format, dtype, channels = bgfx.TextureFormat.R32U, np.uint32, 1
+        else:
+            texture_format, dtype, channels = bgfx.TextureFormat.R32F, np.float32, 1
+
+        return ReadbackRing(
+            self._width,
+            self._height,
+            texture_format,
+            dtype,
+            channels,
+            2 if field == Field.VELOCITY else 1,
+            self.readback_slots,
+            self.readback_view,
+        )
+
     def _create_uniforms(self):
         self.size_uniform = bgfx.createUniform("_Size", bgfx.UniformType.Vec4)
         self.position_uniform = bgfx.createUniform("_Position", bgfx.UniformType.Vec4)
@@ -311,6 +1558,24 @@ class FluidSimulator:
         )
         self.alpha_uniform = bgfx.createUniform("_Alpha", bgfx.UniformType.Vec4)
         self.rbeta_uniform = bgfx.createUniform("_rBeta", bgfx.UniformType.Vec4)
+        self.coarse_size_uniform = bgfx.createUniform(
+            "_CoarseSize", bgfx.UniformType.Vec4
+        )
+        self.parity_uniform = bgfx.createUniform("_Parity", bgfx.UniformType.Vec4)
+        self.omega_uniform = bgfx.createUniform("_Omega", bgfx.UniformType.Vec4)
+        self.dispatch_size_uniform = bgfx.createUniform(
+            "_DispatchSize", bgfx.UniformType.Vec4
+        )
+        self.tolerance_uniform = bgfx.createUniform("_Tolerance", bgfx.UniformType.Vec4)
+        self.iteration_uniform = bgfx.createUniform("_Iteration", bgfx.UniformType.Vec4)
+        self.scale_uniform = bgfx.createUniform("_Scale", bgfx.UniformType.Vec4)
+        self.splat_count_uniform = bgfx.createUniform(
+            "_SplatCount", bgfx.UniformType.Vec4
+        )
+        self.offset_uniform = bgfx.createUniform("_Offset", bgfx.UniformType.Vec4)
+        self.keep_uniform = bgfx.createUniform("_Keep", bgfx.UniformType.Vec4)
+        self.tiles_uniform = bgfx.createUniform("_Tiles", bgfx.UniformType.Vec4)
+        self.sweeps_uniform = bgfx.createUniform("_Sweeps", bgfx.UniformType.Vec4)
 
     def _update_params(self, time_delta: float):
         bgfx.setUniform(
@@ -341,105 +1606,169 @@ class FluidSimulator:
         )
 
         bgfx.setBuffer(1, self._velocity_buffer[self.VELOCITY_READ], bgfx.Access.Read)
-        bgfx.setBuffer(
-            2, self._velocity_buffer[self.VELOCITY_WRITE], bgfx.Access.Write
-        )
+        bgfx.setBuffer(2, self._velocity_buffer[self.VELOCITY_WRITE], bgfx.Access.Write)
 
         bgfx.setBuffer(3, self._pressure_buffer[self.PRESSURE_READ], bgfx.Access.Read)
-        bgfx.setBuffer(
-            4, self._pressure_buffer[self.PRESSURE_WRITE], bgfx.Access.Write
-        )
+        if self._pressure_buffer[self.PRESSURE_WRITE] is not None:
+            bgfx.setBuffer(
+                4, self._pressure_buffer[self.PRESSURE_WRITE], bgfx.Access.Write
+            )
 
-        bgfx.setBuffer(5, self._divergence_buffer, bgfx.Access.ReadWrite)
-        bgfx.setBuffer(6, self._vorticity_buffer, bgfx.Access.ReadWrite)
+        bgfx.setBuffer(5, self._vorticity_buffer, bgfx.Access.ReadWrite)
+        bgfx.setBuffer(6, self._divergence_buffer, bgfx.Access.ReadWrite)
         bgfx.setBuffer(7, self._obstacles_buffer, bgfx.Access.ReadWrite)
 
     def _create_buffers(self):
         self._velocity_buffer = [
-            create_buffer(self._num_cells, 2, self.vertex_layout),
-            create_buffer(self._num_cells, 2, self.vertex_layout),
+            create_buffer(
+                self._num_cells, self._velocity_dimensions, self.vertex_layout
+            ),
+            create_buffer(
+                self._num_cells, self._velocity_dimensions, self.vertex_layout
+            ),
         ]
         self._pressure_buffer = [
             create_buffer(self._num_cells, 1, self.vertex_layout),
-            create_buffer(self._num_cells, 1, self.vertex_layout),
+            None,
         ]
         self._divergence_buffer = create_buffer(self._num_cells, 1, self.vertex_layout)
         self._vorticity_buffer = create_buffer(self._num_cells, 1, self.vertex_layout)
-        self._obstacles_buffer = create_buffer(self._num_cells, 2, self.vertex_layout)
+        # One uint per cell, a bit per ObstacleLayer
+        self._obstacles_buffer = create_buffer(self._num_cells, 1, self.vertex_layout)
+
+        # Uploaded on demand by add_velocities and add_obstacles
+        self._splats_buffer = DynamicBuffer(4, self.vertex_layout)
+        self._obstacle_primitives_buffer = DynamicBuffer(4, self.vertex_layout)
+        self._obstacle_tiles_buffer = DynamicBuffer(2, self.vertex_layout)
+        self._obstacle_tile_primitives_buffer = DynamicBuffer(1, self.vertex_layout)
+        # Uploaded by set_obstacle_sdf
+        self._obstacle_mask_buffer = DynamicBuffer(1, self.vertex_layout)
+
+        # The in-place SOR solve does not need a second pressure buffer
+        if self.pressure_solver != PressureSolver.SOR:
+            self._create_pressure_write_buffer()
+
+    def _upload_splats(self, splats):
+        data = (c_float * (8 * len(splats)))()
+        for i, (position, velocity, radius) in enumerate(splats):
+            data[8 * i : 8 * i + 5] = (
+                position[0],
+                position[1],
+                velocity[0],
+                velocity[1],
+                radius,
+            )
+
+        self._splats_buffer.upload(data, 2 * len(splats))
+
+    def _upload_obstacles(self, circles, triangles, bounds: list, region: tuple):
+        primitives = pack_primitives(circles, triangles)
+        ranges, indices = bin_primitives(bounds, region, self._group_size)
+
+        self._obstacle_primitives_buffer.upload(
+            (c_float * len(primitives))(*primitives), len(primitives) // 4
+        )
+        self._obstacle_tiles_buffer.upload(
+            (c_float * len(ranges))(*ranges), len(ranges) // 2
+        )
+        self._obstacle_tile_primitives_buffer.upload(
+            (c_float * len(indices))(*indices), len(indices)
+        )
+
+        bgfx.setBuffer(
+            ScratchSlots.OBSTACLE_PRIMITIVES,
+            self._obstacle_primitives_buffer.handle,
+            bgfx.Access.Read,
+        )
+        bgfx.setBuffer(
+            ScratchSlots.OBSTACLE_TILES,
+            self._obstacle_tiles_buffer.handle,
+            bgfx.Access.Read,
+        )
+        bgfx.setBuffer(
+            ScratchSlots.OBSTACLE_TILE_PRIMITIVES,
+            self._obstacle_tile_primitives_buffer.handle,
+            bgfx.Access.Read,
+        )
+
+    def _create_pressure_write_buffer(self):
+        if self._pressure_buffer[self.PRESSURE_WRITE] is None:
+            self._pressure_buffer[self.PRESSURE_WRITE] = create_buffer(
+                self._num_cells, 1, self.vertex_layout
+            )
+            bgfx.setBuffer(
+                TemplateConstants.PRESSURE_OUT.value,
+                self._pressure_buffer[self.PRESSURE_WRITE],
+                bgfx.Access.Write,
+            )
 
     def _load_compute_kernels(self):
-        self._add_velocity_kernel = bgfx.createProgram(
-            load_shader(
-                "shader.AddVelocity.comp", ShaderType.COMPUTE, root_path=root_path
-            ),
-            True,
+        self._add_velocity_kernel = self._load_kernel("shader.AddVelocity.comp")
+        self._add_velocities_kernel = self._load_kernel("shader.AddVelocities.comp")
+        self._add_obstacles_kernel = self._load_kernel("shader.AddObstacles.comp")
+        self._init_boundaries_kernel = self._load_kernel("shader.InitBoundaries.comp")
+        self._advect_velocity_kernel = self._load_kernel("shader.AdvectVelocity.comp")
+        self._divergence_kernel = self._load_kernel("shader.Divergence.comp")
+        self._poisson_kernel = self._load_kernel("shader.Poisson.comp")
+        self._subtract_gradient_kernel = self._load_kernel(
+            "shader.SubtractGradient.comp"
         )
-        self._init_boundaries_kernel = bgfx.createProgram(
-            load_shader(
-                "shader.InitBoundaries.comp", ShaderType.COMPUTE, root_path=root_path
-            ),
-            True,
+        self._calc_vorticity_kernel = self._load_kernel("shader.CalcVorticity.comp")
+        self._apply_vorticity_kernel = self._load_kernel("shader.ApplyVorticity.comp")
+        self._add_circle_obstacle_kernel = self._load_kernel(
+            "shader.AddCircleObstacle.comp"
         )
-        self._advect_velocity_kernel = bgfx.createProgram(
-            load_shader(
-                "shader.AdvectVelocity.comp", ShaderType.COMPUTE, root_path=root_path
-            ),
-            True,
+        self._add_triangle_obstacle_kernel = self._load_kernel(
+            "shader.AddTriangleObstacle.comp"
         )
-        self._divergence_kernel = bgfx.createProgram(
-            load_shader(
-                "shader.Divergence.comp", ShaderType.COMPUTE, root_path=root_path
-            ),
-            True,
+        self._clear_buffer_kernel = self._load_kernel("shader.ClearBuffer.comp")
+        self._clear_obstacles_kernel = self._load_kernel("shader.ClearObstacles.comp")
+        self._set_obstacle_layer_kernel = self._load_kernel(
+            "shader.SetObstacleLayer.comp"
         )
-        self._poisson_kernel = bgfx.createProgram(
-            load_shader("shader.Poisson.comp", ShaderType.COMPUTE, root_path=root_path),
-            True,
+        self._viscosity_kernel = self._load_kernel("shader.Viscosity.comp")
+        self._scale_buffer_kernel = self._load_kernel("shader.ScaleBuffer.comp")
+        self._multigrid_smooth_kernel = self._load_kernel("shader.MultigridSmooth.comp")
+        self._multigrid_residual_kernel = self._load_kernel(
+            "shader.MultigridResidual.comp"
         )
-        self._subtract_gradient_kernel = bgfx.createProgram(
-            load_shader(
-                "shader.SubtractGradient.comp", ShaderType.COMPUTE, root_path=root_path
-            ),
-            True,
+        self._multigrid_restrict_kernel = self._load_kernel(
+            "shader.MultigridRestrict.comp"
         )
-        self._calc_vorticity_kernel = bgfx.createProgram(
-            load_shader(
-                "shader.CalcVorticity.comp", ShaderType.COMPUTE, root_path=root_path
-            ),
-            True,
+        self._poisson_sor_kernel = self._load_kernel("shader.PoissonSOR.comp")
+        self._multigrid_prolongate_kernel = self._load_kernel(
+            "shader.MultigridProlongate.comp"
         )
-        self._apply_vorticity_kernel = bgfx.createProgram(
-            load_shader(
-                "shader.ApplyVorticity.comp", ShaderType.COMPUTE, root_path=root_path
-            ),
-            True,
+        self._residual_reduce_kernel = self._load_kernel("shader.ResidualReduce.comp")
+        self._residual_check_kernel = self._load_kernel("shader.ResidualCheck.comp")
+        self._residual_reset_kernel = self._load_kernel("shader.ResidualReset.comp")
+        self._fused_advect_velocity_kernel = self._load_kernel(
+            "shader.FusedAdvectVelocity.comp"
         )
-        self._add_circle_obstacle_kernel = bgfx.createProgram(
-            load_shader(
-                "shader.AddCircleObstacle.comp", ShaderType.COMPUTE, root_path=root_path
-            ),
-            True,
+        self._fused_vorticity_kernel = self._load_kernel("shader.FusedVorticity.comp")
+        self._fused_divergence_kernel = self._load_kernel("shader.FusedDivergence.comp")
+        self._tiled_poisson_kernel = self._load_kernel("shader.TiledPoisson.comp")
+        self._tiled_viscosity_kernel = self._load_kernel("shader.TiledViscosity.comp")
+        self._tiled_divergence_kernel = self._load_kernel("shader.TiledDivergence.comp")
+        self._tiled_calc_vorticity_kernel = self._load_kernel(
+            "shader.TiledCalcVorticity.comp"
         )
-        self._add_triangle_obstacle_kernel = bgfx.createProgram(
-            load_shader(
-                "shader.AddTriangleObstacle.comp",
-                ShaderType.COMPUTE,
-                root_path=root_path,
-            ),
-            True,
+        self._readback_velocity_kernel = self._load_kernel(
+            "shader.ReadbackVelocity.comp"
         )
-        self._clear_buffer_kernel = bgfx.createProgram(
-            load_shader(
-                "shader.ClearBuffer.comp", ShaderType.COMPUTE, root_path=root_path
-            ),
-            True,
+        self._readback_scalar_kernel = self._load_kernel("shader.ReadbackScalar.comp")
+        self._readback_obstacles_kernel = self._load_kernel(
+            "shader.ReadbackObstacles.comp"
         )
-        self._viscosity_kernel = bgfx.createProgram(
-            load_shader(
-                "shader.Viscosity.comp", ShaderType.COMPUTE, root_path=root_path
-            ),
-            True,
+        self._max_velocity_reduce_kernel = self._load_kernel(
+            "shader.MaxVelocityReduce.comp"
         )
+        self._max_velocity_kernel = self._load_kernel("shader.MaxVelocity.comp")
+
+    def _load_kernel(self, name: str):
+        kernel = LazyKernel(name, self._shader_path, self._kernel_executor)
+        self._kernels.append(kernel)
+        return kernel
 
     def _flip_velocity_buffer(self):
         tmp = self.VELOCITY_READ
@@ -490,26 +1819,55 @@ class FluidSimulator:
         bgfx.destroy(self.vorticity_scale_uniform)
         bgfx.destroy(self.alpha_uniform)
         bgfx.destroy(self.rbeta_uniform)
+        bgfx.destroy(self.coarse_size_uniform)
+        bgfx.destroy(self.parity_uniform)
+        bgfx.destroy(self.omega_uniform)
+        bgfx.destroy(self.dispatch_size_uniform)
+        bgfx.destroy(self.tolerance_uniform)
+        bgfx.destroy(self.iteration_uniform)
+        bgfx.destroy(self.scale_uniform)
+        bgfx.destroy(self.splat_count_uniform)
+        bgfx.destroy(self.offset_uniform)
+        bgfx.destroy(self.keep_uniform)
+        bgfx.destroy(self.tiles_uniform)
+        bgfx.destroy(self.sweeps_uniform)
 
         # Destroy buffers
         bgfx.destroy(self._velocity_buffer[0])
         bgfx.destroy(self._velocity_buffer[1])
-        bgfx.destroy(self._pressure_buffer[0])
-        bgfx.destroy(self._pressure_buffer[1])
+        for buffer in self._pressure_buffer:
+            if buffer is not None:
+                bgfx.destroy(buffer)
         bgfx.destroy(self._divergence_buffer)
         bgfx.destroy(self._vorticity_buffer)
         bgfx.destroy(self._obstacles_buffer)
 
+        if self._multigrid_levels is not None:
+            bgfx.destroy(self._residual_buffer)
+            for level in self._multigrid_levels[1:]:
+                level.destroy()
+
+        self._splats_buffer.destroy()
+        self._obstacle_primitives_buffer.destroy()
+        self._obstacle_tiles_buffer.destroy()
+        self._obstacle_tile_primitives_buffer.destroy()
+        self._obstacle_mask_buffer.destroy()
+
+        if self._indirect_buffer is not None:
+            bgfx.destroy(self._residual_partials_buffer)
+            bgfx.destroy(self._convergence_state_buffer)
+            bgfx.destroy(self._indirect_buffer)
+            bgfx.destroy(self._convergence_texture)
+            bgfx.destroy(self._convergence_readback)
+
+        for ring in self._readback_rings.values():
+            ring.destroy()
+        self._uploads.clear()
+
+        if self._max_velocity_ring is not None:
+            self._max_velocity_ring.destroy()
+            bgfx.destroy(self._max_velocity_partials_buffer)
+
         # Destroy compute shaders
-        bgfx.destroy(self._add_velocity_kernel)
-        bgfx.destroy(self._init_boundaries_kernel)
-        bgfx.destroy(self._advect_velocity_kernel)
-        bgfx.destroy(self._divergence_kernel)
-        bgfx.destroy(self._poisson_kernel)
-        bgfx.destroy(self._subtract_gradient_kernel)
-        bgfx.destroy(self._calc_vorticity_kernel)
-        bgfx.destroy(self._apply_vorticity_kernel)
-        bgfx.destroy(self._add_circle_obstacle_kernel)
-        bgfx.destroy(self._add_triangle_obstacle_kernel)
-        bgfx.destroy(self._clear_buffer_kernel)
-        bgfx.destroy(self._viscosity_kernel)
+        for kernel in self._kernels:
+            kernel.destroy()
@@ -0,0 +1,284 @@
+import argparse
+import time
+from typing import Callable, NamedTuple, Optional
+
+import cppyy
+from pybgfx import bgfx
+from pybgfx.constants import BGFX_RESET_NONE
+
+from natrix.core.common.constants import (
+    Field,
+    PipelineStage,
+    Precision,
+    PressureSolver,
+)
+from natrix.core.fluid_simulator import FluidSimulator
+from natrix.core.recorder import FieldRecorder
+from natrix.core.scheduler import StepScheduler
+
+
+class HeadlessRunStats(NamedTuple):
+    steps: int
+    elapsed: float
+    steps_per_second: float
+
+
+class HeadlessRunner:
+    def __init__(
+        self,
+        width: int = 1,
+        height: int = 1,
+        renderer_type: bgfx.RendererType = bgfx.RendererType.Count,
+    ):
+        self.width = width
+        self.height = height
+
+        self.init_conf = bgfx.Init()
+        self.init_conf.type = renderer_type
+        self.init_conf.resolution.width = width
+        self.init_conf.resolution.height = height
+        self.init_conf.resolution.reset = BGFX_RESET_NONE
+
+        self.vertex_layout = None
+
+    def __enter__(self):
+        self.init()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def init(self):
+        # No window handle: bgfx skips the swap chain, and with the Noop
+        # renderer no GPU is needed at all
+        data = bgfx.PlatformData()
+        data.ndt = cppyy.nullptr
+        data.nwh = cppyy.nullptr
+        data.context = cppyy.nullptr
+        data.backBuffer = cppyy.nullptr
+        data.backBufferDS = cppyy.nullptr
+
+        # Calling renderFrame before init keeps bgfx single-threaded
+        bgfx.renderFrame()
+        bgfx.setPlatformData(data)
+        bgfx.init(self.init_conf)
+
+        self.vertex_layout = bgfx.VertexLayout()
+        self.vertex_layout.begin().add(
+            bgfx.Attrib.Position, 3, bgfx.AttribType.Float
+        ).add(bgfx.Attrib.TexCoord0, 3, bgfx.AttribType.Float).end()
+
+    def create_simulator(self, width: int, height: int, **kwargs):
+        return FluidSimulator(width, height, self.vertex_layout, **kwargs)
+
+    def run(
+        self,
+        simulator,
+        steps: int,
+        time_delta: float,
+        on_step: Optional[Callable[[int], None]] = None,
+        scheduler: Optional[StepScheduler] = None,
+    ):
+        if steps <= 0:
+            raise ValueError("'Steps' should be greater than zero")
+
+        start = time.perf_counter()
+
+        for step in range(steps):
+            if on_step is not None:
+                on_step(step)
+
+            # With a scheduler, time_delta is the frame time split into substeps
+            if scheduler is not None:
+                scheduler.advance(time_delta)
+            else:
+                simulator.update(time_delta)
+            frame = bgfx.frame()
+            simulator.poll_readback(frame)
+
+            if simulator.profiler is not None:
+                simulator.profiler.collect()
+
+        elapsed = time.perf_counter() - start
+
+        return HeadlessRunStats(steps, elapsed, steps / elapsed)
+
+    def shutdown(self):
+        bgfx.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a FluidSimulator headless")
+    parser.add_argument("--width", type=int, default=512)
+    parser.add_argument("--height", type=int, default=512)
+    parser.add_argument("--steps", type=int, default=1000)
+    parser.add_argument("--dt", type=float, default=1.0 / 60.0)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument(
+        "--solver",
+        choices=[solver.name.lower() for solver in PressureSolver],
+        default="jacobi",
+    )
+    parser.add_argument(
+        "--precision",
+        choices=[precision.name.lower() for precision in Precision],
+        default="fp32",
+    )
+    parser.add_argument(
+        "--group-size",
+        type=int,
+        nargs=2,
+        default=None,
+        help="workgroup size, the autotuned one of the device by default",
+    )
+    parser.add_argument(
+        "--fused", action="store_true", help="fold the pipeline into fewer dispatches"
+    )
+    parser.add_argument(
+        "--tiled", action="store_true", help="use the groupshared memory stencils"
+    )
+    parser.add_argument(
+        "--preload",
+        action="store_true",
+        help="prepare the kernels in parallel while constructing the simulator",
+    )
+    parser.add_argument(
+        "--startup", action="store_true", help="print the startup timings"
+    )
+    parser.add_argument(
+        "--cfl",
+        type=float,
+        default=None,
+        help="split each step into CFL limited substeps, in cells per substep",
+    )
+    parser.add_argument(
+        "--readback",
+        choices=[field.name.lower() for field in Field],
+        default=None,
+        help="read a field back to the host every step",
+    )
+    parser.add_argument("--record", default=None, help="directory to record fields to")
+    parser.add_argument(
+        "--record-every", type=int, default=10, help="record every Nth step"
+    )
+    parser.add_argument(
+        "--record-fields",
+        nargs="+",
+        choices=[field.name.lower() for field in Field],
+        default=["velocity"],
+    )
+    parser.add_argument(
+        "--compress", action="store_true", help="compress the recorded frames"
+    )
+    parser.add_argument(
+        "--profile", action="store_true", help="print the average time of each stage"
+    )
+    parser.add_argument(
+        "--renderer",
+        choices=["auto", "noop", "vulkan", "opengl", "direct3d11", "direct3d12"],
+        default="auto",
+    )
+    args = parser.parse_args()
+
+    renderers = {
+        "auto": bgfx.RendererType.Count,
+        "noop": bgfx.RendererType.Noop,
+        "vulkan": bgfx.RendererType.Vulkan,
+        "opengl": bgfx.RendererType.OpenGL,
+        "direct3d11": bgfx.RendererType.Direct3D11,
+        "direct3d12": bgfx.RendererType.Direct3D12,
+    }
+
+    with HeadlessRunner(args.width, args.height, renderers[args.renderer]) as runner:
+        fluid_simulator = runner.create_simulator(
+            args.width,
+            args.height,
+            pressure_solver=PressureSolver[args.solver.upper()],
+            precision=Precision[args.precision.upper()],
+            group_size=args.group_size,
+            preload=args.preload,
+        )
+        fluid_simulator.iterations = args.iterations
+        fluid_simulator.fused = args.fused
+        fluid_simulator.tiled = args.tiled
+
+        frames = []
+        if args.profile:
+            fluid_simulator.enable_profiling(on_frame=frames.append)
+
+        readbacks = []
+
+        recorder = None
+        if args.record is not None:
+            recorder = FieldRecorder(
+                args.record, args.record_every, compress=args.compress
+            )
+
+        def on_step(step: int):
+            fluid_simulator.add_velocity((0.5, 0.5), (0.1, 0.0), args.width / 16.0)
+            if args.readback is not None:
+                readbacks.append(
+                    fluid_simulator.read_field(Field[args.readback.upper()])
+                )
+            if recorder is not None:
+                recorder.sample(
+                    fluid_simulator,
+                    step,
+                    [Field[field.upper()] for field in args.record_fields],
+                )
+
+        scheduler = None
+        if args.cfl is not None:
+            scheduler = StepScheduler(
+                fluid_simulator, args.dt, args.cfl, max_substeps=16
+            )
+
+        stats = runner.run(
+            fluid_simulator, args.steps, args.dt, on_step=on_step, scheduler=scheduler
+        )
+        startup = fluid_simulator.startup_report
+        received = sum(future is not None and future.done() for future in readbacks)
+        fluid_simulator.destroy()
+
+        if recorder is not None:
+            recorder.close()
+
+    print(
+        f"{stats.steps} steps in {stats.elapsed:.3f}s "
+        f"({stats.steps_per_second:.1f} steps/s)"
+    )
+
+    if args.readback is not None:
+        print(f"{received} of {len(readbacks)} {args.readback} readbacks received")
+
+    if recorder is not None:
+        record = recorder.stats
+        print(
+            f"recorded {record.written} frames to {args.record} "
+            f"({record.bytes_written / 2 ** 20:.1f} MiB in {record.write_time:.0f} ms), "
+            f"{record.dropped} dropped, {record.skipped} skipped, "
+            f"queue peak {record.max_queued}"
+        )
+
+    if args.startup:
+        print(
+            f"constructed in {startup.construction:.1f} ms, "
+            f"first step after {startup.first_step:.1f} ms"
+        )
+        for name, load_time in sorted(startup.kernels.items(), key=lambda k: -k[1]):
+            print(f"  {name:<36} {load_time:.1f} ms")
+
+    for stage in PipelineStage:
+        profiles = [frame.stages[stage] for frame in frames if stage in frame.stages]
+        if not profiles:
+            continue
+
+        gpu_times = [p.gpu_time for p in profiles if p.gpu_time is not None]
+        gpu_time = f"{sum(gpu_times) / len(gpu_times):.3f}" if gpu_times else "n/a"
+        cpu_time = sum(p.cpu_time for p in profiles) / len(profiles)
+        dispatches = sum(p.dispatches for p in profiles) / len(profiles)
+
+        print(
+            f"{stage.name.lower():<12} gpu {gpu_time} ms, "
+            f"submit {cpu_time:.3f} ms, {dispatches:.1f} dispatches"
+        )
@@ -0,0 +1,81 @@
+from ctypes import c_float, sizeof
+from math import ceil
+
+from pybgfx import bgfx
+
+from natrix.core.utils.shaders_utils import create_buffer
+
+
+class MultigridLevel:
+    PRESSURE_READ = 0
+    PRESSURE_WRITE = 1
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        pressure_buffer: list,
+        divergence_buffer,
+        obstacles_buffer,
+        residual_buffer,
+        group_size: tuple,
+    ):
+        self.width = width
+        self.height = height
+        self.group_size = group_size
+        self.num_groups_x = int(ceil(float(width) / float(group_size[0])))
+        self.num_groups_y = int(ceil(float(height) / float(group_size[1])))
+
+        self.pressure_buffer = pressure_buffer
+        self.divergence_buffer = divergence_buffer
+        self.obstacles_buffer = obstacles_buffer
+        self.residual_buffer = residual_buffer
+
+        # Only the buffers owned by this level, level 0 shares the simulator ones
+        self.memory = 0
+
+    @classmethod
+    def create(
+        cls,
+        width: int,
+        height: int,
+        vertex_layout: bgfx.VertexLayout,
+        group_size: tuple,
+    ):
+        num_cells = width * height
+
+        level = cls(
+            width,
+            height,
+            [
+                create_buffer(num_cells, 1, vertex_layout),
+                create_buffer(num_cells, 1, vertex_layout),
+            ],
+            create_buffer(num_cells, 1, vertex_layout),
+            create_buffer(num_cells, 1, vertex_layout),
+            create_buffer(num_cells, 1, vertex_layout),
+            group_size,
+        )
+        level.memory = sizeof(c_float) * num_cells * 5
+
+        return level
+
+    def coarser(self, vertex_layout: bgfx.VertexLayout):
+        return MultigridLevel.create(
+            (self.width + 1) // 2,
+            (self.height + 1) // 2,
+            vertex_layout,
+            self.group_size,
+        )
+
+    def flip_pressure_buffer(self):
+        tmp = self.PRESSURE_READ
+        self.PRESSURE_READ = self.PRESSURE_WRITE
+        self.PRESSURE_WRITE = tmp
+
+    def destroy(self):
+        bgfx.destroy(self.pressure_buffer[0])
+        bgfx.destroy(self.pressure_buffer[1])
+        bgfx.destroy(self.divergence_buffer)
+        bgfx.destroy(self.obstacles_buffer)
+        bgfx.destroy(self.residual_buffer)
@@ -0,0 +1,983 @@
+import numpy as np
+
+from natrix.core.common.constants import ObstacleLayer, Precision, PressureSolver
+from natrix.core.numpy_multigrid import NumpyMultigridLevel
+from natrix.core.utils.numpy_utils import create_neighbours, gather_neighbours
+from natrix.core.utils.obstacle_utils import (
+    circle_bounds,
+    mesh_triangles,
+    point_in_triangle,
+    triangle_bounds,
+)
+from natrix.core.utils.state_utils import read_state, write_state
+
+
+class NumpyFluidSimulator:
+    VELOCITY_READ = 0
+    VELOCITY_WRITE = 1
+
+    PRESSURE_READ = 0
+    PRESSURE_WRITE = 1
+
+    _num_cells = 0
+    _width = 512
+    _height = 512
+
+    _speed = 500.0
+    _iterations = 50
+    _omega = 1.7
+    _dissipation = 1.0
+    _vorticity = 0.0
+    _viscosity = 0.1
+    _pressure_decay = 1.0
+    _time_delta = 0.0
+    _has_dynamic_obstacles = False
+
+    _pressure_solver = PressureSolver.JACOBI
+    _v_cycles = 2
+    _multigrid_levels = None
+    _multigrid_smoothing = 2
+    _multigrid_coarse_iterations = 16
+    _multigrid_coarsest_size = 16
+
+    _tolerance = 0.0
+    _residual_check_interval = 4
+    _last_iterations = None
+    _last_residual = None
+
+    has_borders = True
+    simulate = True
+    warm_start = False
+
+    _state_parameters = (
+        "speed",
+        "iterations",
+        "tolerance",
+        "residual_check_interval",
+        "omega",
+        "dissipation",
+        "vorticity",
+        "viscosity",
+        "pressure_decay",
+        "pressure_solver",
+        "v_cycles",
+        "has_borders",
+        "simulate",
+        "warm_start",
+    )
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        pressure_solver: PressureSolver = PressureSolver.JACOBI,
+        precision: Precision = Precision.FP32,
+    ):
+        self._width = width
+        self._height = height
+        self.pressure_solver = pressure_solver
+        self._precision = Precision(precision)
+
+        self._set_size(width, height)
+        self._create_buffers()
+        self._create_neighbours()
+
+    @property
+    def width(self):
+        return self._width
+
+    @property
+    def height(self):
+        return self._height
+
+    @property
+    def precision(self):
+        return self._precision
+
+    @property
+    def speed(self):
+        return self._speed
+
+    @speed.setter
+    def speed(self, value):
+        if value > 0:
+            self._speed = value
+        else:
+            raise ValueError("'Speed' should be greater than zero")
+
+    @property
+    def iterations(self):
+        return self._iterations
+
+    @iterations.setter
+    def iterations(self, value):
+        if value > 0:
+            self._iterations = value
+        else:
+            raise ValueError("'Iterations' should be grater than zero")
+
+    @property
+    def tolerance(self):
+        return self._tolerance
+
+    @tolerance.setter
+    def tolerance(self, value):
+        if value >= 0.0:
+            self._tolerance = value
+        else:
+            raise ValueError("'Tolerance' should be greater or equal than zero")
+
+    @property
+    def residual_check_interval(self):
+        return self._residual_check_interval
+
+    @residual_check_interval.setter
+    def residual_check_interval(self, value):
+        if value > 0:
+            self._residual_check_interval = value
+        else:
+            raise ValueError("'Residual check interval' should be greater than zero")
+
+    # Same as FluidSimulator.last_iterations and last_residual, without the lag
+    @property
+    def last_iterations(self):
+        return self._last_iterations
+
+    @property
+    def last_residual(self):
+        return self._last_residual
+
+    @property
+    def omega(self):
+        return self._omega
+
+    @omega.setter
+    def omega(self, value):
+        if 0.0 < value < 2.0:
+            self._omega = value
+        else:
+            raise ValueError("'Omega' should be between zero and two")
+
+    @property
+    def dissipation(self):
+        return self._dissipation
+
+    @dissipation.setter
+    def dissipation(self, value):
+        if value > 0:
+            self._dissipation = value
+        else:
+            raise ValueError("'Dissipation' should be grater than zero")
+
+    @property
+    def vorticity(self):
+        return self._vorticity
+
+    @vorticity.setter
+    def vorticity(self, value):
+        if value >= 0:
+            self._vorticity = value
+        else:
+            raise ValueError("'Vorticity' should be grater or equal than zero")
+
+    @property
+    def viscosity(self):
+        return self._viscosity
+
+    @viscosity.setter
+    def viscosity(self, value):
+        if value >= 0.0:
+            self._viscosity = value
+        else:
+            raise ValueError("'Viscosity' should be greater or equal than zero")
+
+    @property
+    def pressure_decay(self):
+        return self._pressure_decay
+
+    @pressure_decay.setter
+    def pressure_decay(self, value):
+        if 0.0 <= value <= 1.0:
+            self._pressure_decay = value
+        else:
+            raise ValueError("'Pressure decay' should be between zero and one")
+
+    @property
+    def pressure_solver(self):
+        return self._pressure_solver
+
+    @pressure_solver.setter
+    def pressure_solver(self, value):
+        self._pressure_solver = PressureSolver(value)
+
+    @property
+    def v_cycles(self):
+        return self._v_cycles
+
+    @v_cycles.setter
+    def v_cycles(self, value):
+        if value > 0:
+            self._v_cycles = value
+        else:
+            raise ValueError("'V-cycles' should be greater than zero")
+
+    @property
+    def buffer_memory(self):
+        buffers = [
+            *self._velocity_buffer,
+            *self._pressure_buffer,
+            self._divergence_buffer,
+            self._vorticity_buffer,
+            self._obstacles_buffer,
+        ]
+        memory = sum(buffer.nbytes for buffer in buffers if buffer is not None)
+
+        if self._multigrid_levels is not None:
+            memory += sum(level.memory for level in self._multigrid_levels)
+
+        return memory
+
+    def get_velocity_buffer(self):
+        return self._velocity_buffer[self.VELOCITY_READ]
+
+    # Updated in place, only the cells inside the splat are touched
+    def add_velocity(self, position: tuple, velocity: tuple, radius: float):
+        if self.simulate:
+            self._add_splat(position, velocity, radius)
+
+    # splats is a sequence of (position, velocity, radius) records, with the same
+    # spaces as add_velocity
+    def add_velocities(self, splats):
+        if self.simulate:
+            for position, velocity, radius in splats:
+                self._add_splat(position, velocity, radius)
+
+    # position in normalised local space
+    # radius in world space
+    def add_circle_obstacle(self, position: tuple, radius: float, static=False):
+        if self.simulate:
+            length = self._scalar_tmp[0]
+            inside = self._mask_tmp[0]
+
+            self._splat_distance(position, length)
+            np.less_equal(length, radius, out=inside)
+
+            self._add_obstacle(inside, static)
+
+    # points in normalised local space
+    def add_triangle_obstacle(self, p1: tuple, p2: tuple, p3: tuple, static=False):
+        if self.simulate:
+            b1 = self._mask_tmp[0]
+            b2 = self._mask_tmp[1]
+            b3 = self._mask_tmp[2]
+
+            self._triangle_edge_sign(p1, p2, b1)
+            self._triangle_edge_sign(p2, p3, b2)
+            self._triangle_edge_sign(p3, p1, b3)
+
+            # (b1 == b2) && (b2 == b3)
+            np.equal(b1, b2, out=b1)
+            np.equal(b2, b3, out=b2)
+            np.logical_and(b1, b2, out=b1)
+
+            self._add_obstacle(b1, static)
+
+    # circles is a sequence of (position, radius) and triangles of (p1, p2, p3)
+    # records, with the same spaces as add_circle_obstacle and
+    # add_triangle_obstacle. Each one only touches the cells of its bounding box
+    def add_obstacles(self, circles=(), triangles=(), static=False):
+        if self.simulate:
+            layer = np.uint8(ObstacleLayer.STATIC if static else ObstacleLayer.DYNAMIC)
+            obstacles = self._obstacles_buffer.reshape(self._height, self._width)
+
+            for position, radius in circles:
+                bounds = circle_bounds(position, radius, self._width, self._height)
+                cells = self._bounded_cells(bounds)
+                if cells is not None:
+                    region, cell_x, cell_y = cells
+                    x = position[0] * self._width
+                    y = position[1] * self._height
+                    inside = np.hypot(cell_x - x, cell_y - y) <= radius
+                    obstacles[region][inside] |= layer
+
+            for p1, p2, p3 in triangles:
+                bounds = triangle_bounds(p1, p2, p3, self._width, self._height)
+                cells = self._bounded_cells(bounds)
+                if cells is not None:
+                    region, cell_x, cell_y = cells
+                    pt = (cell_x / self._width, cell_y / self._height)
+                    inside = point_in_triangle(pt, p1, p2, p3)
+                    obstacles[region][inside] |= layer
+
+            if not static and (len(circles) > 0 or len(triangles) > 0):
+                self._has_dynamic_obstacles = True
+
+    # vertices in normalised local space, indices a flat sequence of triangles
+    def add_obstacle_mesh(self, vertices, indices, static=False):
+        self.add_obstacles(triangles=mesh_triangles(vertices, indices), static=static)
+
+    # Same as FluidSimulator.set_obstacle_sdf
+    def set_obstacle_sdf(self, sdf, offset: float = 0.0, static=True):
+        sdf = np.asarray(sdf, dtype=np.float32).reshape(-1)
+        if sdf.shape[0] != self._num_cells:
+            raise ValueError("'SDF' should have one value per cell")
+
+        layer = np.uint8(ObstacleLayer.STATIC if static else ObstacleLayer.DYNAMIC)
+        self._obstacles_buffer &= ~layer
+        self._obstacles_buffer[sdf <= offset] |= layer
+        if not static:
+            self._has_dynamic_obstacles = True
+
+    # Same layouts as FluidSimulator.set_velocity, set_pressure and set_obstacles
+    def set_velocity(self, velocity):
+        velocity = np.asarray(velocity, dtype=np.float32).reshape(-1, 2)
+        if velocity.shape[0] != self._num_cells:
+            raise ValueError("'Velocity' should have two values per cell")
+
+        velocity_in = self._velocity_buffer[self.VELOCITY_READ]
+        np.copyto(velocity_in, velocity)
+        self._round_velocity(velocity_in)
+
+    def set_pressure(self, pressure):
+        pressure = np.asarray(pressure, dtype=np.float32).reshape(-1)
+        if pressure.shape[0] != self._num_cells:
+            raise ValueError("'Pressure' should have one value per cell")
+
+        np.copyto(self._pressure_buffer[self.PRESSURE_READ], pressure)
+
+    def set_obstacles(self, mask):
+        mask = np.asarray(mask)
+        if mask.dtype == np.bool_:
+            mask = np.where(mask, np.uint8(ObstacleLayer.STATIC), np.uint8(0))
+        else:
+            self._has_dynamic_obstacles = True
+
+        mask = mask.reshape(-1)
+        if mask.shape[0] != self._num_cells:
+            raise ValueError("'Obstacles' should have one value per cell")
+
+        np.copyto(self._obstacles_buffer, mask, casting="unsafe")
+
+    # Same format as FluidSimulator.save_state, states load in either simulator.
+    # Written right away
+    def save_state(self, path):
+        parameters = {name: getattr(self, name) for name in self._state_parameters}
+        parameters["pressure_solver"] = int(self.pressure_solver)
+
+        metadata = {
+            "width": self._width,
+            "height": self._height,
+            "precision": int(self._precision),
+            "velocity_read": self.VELOCITY_READ,
+            "pressure_read": self.PRESSURE_READ,
+            "parameters": parameters,
+        }
+        shape = (self._height, self._width)
+
+        write_state(
+            path,
+            metadata,
+            {
+                "velocity": self._velocity_buffer[self.VELOCITY_READ].reshape(
+                    *shape, 2
+                ),
+                "pressure": self._pressure_buffer[self.PRESSURE_READ].reshape(shape),
+                "obstacles": self._obstacles_buffer.astype(np.uint32).reshape(shape),
+            },
+        )
+
+    def load_state(self, path):
+        metadata, fields = read_state(path)
+        if (metadata["width"], metadata["height"]) != (self._width, self._height):
+            raise ValueError(
+                f"'State' is {metadata['width']}x{metadata['height']}, "
+                f"the simulator {self._width}x{self._height}"
+            )
+
+        for name, value in metadata["parameters"].items():
+            if name in self._state_parameters:
+                setattr(self, name, value)
+
+        self.VELOCITY_READ = metadata["velocity_read"]
+        self.VELOCITY_WRITE = 1 - self.VELOCITY_READ
+        self.PRESSURE_READ = metadata["pressure_read"]
+        self.PRESSURE_WRITE = 1 - self.PRESSURE_READ
+
+        # SOR simulators only have one pressure buffer
+        if self._pressure_buffer[self.PRESSURE_READ] is None:
+            self._pressure_buffer.reverse()
+
+        self.set_velocity(fields["velocity"])
+        self.set_pressure(fields["pressure"])
+        self.set_obstacles(fields["obstacles"])
+
+    # Static obstacles persist across frames until cleared
+    def clear_static_obstacles(self):
+        self._obstacles_buffer &= np.uint8(ObstacleLayer.DYNAMIC)
+
+    def update(self, time_delta: float):
+        if self.simulate:
+            self._begin_update(time_delta)
+
+            # Init boundaries
+            if self.has_borders:
+                self._init_boundaries()
+
+            # Advect
+            self._advect_velocity()
+
+            # Vorticity confinement
+            self._apply_vorticity_confinement()
+
+            # Viscosity
+            if self.viscosity > 0.0:
+                self._apply_viscosity()
+
+            # Divergence
+            self._calc_divergence()
+
+            # Poisson
+            self._solve_pressure()
+
+            # Subtract gradient
+            self._subtract_gradient()
+
+            # Clear obstacles
+            self._clear_obstacles()
+
+    def _begin_update(self, time_delta: float):
+        self._time_delta = time_delta
+        self._update_solids()
+
+    def _solve_pressure(self):
+        # Clear pressure, or start from the previous solution
+        pressure = self._pressure_buffer[self.PRESSURE_READ]
+        if not self.warm_start:
+            pressure.fill(0.0)
+        elif self.pressure_decay < 1.0:
+            np.multiply(pressure, self.pressure_decay, out=pressure)
+
+        if self.pressure_solver == PressureSolver.SOR:
+            self._solve_pressure_sor()
+        elif self.pressure_solver == PressureSolver.MULTIGRID:
+            self._create_pressure_write_buffer()
+            self._solve_pressure_multigrid()
+        else:
+            self._create_pressure_write_buffer()
+            self._solve_pressure_jacobi()
+
+    def _clear_obstacles(self):
+        if self._has_dynamic_obstacles:
+            self._obstacles_buffer &= np.uint8(ObstacleLayer.STATIC)
+            self._has_dynamic_obstacles = False
+
+    def _add_obstacle(self, inside, static: bool):
+        layer = np.uint8(ObstacleLayer.STATIC if static else ObstacleLayer.DYNAMIC)
+        self._obstacles_buffer[inside] |= layer
+
+        if not static:
+            self._has_dynamic_obstacles = True
+
+    def _solve_pressure_sor(self):
+        pressure = self._pressure_buffer[self.PRESSURE_READ]
+
+        for colour in range(2):
+            cells = self._sor_cells[colour]
+            np.take(self._divergence_buffer, cells, out=self._sor_divergence[colour])
+            np.take(
+                self._solid, self._sor_neighbours[colour], out=self._sor_solid[colour]
+            )
+
+        self._last_residual = None
+
+        for iteration in range(1, self.iterations + 1):
+            for colour in range(2):
+                self._sor_sweep(pressure, colour)
+
+            if self._converged(iteration):
+                break
+
+        self._last_iterations = iteration
+
+    def _solve_pressure_jacobi(self):
+        self._last_residual = None
+
+        for iteration in range(1, self.iterations + 1):
+            self._poisson()
+            self._flip_pressure_buffer()
+
+            if self._converged(iteration):
+                break
+
+        self._last_iterations = iteration
+
+    def _converged(self, iteration: int):
+        if self.tolerance <= 0.0 or iteration % self.residual_check_interval:
+            return False
+
+        self._last_residual = self._max_residual()
+        return self._last_residual < self.tolerance
+
+    def _max_residual(self):
+        pressure = self._pressure_buffer[self.PRESSURE_READ]
+        residual = self._scalar_tmp[4]
+
+        # |b - (x1 + x2 + y1 + y2 - 4p)| over the fluid cells
+        x1, x2, y1, y2 = self._gather_pressure_neighbours(pressure)
+        np.add(x1, x2, out=residual)
+        np.add(residual, y1, out=residual)
+        np.add(residual, y2, out=residual)
+        np.multiply(pressure, 4.0, out=x1)
+        np.subtract(residual, x1, out=residual)
+        np.subtract(self._divergence_buffer, residual, out=residual)
+        np.abs(residual, out=residual)
+        np.copyto(residual, 0.0, where=self._solid)
+
+        return float(residual.max())
+
+    def _sor_sweep(self, pressure, colour: int):
+        # Every neighbour of a cell belongs to the other colour, so each half
+        # sweep can be done as a single vectorized in-place update
+        cells = self._sor_cells[colour]
+        m = cells.shape[0]
+        neighbours = self._scalar_tmp[:4, :m]
+        p = self._scalar_tmp[4, :m]
+        jacobi = self._scalar_tmp[5, :m]
+
+        np.take(pressure, cells, out=p)
+        gather_neighbours(pressure, self._sor_neighbours[colour], neighbours)
+        for i in range(4):
+            np.copyto(neighbours[i], p, where=self._sor_solid[colour][i])
+
+        # mix(p, (x1 + x2 + y1 + y2 - b) * rbeta, omega)
+        np.add(neighbours[0], neighbours[1], out=jacobi)
+        np.add(jacobi, neighbours[2], out=jacobi)
+        np.add(jacobi, neighbours[3], out=jacobi)
+        np.subtract(jacobi, self._sor_divergence[colour], out=jacobi)
+        np.multiply(jacobi, 0.25, out=jacobi)
+        np.subtract(jacobi, p, out=jacobi)
+        np.multiply(jacobi, self.omega, out=jacobi)
+        np.add(p, jacobi, out=p)
+
+        np.put(pressure, cells, p)
+
+    def _solve_pressure_multigrid(self):
+        if self._multigrid_levels is None:
+            self._create_multigrid_levels()
+
+        fine = self._multigrid_levels[0]
+        fine.PRESSURE_READ = self.PRESSURE_READ
+        fine.PRESSURE_WRITE = self.PRESSURE_WRITE
+
+        for _ in range(self.v_cycles):
+            self._multigrid_v_cycle(0)
+
+        self.PRESSURE_READ = fine.PRESSURE_READ
+        self.PRESSURE_WRITE = fine.PRESSURE_WRITE
+
+        # Same as FluidSimulator, checked once after the last V-cycle
+        self._last_iterations = self.v_cycles
+        self._last_residual = None
+        if self.tolerance > 0.0:
+            self._last_residual = self._max_residual()
+
+    def _multigrid_v_cycle(self, index: int):
+        level = self._multigrid_levels[index]
+
+        if index == len(self._multigrid_levels) - 1:
+            level.smooth(self._multigrid_coarse_iterations)
+            return
+
+        coarse = self._multigrid_levels[index + 1]
+
+        level.smooth(self._multigrid_smoothing)
+
+        level.residual()
+        level.restrict(coarse)
+
+        # Coarse grid correction, starting from zero
+        coarse.pressure_buffer[coarse.PRESSURE_READ].fill(0.0)
+        self._multigrid_v_cycle(index + 1)
+        level.prolongate(coarse)
+
+        level.smooth(self._multigrid_smoothing)
+
+    def _create_multigrid_levels(self):
+        level = NumpyMultigridLevel(
+            self._width,
+            self._height,
+            self._pressure_buffer,
+            self._divergence_buffer,
+            self._solid,
+            self._solid_neighbours,
+        )
+        self._multigrid_levels = [level]
+
+        while min(level.width, level.height) > self._multigrid_coarsest_size:
+            level = level.coarser()
+            self._multigrid_levels.append(level)
+
+    def _set_size(self, width: int, height: int):
+        self._width = width
+        self._height = height
+        self._num_cells = width * height
+
+    def _create_buffers(self):
+        n = self._num_cells
+
+        self._velocity_buffer = [
+            np.zeros((n, 2), dtype=np.float32),
+            np.zeros((n, 2), dtype=np.float32),
+        ]
+        self._pressure_buffer = [np.zeros(n, dtype=np.float32), None]
+        self._divergence_buffer = np.zeros(n, dtype=np.float32)
+        self._vorticity_buffer = np.zeros(n, dtype=np.float32)
+        # One byte per cell, a bit per ObstacleLayer
+        self._obstacles_buffer = np.zeros(n, dtype=np.uint8)
+
+        # Cell coordinates, equivalent to gl_GlobalInvocationID.xy
+        self._cell_x = np.tile(np.arange(self._width, dtype=np.float32), self._height)
+        self._cell_y = np.repeat(np.arange(self._height, dtype=np.float32), self._width)
+
+        # Scratch space, so that a step does not allocate anything
+        self._scalar_tmp = np.zeros((6, n), dtype=np.float32)
+        self._vector_tmp = np.zeros((4, n, 2), dtype=np.float32)
+        self._index_tmp = np.zeros((5, n), dtype=np.intp)
+        self._mask_tmp = np.zeros((3, n), dtype=bool)
+        # Velocities stored in half precision go through it to be rounded
+        self._half_tmp = None
+        if self._precision == Precision.FP16:
+            self._half_tmp = np.zeros(n * 2, dtype=np.float16)
+
+        # Solid cells and their neighbours, refreshed once per update
+        self._solid = np.zeros(n, dtype=bool)
+        self._solid_neighbours = np.zeros((4, n), dtype=bool)
+
+        # The in-place SOR solve does not need a second pressure buffer
+        if self.pressure_solver != PressureSolver.SOR:
+            self._create_pressure_write_buffer()
+
+    def _create_pressure_write_buffer(self):
+        if self._pressure_buffer[self.PRESSURE_WRITE] is None:
+            self._pressure_buffer[self.PRESSURE_WRITE] = np.zeros(
+                self._num_cells, dtype=np.float32
+            )
+
+    def _create_neighbours(self):
+        self._neighbours = create_neighbours(self._width, self._height)
+
+        # Red-black colouring for the SOR solve, (x + y) % 2 == colour
+        colours = (self._cell_x + self._cell_y).astype(np.intp) % 2
+        self._sor_cells = [np.flatnonzero(colours == c) for c in range(2)]
+        self._sor_neighbours = [self._neighbours[:, cells] for cells in self._sor_cells]
+        self._sor_divergence = [
+            np.zeros(cells.shape[0], dtype=np.float32) for cells in self._sor_cells
+        ]
+        self._sor_solid = [
+            np.zeros((4, cells.shape[0]), dtype=bool) for cells in self._sor_cells
+        ]
+
+        borders = np.zeros((self._height, self._width), dtype=bool)
+        borders[0, :] = borders[-1, :] = True
+        borders[:, 0] = borders[:, -1] = True
+        self._borders = borders.ravel()
+
+    def _gather_neighbours(self, field, out):
+        gather_neighbours(field, self._neighbours, out)
+
+    def _splat_distance(self, position: tuple, out):
+        dy = self._scalar_tmp[5]
+
+        np.subtract(self._cell_x, position[0] * self._width, out=out)
+        np.subtract(self._cell_y, position[1] * self._height, out=dy)
+        np.hypot(out, dy, out=out)
+
+    def _add_splat(self, position: tuple, velocity: tuple, radius: float):
+        x = position[0] * self._width
+        y = position[1] * self._height
+
+        x1 = max(int(np.floor(x - radius)), 0)
+        x2 = min(int(np.ceil(x + radius)) + 1, self._width)
+        y1 = max(int(np.floor(y - radius)), 0)
+        y2 = min(int(np.ceil(y + radius)) + 1, self._height)
+        if x1 >= x2 or y1 >= y2:
+            return
+
+        grid = self._velocity_buffer[self.VELOCITY_READ].reshape(
+            self._height, self._width, 2
+        )
+        region = grid[y1:y2, x1:x2]
+
+        cell_x = self._cell_x[x1:x2]
+        cell_y = self._cell_y[y1 * self._width : y2 * self._width : self._width]
+        length = np.hypot(cell_x[None, :] - x, cell_y[:, None] - y)
+        inside = (length <= radius)[:, :, None]
+
+        # val + value * (radius - len) / radius, clamped
+        factor = ((radius - length) / radius)[:, :, None]
+        splat = region + factor * np.asarray(velocity, dtype=np.float32)
+        np.clip(splat, -1.0, 1.0, out=splat)
+        np.copyto(region, splat, where=inside)
+
+        self._round_velocity(region)
+
+    # Cells of the bounds clamped to the grid, as a slice and their coordinates
+    def _bounded_cells(self, bounds: tuple):
+        x_min, y_min, x_max, y_max = bounds
+
+        x1 = max(int(np.floor(x_min)), 0)
+        x2 = min(int(np.ceil(x_max)) + 1, self._width)
+        y1 = max(int(np.floor(y_min)), 0)
+        y2 = min(int(np.ceil(y_max)) + 1, self._height)
+        if x1 >= x2 or y1 >= y2:
+            return None
+
+        cell_x = self._cell_x[x1:x2][None, :]
+        cell_y = self._cell_y[y1 * self._width : y2 * self._width : self._width]
+
+        return (slice(y1, y2), slice(x1, x2)), cell_x, cell_y[:, None]
+
+    def _triangle_edge_sign(self, v1: tuple, v2: tuple, out):
+        # Sign(pt, v1, v2) < 0, with pt in normalised local space
+        px = self._scalar_tmp[3]
+        py = self._scalar_tmp[4]
+        tmp = self._scalar_tmp[5]
+
+        np.divide(self._cell_x, self._width, out=px)
+        np.divide(self._cell_y, self._height, out=py)
+        np.subtract(px, v2[0], out=px)
+        np.subtract(py, v2[1], out=py)
+
+        np.multiply(px, v1[1] - v2[1], out=tmp)
+        np.multiply(py, v1[0] - v2[0], out=px)
+        np.subtract(tmp, px, out=tmp)
+        np.less(tmp, 0.0, out=out)
+
+    def _update_solids(self):
+        np.not_equal(self._obstacles_buffer, 0, out=self._solid)
+
+        self._gather_neighbours(self._solid, self._solid_neighbours)
+
+    def _init_boundaries(self):
+        velocity_in = self._velocity_buffer[self.VELOCITY_READ]
+        np.copyto(velocity_in, 0.0, where=self._borders[:, None])
+
+    def _advect_velocity(self):
+        velocity_in = self._velocity_buffer[self.VELOCITY_READ]
+        velocity_out = self._velocity_buffer[self.VELOCITY_WRITE]
+
+        final_x, final_y, delta_x, delta_y = self._scalar_tmp[:4]
+        left, right, bottom, top = self._index_tmp[:4]
+        lt, rt, lb, rb = self._vector_tmp
+
+        step = self._time_delta * self.speed
+
+        np.multiply(velocity_in[:, 0], step, out=final_x)
+        np.subtract(self._cell_x, final_x, out=final_x)
+        np.multiply(velocity_in[:, 1], step, out=final_y)
+        np.subtract(self._cell_y, final_y, out=final_y)
+
+        self._bilinear_corners(final_x, self._width, left, right, delta_x)
+        self._bilinear_corners(final_y, self._height, bottom, top, delta_y)
+
+        np.multiply(top, self._width, out=top)
+        np.multiply(bottom, self._width, out=bottom)
+
+        self._gather_corner(velocity_in, top, left, lt)
+        self._gather_corner(velocity_in, top, right, rt)
+        self._gather_corner(velocity_in, bottom, left, lb)
+        self._gather_corner(velocity_in, bottom, right, rb)
+
+        # mix(lt, rt, dx) and mix(lb, rb, dx)
+        dx = delta_x[:, None]
+        np.subtract(rt, lt, out=rt)
+        np.multiply(rt, dx, out=rt)
+        np.add(lt, rt, out=lt)
+        np.subtract(rb, lb, out=rb)
+        np.multiply(rb, dx, out=rb)
+        np.add(lb, rb, out=lb)
+
+        # mix(h2, h1, dy)
+        np.subtract(lt, lb, out=lt)
+        np.multiply(lt, delta_y[:, None], out=lt)
+        np.add(lb, lt, out=velocity_out)
+
+        np.multiply(velocity_out, self.dissipation, out=velocity_out)
+        np.clip(velocity_out, -1.0, 1.0, out=velocity_out)
+        np.copyto(velocity_out, 0.0, where=self._solid[:, None])
+
+        self._flip_velocity_buffer()
+
+    def _bilinear_corners(self, coord, size: int, low, high, delta):
+        # ceil/floor clamped to the grid, delta from the clamped lower corner
+        np.floor(coord, out=delta)
+        np.clip(delta, 0, size - 1, out=delta)
+        np.copyto(low, delta, casting="unsafe")
+        np.subtract(coord, delta, out=delta)
+
+        tmp = self._scalar_tmp[5]
+        np.ceil(coord, out=tmp)
+        np.clip(tmp, 0, size - 1, out=tmp)
+        np.copyto(high, tmp, casting="unsafe")
+
+    def _gather_corner(self, field, row, column, out):
+        index = self._index_tmp[4]
+
+        np.add(row, column, out=index)
+        np.take(field, index, axis=0, out=out, mode="clip")
+
+    def _apply_vorticity_confinement(self):
+        # Vorticity confinement 1 - Calculate vorticity
+        self._calc_vorticity()
+
+        # Vorticity confinement 2 - Apply vorticity force
+        self._apply_vorticity()
+        self._flip_velocity_buffer()
+
+    def _calc_vorticity(self):
+        velocity_in = self._velocity_buffer[self.VELOCITY_READ]
+        v_l, v_r, v_b, v_t = self._vector_tmp
+
+        self._gather_neighbours(velocity_in, self._vector_tmp)
+
+        # 0.5 * ((vR.y - vL.y) - (vT.x - vB.x))
+        np.subtract(v_r[:, 1], v_l[:, 1], out=self._vorticity_buffer)
+        np.subtract(self._vorticity_buffer, v_t[:, 0], out=self._vorticity_buffer)
+        np.add(self._vorticity_buffer, v_b[:, 0], out=self._vorticity_buffer)
+        np.multiply(self._vorticity_buffer, 0.5, out=self._vorticity_buffer)
+
+    def _apply_vorticity(self):
+        velocity_in = self._velocity_buffer[self.VELOCITY_READ]
+        velocity_out = self._velocity_buffer[self.VELOCITY_WRITE]
+
+        v_l, v_r, v_b, v_t = self._scalar_tmp[:4]
+        mag_sqr = self._scalar_tmp[4]
+        force = self._vector_tmp[0]
+
+        self._gather_neighbours(self._vorticity_buffer, self._scalar_tmp)
+        for v in (v_l, v_r, v_b, v_t):
+            np.abs(v, out=v)
+
+        np.subtract(v_t, v_b, out=force[:, 0])
+        np.subtract(v_r, v_l, out=force[:, 1])
+        np.multiply(force, 0.5, out=force)
+
+        # force * inversesqrt(max(EPSILON, dot(force, force)))
+        np.multiply(force[:, 0], force[:, 0], out=mag_sqr)
+        np.multiply(force[:, 1], force[:, 1], out=v_l)
+        np.add(mag_sqr, v_l, out=mag_sqr)
+        np.maximum(mag_sqr, 2.4414e-4, out=mag_sqr)
+        np.sqrt(mag_sqr, out=mag_sqr)
+        np.divide(force, mag_sqr[:, None], out=force)
+
+        confinement = self.vorticity * self._time_delta
+        np.multiply(self._vorticity_buffer, confinement, out=mag_sqr)
+        np.multiply(force, mag_sqr[:, None], out=force)
+        np.negative(force[:, 1], out=force[:, 1])
+
+        np.add(velocity_in, force, out=velocity_out)
+
+    def _apply_viscosity(self):
+        velocity_in = self._velocity_buffer[self.VELOCITY_READ]
+        velocity_out = self._velocity_buffer[self.VELOCITY_WRITE]
+
+        centre_factor = 1.0 / self.viscosity
+        stencil_factor = 1.0 / (4.0 + centre_factor)
+
+        self._gather_neighbours(velocity_in, self._vector_tmp)
+
+        np.multiply(velocity_in, centre_factor, out=velocity_out)
+        for v in self._vector_tmp:
+            np.add(velocity_out, v, out=velocity_out)
+        np.multiply(velocity_out, stencil_factor, out=velocity_out)
+
+        self._flip_velocity_buffer()
+
+    def _calc_divergence(self):
+        velocity_in = self._velocity_buffer[self.VELOCITY_READ]
+        v_l, v_r, v_b, v_t = self._vector_tmp
+        obs_l, obs_r, obs_b, obs_t = self._solid_neighbours
+
+        self._gather_neighbours(velocity_in, self._vector_tmp)
+        x1 = v_l[:, 0]
+        x2 = v_r[:, 0]
+        y1 = v_b[:, 1]
+        y2 = v_t[:, 1]
+
+        np.copyto(x1, 0.0, where=obs_l)
+        np.copyto(x2, 0.0, where=obs_r)
+        np.copyto(y1, 0.0, where=obs_b)
+        np.copyto(y2, 0.0, where=obs_t)
+
+        # 0.5 * ((x2 - x1) + (y2 - y1))
+        np.subtract(x2, x1, out=self._divergence_buffer)
+        np.add(self._divergence_buffer, y2, out=self._divergence_buffer)
+        np.subtract(self._divergence_buffer, y1, out=self._divergence_buffer)
+        np.multiply(self._divergence_buffer, 0.5, out=self._divergence_buffer)
+
+    def _gather_pressure_neighbours(self, pressure):
+        neighbours = self._scalar_tmp[:4]
+
+        self._gather_neighbours(pressure, neighbours)
+        for i in range(4):
+            np.copyto(neighbours[i], pressure, where=self._solid_neighbours[i])
+
+        return neighbours
+
+    def _poisson(self):
+        pressure_in = self._pressure_buffer[self.PRESSURE_READ]
+        pressure_out = self._pressure_buffer[self.PRESSURE_WRITE]
+
+        x1, x2, y1, y2 = self._gather_pressure_neighbours(pressure_in)
+
+        # (x1 + x2 + y1 + y2 - b) * rbeta
+        np.add(x1, x2, out=pressure_out)
+        np.add(pressure_out, y1, out=pressure_out)
+        np.add(pressure_out, y2, out=pressure_out)
+        np.subtract(pressure_out, self._divergence_buffer, out=pressure_out)
+        np.multiply(pressure_out, 0.25, out=pressure_out)
+
+    def _subtract_gradient(self):
+        velocity_in = self._velocity_buffer[self.VELOCITY_READ]
+        velocity_out = self._velocity_buffer[self.VELOCITY_WRITE]
+        pressure_in = self._pressure_buffer[self.PRESSURE_READ]
+
+        x1, x2, y1, y2 = self._gather_pressure_neighbours(pressure_in)
+
+        np.subtract(x2, x1, out=x2)
+        np.subtract(y2, y1, out=y2)
+        np.multiply(x2, 0.5, out=velocity_out[:, 0])
+        np.multiply(y2, 0.5, out=velocity_out[:, 1])
+        np.subtract(velocity_in, velocity_out, out=velocity_out)
+
+        self._flip_velocity_buffer()
+
+    # Computations stay in float32, only the stored values are rounded the way
+    # the GPU kernels pack them
+    def _round_velocity(self, velocity):
+        if self._precision == Precision.FP16:
+            # Splat regions are smaller than the grid, the scratch is cut to size
+            half = self._half_tmp[: velocity.size].reshape(velocity.shape)
+            np.copyto(half, velocity)
+            np.copyto(velocity, half)
+
+    def _flip_velocity_buffer(self):
+        self._round_velocity(self._velocity_buffer[self.VELOCITY_WRITE])
+
+        tmp = self.VELOCITY_READ
+        self.VELOCITY_READ = self.VELOCITY_WRITE
+        self.VELOCITY_WRITE = tmp
+
+    def _flip_pressure_buffer(self):
+        tmp = self.PRESSURE_READ
+        self.PRESSURE_READ = self.PRESSURE_WRITE
+        self.PRESSURE_WRITE = tmp
+
+    def destroy(self):
+        # Nothing to release on the CPU, kept for parity with FluidSimulator
+        self._velocity_buffer = None
+        self._pressure_buffer = None
+        self._divergence_buffer = None
+        self._vorticity_buffer = None
+        self._obstacles_buffer = None
+        self._multigrid_levels = None
@@ -0,0 +1,181 @@
+import numpy as np
+
+from natrix.core.utils.numpy_utils import create_neighbours, gather_neighbours
+
+
+class NumpyMultigridLevel:
+    PRESSURE_READ = 0
+    PRESSURE_WRITE = 1
+
+    # Damped Jacobi, plain Jacobi does not smooth the highest frequencies
+    SMOOTHING_WEIGHT = 0.8
+
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        pressure_buffer: list,
+        divergence_buffer,
+        solid,
+        solid_neighbours,
+    ):
+        n = width * height
+
+        self.width = width
+        self.height = height
+        self.num_cells = n
+        self.neighbours = create_neighbours(width, height)
+
+        self.pressure_buffer = pressure_buffer
+        self.divergence_buffer = divergence_buffer
+        self.solid = solid
+        self.solid_neighbours = solid_neighbours
+        self.residual_buffer = np.zeros(n, dtype=np.float32)
+
+        # Filled by coarser(): fine cells of each coarse cell, and the bilinear
+        # stencil used to bring the coarse correction back to this level
+        self.children = None
+        self.prolongation_index = None
+        self.prolongation_weight = None
+
+        self._scalar_tmp = np.zeros((5, n), dtype=np.float32)
+        self._mask_tmp = np.zeros(n, dtype=bool)
+
+    @classmethod
+    def create(cls, width: int, height: int):
+        n = width * height
+
+        return cls(
+            width,
+            height,
+            [np.zeros(n, dtype=np.float32), np.zeros(n, dtype=np.float32)],
+            np.zeros(n, dtype=np.float32),
+            np.zeros(n, dtype=bool),
+            np.zeros((4, n), dtype=bool),
+        )
+
+    @property
+    def memory(self):
+        memory = self.residual_buffer.nbytes
+        if self.children is not None:
+            # Coarse levels own their pressure and divergence buffers
+            memory += sum(buffer.nbytes for buffer in self.pressure_buffer)
+            memory += self.divergence_buffer.nbytes
+        return memory
+
+    def coarser(self):
+        coarse = NumpyMultigridLevel.create(
+            (self.width + 1) // 2, (self.height + 1) // 2
+        )
+
+        # Restriction, same clamped 2x2 footprint as shader.MultigridRestrict.comp
+        cx = np.arange(coarse.width)
+        cy = np.arange(coarse.height)
+        x1 = np.minimum(2 * cx, self.width - 1)[None, :]
+        x2 = np.minimum(2 * cx + 1, self.width - 1)[None, :]
+        y1 = (np.minimum(2 * cy, self.height - 1) * self.width)[:, None]
+        y2 = (np.minimum(2 * cy + 1, self.height - 1) * self.width)[:, None]
+        coarse.children = np.stack(
+            [(y1 + x1).ravel(), (y1 + x2).ravel(), (y2 + x1).ravel(), (y2 + x2).ravel()]
+        ).astype(np.intp)
+
+        # Prolongation, same as shader.MultigridProlongate.comp
+        fx = np.clip((np.arange(self.width) + 0.5) * 0.5 - 0.5, 0, coarse.width - 1)
+        fy = np.clip((np.arange(self.height) + 0.5) * 0.5 - 0.5, 0, coarse.height - 1)
+        left = np.floor(fx).astype(np.intp)
+        bottom = np.floor(fy).astype(np.intp)
+        right = np.minimum(left + 1, coarse.width - 1)
+        top = np.minimum(bottom + 1, coarse.height - 1)
+        dx = (fx - left)[None, :]
+        dy = (fy - bottom)[:, None]
+
+        self.prolongation_index = np.stack(
+            [
+                (top * coarse.width)[:, None] + left[None, :],
+                (top * coarse.width)[:, None] + right[None, :],
+                (bottom * coarse.width)[:, None] + left[None, :],
+                (bottom * coarse.width)[:, None] + right[None, :],
+            ]
+        ).reshape(4, -1)
+        self.prolongation_weight = (
+            np.stack([(1 - dx) * dy, dx * dy, (1 - dx) * (1 - dy), dx * (1 - dy)])
+            .reshape(4, -1)
+            .astype(np.float32)
+        )
+
+        return coarse
+
+    def flip_pressure_buffer(self):
+        tmp = self.PRESSURE_READ
+        self.PRESSURE_READ = self.PRESSURE_WRITE
+        self.PRESSURE_WRITE = tmp
+
+    def smooth(self, iterations: int):
+        for _ in range(iterations):
+            pressure_in = self.pressure_buffer[self.PRESSURE_READ]
+            pressure_out = self.pressure_buffer[self.PRESSURE_WRITE]
+
+            self._jacobi(pressure_in, pressure_out)
+
+            # mix(p, jacobi, weight)
+            np.subtract(pressure_out, pressure_in, out=pressure_out)
+            np.multiply(pressure_out, self.SMOOTHING_WEIGHT, out=pressure_out)
+            np.add(pressure_out, pressure_in, out=pressure_out)
+
+            self.flip_pressure_buffer()
+
+    def residual(self):
+        pressure_in = self.pressure_buffer[self.PRESSURE_READ]
+        tmp = self._scalar_tmp[4]
+
+        # b - (x1 + x2 + y1 + y2 - 4p) == 4 * (p - jacobi)
+        self._jacobi(pressure_in, tmp)
+        np.subtract(pressure_in, tmp, out=self.residual_buffer)
+        np.multiply(self.residual_buffer, 4.0, out=self.residual_buffer)
+        np.copyto(self.residual_buffer, 0.0, where=self.solid)
+
+    def restrict(self, coarse):
+        # The coarse operator has twice the cell spacing, hence the sum instead of
+        # the average of the fine residuals
+        tmp = coarse._scalar_tmp[0]
+        is_solid = coarse._mask_tmp
+
+        coarse.divergence_buffer.fill(0.0)
+        coarse.solid.fill(True)
+
+        for children in coarse.children:
+            np.take(self.residual_buffer, children, out=tmp, mode="clip")
+            np.add(coarse.divergence_buffer, tmp, out=coarse.divergence_buffer)
+
+            np.take(self.solid, children, out=is_solid, mode="clip")
+            np.logical_and(coarse.solid, is_solid, out=coarse.solid)
+
+        gather_neighbours(coarse.solid, coarse.neighbours, coarse.solid_neighbours)
+
+    def prolongate(self, coarse):
+        pressure_in = self.pressure_buffer[self.PRESSURE_READ]
+        pressure_out = self.pressure_buffer[self.PRESSURE_WRITE]
+        coarse_pressure = coarse.pressure_buffer[coarse.PRESSURE_READ]
+        tmp = self._scalar_tmp[0]
+
+        np.copyto(pressure_out, pressure_in)
+        for index, weight in zip(self.prolongation_index, self.prolongation_weight):
+            np.take(coarse_pressure, index, out=tmp, mode="clip")
+            np.multiply(tmp, weight, out=tmp)
+            np.add(pressure_out, tmp, out=pressure_out)
+
+        self.flip_pressure_buffer()
+
+    def _jacobi(self, pressure_in, out):
+        x1, x2, y1, y2 = self._scalar_tmp[:4]
+
+        gather_neighbours(pressure_in, self.neighbours, self._scalar_tmp[:4])
+        for i in range(4):
+            np.copyto(self._scalar_tmp[i], pressure_in, where=self.solid_neighbours[i])
+
+        # (x1 + x2 + y1 + y2 - b) * rbeta
+        np.add(x1, x2, out=out)
+        np.add(out, y1, out=out)
+        np.add(out, y2, out=out)
+        np.subtract(out, self.divergence_buffer, out=out)
+        np.multiply(out, 0.25, out=out)
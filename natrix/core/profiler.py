@@ -0,0 +1,113 @@
+from time import perf_counter
+from typing import Callable, Dict, NamedTuple, Optional
+
+from pybgfx import bgfx
+
+from natrix.core.common.constants import PipelineStage
+
+
+class StageProfile(NamedTuple):
+    # Milliseconds, gpu_time is None when the renderer has no timer queries
+    gpu_time: Optional[float]
+    cpu_time: float
+    dispatches: int
+
+
+class FrameProfile(NamedTuple):
+    frame: int
+    stages: Dict[PipelineStage, StageProfile]
+    gpu_time: Optional[float]
+    cpu_time: float
+    dispatches: int
+
+
+class StartupReport(NamedTuple):
+    # Milliseconds since the start of the constructor
+    construction: float
+    first_step: Optional[float]
+    # Milliseconds each kernel took to load, the ones dispatched so far
+    kernels: Dict[str, float]
+
+
+class Profiler:
+    def __init__(
+        self,
+        first_view: int = 1,
+        on_frame: Optional[Callable[[FrameProfile], None]] = None,
+    ):
+        if first_view < 0 or first_view + len(PipelineStage) > 255:
+            raise ValueError("'First view' leaves no room for the pipeline stages")
+
+        self.first_view = first_view
+        self.on_frame = on_frame
+        self.last_frame = None
+
+        self._frame = 0
+
+        self._stage = None
+        self._start = 0.0
+        self._cpu_time = [0.0] * len(PipelineStage)
+        self._dispatches = [0] * len(PipelineStage)
+
+        for stage in PipelineStage:
+            bgfx.setViewName(self.view(stage), f"Natrix {stage.name.title()}")
+
+    def view(self, stage: PipelineStage):
+        return self.first_view + stage
+
+    def begin(self, stage: PipelineStage):
+        self._stage = stage
+        self._start = perf_counter()
+
+        return self.view(stage)
+
+    def end(self):
+        self._cpu_time[self._stage] += perf_counter() - self._start
+        self._stage = None
+
+    def count_dispatch(self):
+        if self._stage is not None:
+            self._dispatches[self._stage] += 1
+
+    # Call after bgfx.frame(), per-view GPU times need BGFX_DEBUG_PROFILER
+    def collect(self):
+        stats = bgfx.getStats()
+
+        gpu_time = {}
+        if stats.gpuTimerFreq > 0:
+            for i in range(stats.numViews):
+                view_stats = stats.viewStats[i]
+                stage = view_stats.view - self.first_view
+
+                if 0 <= stage < len(PipelineStage):
+                    gpu_time[stage] = (
+                        (view_stats.gpuTimeEnd - view_stats.gpuTimeBegin)
+                        * 1000.0
+                        / stats.gpuTimerFreq
+                    )
+
+        stages = {}
+        for stage in PipelineStage:
+            if self._dispatches[stage] > 0:
+                stages[stage] = StageProfile(
+                    gpu_time.get(stage),
+                    self._cpu_time[stage] * 1000.0,
+                    self._dispatches[stage],
+                )
+
+        self.last_frame = FrameProfile(
+            self._frame,
+            stages,
+            sum(gpu_time.values()) if gpu_time else None,
+            sum(stage.cpu_time for stage in stages.values()),
+            sum(stage.dispatches for stage in stages.values()),
+        )
+
+        self._frame += 1
+        self._cpu_time = [0.0] * len(PipelineStage)
+        self._dispatches = [0] * len(PipelineStage)
+
+        if self.on_frame is not None:
+            self.on_frame(self.last_frame)
+
+        return self.last_frame
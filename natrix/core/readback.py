@@ -0,0 +1,118 @@
+from concurrent.futures import Future
+
+import numpy as np
+from pybgfx import bgfx
+from pybgfx.constants import (
+    BGFX_TEXTURE_BLIT_DST,
+    BGFX_TEXTURE_COMPUTE_WRITE,
+    BGFX_TEXTURE_READ_BACK,
+)
+from pybgfx.utils import as_void_ptr
+
+
+class ReadbackSlot:
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        texture_format: bgfx.TextureFormat,
+        dtype,
+        channels: int,
+    ):
+        # Written by a compute kernel, then blitted to the CPU readable copy
+        self.texture = bgfx.createTexture2D(
+            width, height, False, 1, texture_format, BGFX_TEXTURE_COMPUTE_WRITE
+        )
+        self.readback = bgfx.createTexture2D(
+            width,
+            height,
+            False,
+            1,
+            texture_format,
+            BGFX_TEXTURE_BLIT_DST | BGFX_TEXTURE_READ_BACK,
+        )
+        self.data = np.zeros((height, width, channels), dtype)
+
+        # Frame number at which the data is in host memory, None when free
+        self.frame = None
+        self.future = None
+
+    def destroy(self):
+        if self.future is not None:
+            self.future.cancel()
+
+        bgfx.destroy(self.texture)
+        bgfx.destroy(self.readback)
+
+
+# Staging textures used round robin. A readback lands a couple of frames after
+# its copy, with a few slots in flight a field can be sampled every frame
+# without waiting on the GPU
+class ReadbackRing:
+    def __init__(
+        self,
+        width: int,
+        height: int,
+        texture_format: bgfx.TextureFormat,
+        dtype=np.float32,
+        channels: int = 1,
+        components: int = 1,
+        slots: int = 3,
+        view: int = 255,
+    ):
+        if slots <= 0:
+            raise ValueError("'Slots' should be greater than zero")
+
+        # Blits run before the dispatches of their view, so this one should come
+        # after the views the copies are dispatched in
+        self.view = view
+        self.components = components
+
+        self._slots = [
+            ReadbackSlot(width, height, texture_format, dtype, channels)
+            for _ in range(slots)
+        ]
+        self._next = 0
+
+    @property
+    def pending(self):
+        return sum(slot.frame is not None for slot in self._slots)
+
+    # The slot whose texture the next copy should write, None while every slot
+    # is still in flight. Slots complete in order, so the next one is the oldest
+    def acquire(self):
+        slot = self._slots[self._next]
+        if slot.frame is not None:
+            return None
+
+        return slot
+
+    # Call once the copy to slot.texture has been dispatched
+    def submit(self, slot: ReadbackSlot):
+        bgfx.blit(self.view, slot.readback, 0, 0, slot.texture)
+        slot.frame = bgfx.readTexture(slot.readback, as_void_ptr(slot.data))
+        slot.future = Future()
+
+        self._next = (self._next + 1) % len(self._slots)
+
+        return slot.future
+
+    # Call after bgfx.frame(), with the frame number it returned
+    def poll(self, frame: int):
+        for slot in self._slots:
+            if slot.frame is None or frame < slot.frame:
+                continue
+
+            if self.components == 1:
+                data = slot.data[..., 0].copy()
+            else:
+                data = slot.data[..., : self.components].copy()
+
+            future = slot.future
+            slot.frame = None
+            slot.future = None
+            future.set_result(data)
+
+    def destroy(self):
+        for slot in self._slots:
+            slot.destroy()
@@ -0,0 +1,246 @@
+import json
+import queue
+import threading
+import zlib
+from pathlib import Path
+from time import perf_counter
+from typing import NamedTuple, Sequence
+
+import numpy as np
+
+from natrix.core.common.constants import Field
+
+# Per field: <name>.bin holds the frames, raw (a memory-mappable array of
+# frames) or one zlib chunk per frame, <name>.idx a record per frame
+INDEX_DTYPE = np.dtype([("step", "<i8"), ("offset", "<i8"), ("length", "<i8")])
+
+
+class RecorderStats(NamedTuple):
+    # Frames queued for the writer, and the ones written so far
+    recorded: int
+    written: int
+    # Frames lost because the queue was full, the writer is falling behind
+    dropped: int
+    # Samples skipped, all the staging slots were in flight or the readback was
+    # cancelled by destroy
+    skipped: int
+    queued: int
+    max_queued: int
+    # Milliseconds the writer spent on disk I/O and compression
+    write_time: float
+    bytes_written: int
+
+
+# Records every Nth frame of some fields. Frames arrive through the readback
+# futures, on the thread calling poll_readback, and only ever wait in a bounded
+# queue: when the writer thread falls behind they are dropped and counted
+class FieldRecorder:
+    def __init__(
+        self,
+        path: Path,
+        every: int = 1,
+        queue_size: int = 16,
+        compress: bool = False,
+        compression_level: int = 1,
+    ):
+        if every <= 0:
+            raise ValueError("'Every' should be greater than zero")
+        if queue_size <= 0:
+            raise ValueError("'Queue size' should be greater than zero")
+
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.every = every
+        self.compress = compress
+        self.compression_level = compression_level
+
+        self._queue = queue.Queue(queue_size)
+        self._lock = threading.Lock()
+        self._fields = {}
+        self._files = {}
+        self._error = None
+
+        self._recorded = 0
+        self._written = 0
+        self._dropped = 0
+        self._skipped = 0
+        self._max_queued = 0
+        self._write_time = 0.0
+        self._bytes_written = 0
+
+        self._thread = threading.Thread(
+            target=self._write_frames, name="natrix-recorder", daemon=True
+        )
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def stats(self):
+        with self._lock:
+            return RecorderStats(
+                self._recorded,
+                self._written,
+                self._dropped,
+                self._skipped,
+                self._queue.qsize(),
+                self._max_queued,
+                self._write_time * 1000.0,
+                self._bytes_written,
+            )
+
+    # Reads the fields of a FluidSimulator back on every Nth step
+    def sample(self, simulator, step: int, fields: Sequence[Field] = (Field.VELOCITY,)):
+        if step % self.every != 0:
+            return
+
+        for field in fields:
+            field = Field(field)
+            self.record(field.name.lower(), step, simulator.read_field(field))
+
+    # future is a readback Future of an array, e.g. from read_field, None counts
+    # as a skipped sample
+    def record(self, name: str, step: int, future):
+        if future is None:
+            with self._lock:
+                self._skipped += 1
+            return
+
+        future.add_done_callback(lambda f: self._enqueue(name, step, f))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+        for data, index in self._files.values():
+            data.close()
+            index.close()
+        self._files.clear()
+
+        if self._error is not None:
+            raise self._error
+
+    def _enqueue(self, name: str, step: int, future):
+        if future.cancelled() or future.exception() is not None:
+            with self._lock:
+                self._skipped += 1
+            return
+
+        with self._lock:
+            try:
+                self._queue.put_nowait((name, step, future.result()))
+            except queue.Full:
+                self._dropped += 1
+                return
+
+            self._recorded += 1
+            self._max_queued = max(self._max_queued, self._queue.qsize())
+
+    def _write_frames(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is not None:
+                continue
+
+            name, step, frame = item
+            start = perf_counter()
+            try:
+                written = self._write_frame(name, step, frame)
+            except Exception as e:
+                self._error = e
+                continue
+
+            with self._lock:
+                self._written += 1
+                self._write_time += perf_counter() - start
+                self._bytes_written += written
+
+    def _write_frame(self, name: str, step: int, frame: np.ndarray):
+        frame = np.ascontiguousarray(frame)
+
+        if name not in self._fields:
+            self._fields[name] = {
+                "dtype": frame.dtype.str,
+                "shape": list(frame.shape),
+                "compressed": self.compress,
+            }
+            self._files[name] = (
+                open(self.path / f"{name}.bin", "wb"),
+                open(self.path / f"{name}.idx", "wb"),
+            )
+            (self.path / "recording.json").write_text(
+                json.dumps({"fields": self._fields}, indent=2)
+            )
+        elif list(frame.shape) != self._fields[name]["shape"]:
+            raise ValueError(f"'{name}' frames should all have the same shape")
+
+        data_file, index_file = self._files[name]
+        chunk = frame.data.cast("B")
+        if self.compress:
+            chunk = zlib.compress(chunk, self.compression_level)
+
+        record = np.array([(step, data_file.tell(), len(chunk))], INDEX_DTYPE)
+        data_file.write(chunk)
+        index_file.write(record.tobytes())
+
+        # Readers see whole frames only, the record comes after its data
+        data_file.flush()
+        index_file.flush()
+
+        return len(chunk) + record.nbytes
+
+
+class RecordedField:
+    def __init__(
+        self, path: Path, name: str, dtype: str, shape: list, compressed: bool
+    ):
+        self.name = name
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(shape)
+        self.compressed = compressed
+
+        self._index = np.fromfile(path / f"{name}.idx", INDEX_DTYPE)
+        self._data_path = path / f"{name}.bin"
+
+    @property
+    def steps(self):
+        return self._index["step"]
+
+    def __len__(self):
+        return len(self._index)
+
+    def __getitem__(self, i: int):
+        if not self.compressed:
+            return self.frames[i]
+
+        with open(self._data_path, "rb") as f:
+            f.seek(int(self._index[i]["offset"]))
+            chunk = zlib.decompress(f.read(int(self._index[i]["length"])))
+
+        return np.frombuffer(chunk, self.dtype).reshape(self.shape)
+
+    # Every frame as one (frames, *shape) memory map, uncompressed fields only
+    @property
+    def frames(self):
+        if self.compressed:
+            raise ValueError(f"'{self.name}' is compressed, read it frame by frame")
+        if len(self) == 0:
+            return np.zeros((0, *self.shape), self.dtype)
+
+        return np.memmap(
+            self._data_path, self.dtype, mode="r", shape=(len(self), *self.shape)
+        )
+
+
+# Maps field names to RecordedField, also while the recording is being written
+def read_recording(path: Path):
+    path = Path(path)
+    fields = json.loads((path / "recording.json").read_text())["fields"]
+
+    return {name: RecordedField(path, name, **entry) for name, entry in fields.items()}
@@ -0,0 +1,142 @@
+from time import perf_counter
+from typing import Callable, NamedTuple, Optional
+
+
+class StepReport(NamedTuple):
+    substeps: int
+    # Seconds of simulated time per substep
+    time_step: float
+    # Substeps were merged into fewer, larger ones to stay within the budget
+    merged: bool
+    # Seconds of wall-clock time dropped, over the frame budget or past
+    # max_frame_time of backlog. The simulation runs slower than real time
+    skipped: float
+    # The CFL limited substep, None until the first max velocity has been read
+    stable_step: Optional[float]
+
+
+# Splits wall-clock time into substeps of at most time_step seconds. With a cfl
+# number, substeps also move the fastest cell by at most that many cells, using
+# the max velocity measured on the GPU a couple of frames earlier. Leftover time
+# is carried over to the next frame, up to max_frame_time of it. Substeps over
+# max_substeps are merged into larger stable ones, or carried over. Under load,
+# the substeps that do not fit in the frame budget are merged, or skipped
+class StepScheduler:
+    def __init__(
+        self,
+        simulator,
+        time_step: float = 1.0 / 60.0,
+        cfl: Optional[float] = 1.0,
+        max_substeps: int = 4,
+        frame_budget: Optional[float] = None,
+        max_frame_time: float = 0.25,
+        on_step: Optional[Callable[[float], None]] = None,
+    ):
+        if time_step <= 0.0:
+            raise ValueError("'Time step' should be greater than zero")
+        if cfl is not None and cfl <= 0.0:
+            raise ValueError("'CFL' should be greater than zero")
+        if max_substeps <= 0:
+            raise ValueError("'Max substeps' should be greater than zero")
+
+        self.simulator = simulator
+        self.time_step = time_step
+        self.cfl = cfl
+        self.max_substeps = max_substeps
+        # Seconds per frame the substeps may take, None to always run max_substeps
+        self.frame_budget = frame_budget
+        # Longer frames (hitches, breakpoints) are clamped to this many seconds
+        self.max_frame_time = max_frame_time
+        # Called after each substep with its time step, e.g. to advect particles
+        self.on_step = on_step
+
+        self._accumulator = 0.0
+        self._substep_time = None
+
+    # Seconds per substep moving the fastest cell by cfl cells
+    @property
+    def stable_step(self):
+        max_velocity = self.simulator.max_velocity
+        if self.cfl is None or max_velocity is None:
+            return None
+
+        displacement = max_velocity * self.simulator.speed
+        if displacement <= 0.0:
+            return None
+
+        return self.cfl / displacement
+
+    # Seconds a substep takes to submit, averaged over the previous frames
+    @property
+    def substep_time(self):
+        return self._substep_time
+
+    # Call once per frame with the wall-clock seconds since the previous call.
+    # Call poll_readback of the simulator after bgfx.frame(), the max velocity
+    # arrives through it
+    def advance(self, elapsed: float):
+        self._accumulator += min(elapsed, self.max_frame_time)
+
+        stable_step = self.stable_step
+        time_step = self.time_step
+        if stable_step is not None:
+            time_step = min(time_step, stable_step)
+
+        substeps = int(self._accumulator / time_step)
+        allowed = self._allowed_substeps()
+
+        merged = False
+        if substeps > allowed:
+            # Fewer, larger substeps, as large as the stability limit allows
+            limit = time_step if stable_step is None else stable_step
+            larger = min(self._accumulator / allowed, limit)
+            merged = larger > time_step
+            time_step = larger
+            substeps = allowed
+
+        start = perf_counter()
+        for _ in range(substeps):
+            self.simulator.update(time_step)
+            if self.on_step is not None:
+                self.on_step(time_step)
+            self._accumulator -= time_step
+
+        if substeps > 0:
+            self._measure(perf_counter() - start, substeps)
+
+        # What does not fit in the frame budget is dropped, instead of piling up
+        # frame after frame. Otherwise it is carried over, like a hitch
+        skipped = 0.0
+        if allowed < self.max_substeps and self._accumulator >= time_step:
+            skipped = self._accumulator
+            self._accumulator = 0.0
+        elif self._accumulator > self.max_frame_time:
+            skipped = self._accumulator - self.max_frame_time
+            self._accumulator = self.max_frame_time
+
+        if self.cfl is not None:
+            self.simulator.measure_max_velocity()
+
+        return StepReport(substeps, time_step, merged, skipped, stable_step)
+
+    def _allowed_substeps(self):
+        if self.frame_budget is None or self._substep_time is None:
+            return self.max_substeps
+
+        fitting = int(self.frame_budget / self._substep_time)
+        return max(1, min(self.max_substeps, fitting))
+
+    def _measure(self, elapsed: float, substeps: int):
+        substep_time = elapsed / substeps
+
+        # GPU time of the frame, when the simulator is being profiled
+        profiler = self.simulator.profiler
+        if profiler is not None and profiler.last_frame is not None:
+            gpu_time = profiler.last_frame.gpu_time
+            if gpu_time is not None:
+                substep_time = max(substep_time, gpu_time / 1000.0 / substeps)
+
+        if self._substep_time is None:
+            self._substep_time = substep_time
+        else:
+            self._substep_time += 0.1 * (substep_time - self._substep_time)
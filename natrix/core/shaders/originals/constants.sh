@@ -1,10 +1,20 @@
 #ifndef CONSTANTS_SH_HEADER_GUARD
 #define CONSTANTS_SH_HEADER_GUARD
 
-// workgroup size of the culling compute shader
+// workgroup size of the kernels, set by the simulator when not 16x16
 // D3D compute shaders only allow up to 1024 threads per workgroup
 // GL_MAX_COMPUTE_WORK_GROUP_INVOCATIONS also only guarantees 1024
-#define GROUP_SIZE 16
+#ifndef GROUP_SIZE_X
+#define GROUP_SIZE_X 16
+#endif
+#ifndef GROUP_SIZE_Y
+#define GROUP_SIZE_Y 16
+#endif
+#define GROUP_THREADS (GROUP_SIZE_X * GROUP_SIZE_Y)
+
+// Jacobi iterations the tiled Poisson kernel can run per dispatch, also the
+// width of its halo
+#define TILED_SWEEPS 4
 
 #define VELOCITY_IN 1
 #define VELOCITY_OUT 2
@@ -16,5 +26,47 @@
 #define GENERIC 8
 #define PARTICLES_IN 9
 #define PARTICLES_OUT 10
+#define RESIDUAL 11
+
+// Slots past RESIDUAL are shared by the kernels of different features, see
+// ScratchSlots in constants.py
+#define COARSE_PRESSURE 12
+#define COARSE_DIVERGENCE 13
+#define COARSE_OBSTACLES 14
+
+// Velocity storage, NATRIX_FP16 packs both components as halves in a uint
+#if NATRIX_FP16
+#define VELOCITY_TYPE uint
+#define LOAD_VELOCITY(_value) unpackHalf2x16(_value)
+#define STORE_VELOCITY(_value) packHalf2x16(_value)
+#else
+#define VELOCITY_TYPE vec2
+#define LOAD_VELOCITY(_value) (_value)
+#define STORE_VELOCITY(_value) (_value)
+#endif
+
+// Bits of the obstacles buffer, one uint per cell
+#define OBSTACLE_DYNAMIC 1u
+#define OBSTACLE_STATIC 2u
+
+// Only bound by the convergence check kernels
+#define RESIDUAL_PARTIALS 12
+#define INDIRECT_ARGS 13
+#define CONVERGENCE_STATE 14
+#define CONVERGENCE_STATS 15
+
+// Only bound by the batched splat kernels
+#define SPLATS 12
+
+// Only bound by the obstacle scene kernel
+#define OBSTACLE_PRIMITIVES 12
+#define OBSTACLE_TILES 13
+#define OBSTACLE_TILE_PRIMITIVES 14
+
+// Only bound by the readback kernels, the field itself is bound at GENERIC
+#define READBACK 15
+
+// Only bound by the max velocity kernels, which also write to READBACK
+#define MAX_VELOCITY_PARTIALS 12
 
 #endif // CONSTANTS_SH_HEADER_GUARD
\ No newline at end of file
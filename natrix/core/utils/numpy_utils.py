@@ -0,0 +1,23 @@
+import numpy as np
+
+
+def create_neighbours(width: int, height: int):
+    # Same clamped stencil as GetNeighbours() in common.sh
+    x = np.arange(width)
+    y = np.arange(height)
+    max_x = width - 1
+    max_y = height - 1
+
+    left = np.clip(x - 1, 0, max_x)[None, :] + (y * width)[:, None]
+    right = np.clip(x + 1, 0, max_x)[None, :] + (y * width)[:, None]
+    bottom = x[None, :] + (np.clip(y - 1, 0, max_y) * width)[:, None]
+    top = x[None, :] + (np.clip(y + 1, 0, max_y) * width)[:, None]
+
+    return np.stack([left.ravel(), right.ravel(), bottom.ravel(), top.ravel()]).astype(
+        np.intp
+    )
+
+
+def gather_neighbours(field, neighbours, out):
+    for i in range(4):
+        np.take(field, neighbours[i], axis=0, out=out[i], mode="clip")
@@ -0,0 +1,119 @@
+from math import ceil, floor
+
+# Obstacles in normalised local space, circle radii in world space (cells), the
+# same conventions as add_circle_obstacle and add_triangle_obstacle
+
+CIRCLE = 0.0
+TRIANGLE = 1.0
+
+
+def circle_bounds(position: tuple, radius: float, width: int, height: int):
+    x = position[0] * width
+    y = position[1] * height
+
+    return x - radius, y - radius, x + radius, y + radius
+
+
+def triangle_bounds(p1: tuple, p2: tuple, p3: tuple, width: int, height: int):
+    xs = [p[0] * width for p in (p1, p2, p3)]
+    ys = [p[1] * height for p in (p1, p2, p3)]
+
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def union_bounds(bounds: list):
+    return (
+        min(b[0] for b in bounds),
+        min(b[1] for b in bounds),
+        max(b[2] for b in bounds),
+        max(b[3] for b in bounds),
+    )
+
+
+# Cells of the box (in cells, inclusive) clamped to the grid, as the offset of the
+# first cell and the number of workgroups. None when the box is outside the grid
+def bounding_box_groups(
+    x_min: float,
+    y_min: float,
+    x_max: float,
+    y_max: float,
+    width: int,
+    height: int,
+    group_size: tuple,
+):
+    x1 = max(int(floor(x_min)), 0)
+    y1 = max(int(floor(y_min)), 0)
+    x2 = min(int(ceil(x_max)), width - 1)
+    y2 = min(int(ceil(y_max)), height - 1)
+
+    if x1 > x2 or y1 > y2:
+        return None
+
+    return (
+        x1,
+        y1,
+        int(ceil((x2 - x1 + 1) / float(group_size[0]))),
+        int(ceil((y2 - y1 + 1) / float(group_size[1]))),
+    )
+
+
+# Same test as IsPointInTriangle in the shaders, also works on NumPy arrays
+def point_in_triangle(pt: tuple, v1: tuple, v2: tuple, v3: tuple):
+    b1 = _sign(pt, v1, v2) < 0.0
+    b2 = _sign(pt, v2, v3) < 0.0
+    b3 = _sign(pt, v3, v1) < 0.0
+    return (b1 == b2) & (b2 == b3)
+
+
+def _sign(p1: tuple, p2: tuple, p3: tuple):
+    return (p1[0] - p3[0]) * (p2[1] - p3[1]) - (p2[0] - p3[0]) * (p1[1] - p3[1])
+
+
+# Triangles of an indexed mesh, indices is a flat sequence of vertex triplets
+def mesh_triangles(vertices, indices):
+    if len(indices) % 3:
+        raise ValueError("'Indices' should be a multiple of three")
+
+    return [
+        (vertices[indices[i]], vertices[indices[i + 1]], vertices[indices[i + 2]])
+        for i in range(0, len(indices), 3)
+    ]
+
+
+# Two vec4 per primitive: (a, b) and (c, radius, type). Circles use a as centre
+def pack_primitives(circles, triangles):
+    primitives = []
+
+    for position, radius in circles:
+        primitives += [position[0], position[1], 0.0, 0.0, 0.0, 0.0, radius, CIRCLE]
+    for p1, p2, p3 in triangles:
+        primitives += [p1[0], p1[1], p2[0], p2[1], p3[0], p3[1], 0.0, TRIANGLE]
+
+    return primitives
+
+
+# Lists the primitives overlapping each tile of the dispatched region, so a
+# workgroup only tests those. Returns a (start, count) pair per tile, row
+# major, and the concatenated primitive indices
+def bin_primitives(bounds: list, region: tuple, tile_size: tuple):
+    offset_x, offset_y, tiles_x, tiles_y = region
+    tile_width, tile_height = tile_size
+    bins = [[] for _ in range(tiles_x * tiles_y)]
+
+    for index, (x_min, y_min, x_max, y_max) in enumerate(bounds):
+        tx1 = max(int((x_min - offset_x) // tile_width), 0)
+        ty1 = max(int((y_min - offset_y) // tile_height), 0)
+        tx2 = min(int((x_max - offset_x) // tile_width), tiles_x - 1)
+        ty2 = min(int((y_max - offset_y) // tile_height), tiles_y - 1)
+
+        for ty in range(ty1, ty2 + 1):
+            for tx in range(tx1, tx2 + 1):
+                bins[ty * tiles_x + tx].append(index)
+
+    ranges = []
+    indices = []
+    for tile in bins:
+        ranges += [len(indices), len(tile)]
+        indices += tile
+
+    return ranges, indices
@@ -0,0 +1,76 @@
+from math import ceil
+
+import numpy as np
+
+# Signed distance fields are in cells, negative inside the obstacles, sampled
+# at the cell coordinates used by the kernels (cell x, y is at x, y)
+
+
+def mask_sdf(mask, max_distance: float = 16.0):
+    # mask is (height, width), True inside the obstacles. Exact up to
+    # max_distance, clamped beyond that
+    mask = np.asarray(mask, dtype=bool)
+
+    outside = _distance_to(mask, max_distance)
+    inside = _distance_to(~mask, max_distance)
+
+    # The surface lies half way between a solid cell and a fluid one
+    sdf = np.where(mask, 0.5 - inside, outside - 0.5)
+    return np.clip(sdf, -max_distance, max_distance).astype(np.float32)
+
+
+def polygon_sdf(polygons, width: int, height: int):
+    # polygons is a sequence of vertex lists in normalised local space, inside
+    # follows the even-odd rule. Exact, the cost grows with edges x cells
+    x = np.arange(width, dtype=np.float32)[None, :]
+    y = np.arange(height, dtype=np.float32)[:, None]
+
+    distance = np.full((height, width), np.inf, dtype=np.float32)
+    inside = np.zeros((height, width), dtype=bool)
+
+    for polygon in polygons:
+        points = [(p[0] * width, p[1] * height) for p in polygon]
+
+        for (x1, y1), (x2, y2) in zip(points, points[1:] + points[:1]):
+            np.minimum(distance, _segment_distance(x, y, x1, y1, x2, y2), out=distance)
+
+            # Crossing number, edges crossing the horizontal ray towards +x
+            if y1 != y2:
+                crosses = (y1 > y) != (y2 > y)
+                x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+                inside ^= crosses & (x < x_cross)
+
+    return np.where(inside, -distance, distance)
+
+
+def _segment_distance(x, y, x1: float, y1: float, x2: float, y2: float):
+    dx = x2 - x1
+    dy = y2 - y1
+    length_sqr = dx * dx + dy * dy
+
+    if length_sqr > 0.0:
+        t = np.clip(((x - x1) * dx + (y - y1) * dy) / length_sqr, 0.0, 1.0)
+    else:
+        t = 0.0
+
+    return np.hypot(x - (x1 + t * dx), y - (y1 + t * dy))
+
+
+def _distance_to(seeds, max_distance: float):
+    height, width = seeds.shape
+    far = float(width + height)
+
+    # Along x, from the nearest seed on the left and on the right of each row
+    index = np.arange(width, dtype=np.float64)[None, :]
+    left = np.maximum.accumulate(np.where(seeds, index, -far), axis=1)
+    right = np.minimum.accumulate(np.where(seeds, index, 2 * far)[:, ::-1], axis=1)
+    right = right[:, ::-1]
+    row_sqr = np.minimum(index - left, right - index) ** 2
+
+    # Along y, only rows closer than max_distance can hold a nearer seed
+    distance_sqr = row_sqr.copy()
+    for k in range(1, min(int(ceil(max_distance)), height - 1) + 1):
+        np.minimum(distance_sqr[k:], row_sqr[:-k] + k * k, out=distance_sqr[k:])
+        np.minimum(distance_sqr[:-k], row_sqr[k:] + k * k, out=distance_sqr[:-k])
+
+    return np.sqrt(distance_sqr)
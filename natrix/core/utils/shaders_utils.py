@@ -1,7 +1,45 @@
-from ctypes import sizeof, c_float
+from concurrent.futures import Executor
+from ctypes import c_float, sizeof
+from functools import lru_cache
+import hashlib
+import mmap
+import os
+from pathlib import Path
+import platform
+import shutil
+import subprocess
+import tempfile
+import threading
+from time import perf_counter, time
+from typing import Optional
 
+from decouple import config
+import numpy as np
+import pybgfx
 from pybgfx import bgfx
 from pybgfx.constants import BGFX_BUFFER_COMPUTE_READ_WRITE
+from pybgfx.utils import as_void_ptr
+from pybgfx.utils.shaders_utils import ShaderType
+
+# Compiled shaders, one file per source hash, shared by every variant and process
+shader_cache_path = Path(
+    config("NATRIX__SHADER_CACHE", default=str(Path.home() / ".natrix" / "shaders"))
+)
+
+# Chunk magic of the bgfx shader binaries
+SHADER_MAGICS = (b"CSH", b"VSH", b"FSH")
+
+# The shaderc build and the headers shipped with pybgfx
+_pybgfx_path = Path(pybgfx.__file__).parent
+shaderc_path = (
+    _pybgfx_path
+    / "bin"
+    / ("shadercRelease.exe" if platform.system() == "Windows" else "shadercRelease")
+)
+shader_include_path = _pybgfx_path / "include" / "shaders"
+
+# Variants not used for this long are deleted by the next shader_variant_path
+variant_max_age = 7 * 24 * 60 * 60
 
 
 def create_buffer(length: int, dimensions: int, vertex_layout: bgfx.VertexLayout):
@@ -10,3 +48,304 @@ def create_buffer(length: int, dimensions: int, vertex_layout: bgfx.VertexLayout
         vertex_layout,
         BGFX_BUFFER_COMPUTE_READ_WRITE,
     )
+
+
+# Hands a contiguous NumPy array to bgfx without copying it. bgfx only reads it
+# when the frame is processed, so it has to stay alive and unchanged for the
+# next two bgfx.frame() calls
+def update_buffer_reference(handle, array: np.ndarray):
+    bgfx.update(handle, 0, bgfx.makeRef(as_void_ptr(array), array.nbytes))
+
+
+# load_shader can not pass defines to shaderc, so a variant is compiled from a
+# copy of the sources with the defines prepended, other files (headers, varying
+# definitions) are copied as they are. Returns root_path when there are no defines
+def shader_variant_path(root_path: Path, defines: dict):
+    if not defines:
+        return root_path
+
+    header = "".join(
+        f"#define {name} {value}\n" for name, value in sorted(defines.items())
+    )
+    key = hashlib.sha1(f"{root_path.resolve()}\n{header}".encode()).hexdigest()[:16]
+    variants_path = Path(tempfile.gettempdir()) / "natrix" / "shaders"
+    variant_path = variants_path / key
+    variant_path.mkdir(parents=True, exist_ok=True)
+    # Marks the variant as used, see _remove_stale_variants
+    os.utime(variant_path)
+
+    for source in root_path.iterdir():
+        if not source.is_file():
+            continue
+
+        text = source.read_text()
+        if source.suffix in (".comp", ".vert", ".frag"):
+            # After the $input / $output declarations of vertex and fragment shaders
+            lines = text.splitlines(keepends=True)
+            start = 0
+            while start < len(lines) and lines[start].startswith("$"):
+                start += 1
+            text = "".join(lines[:start]) + header + "".join(lines[start:])
+
+        target = variant_path / source.name
+        if not target.exists() or target.read_text() != text:
+            # Renamed into place, a concurrent compile never reads a partial file
+            temp_file = target.with_name(
+                f".{target.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+            )
+            temp_file.write_text(text)
+            os.replace(temp_file, target)
+
+    _remove_stale_variants(variants_path)
+
+    return variant_path
+
+
+def _remove_stale_variants(variants_path: Path):
+    expired = time() - variant_max_age
+    for variant_path in variants_path.iterdir():
+        try:
+            if variant_path.is_dir() and variant_path.stat().st_mtime < expired:
+                shutil.rmtree(variant_path, ignore_errors=True)
+        except OSError:
+            # Removed by another process in the meantime
+            pass
+
+
+# Same as load_shader, with a cache keyed by the contents of the shader and of
+# the headers next to it (defines and group size included, see
+# shader_variant_path), the shader type and the renderer. load_shader only
+# hashes the shader itself, and compiles again on every cold start
+def load_cached_shader(name: str, shader_type: ShaderType, root_path: Path):
+    return create_shader(name, shader_blob(name, shader_type, root_path))
+
+
+# The compiled shader, from the cache or shaderc. Once renderer is given (a name
+# from bgfx.getRendererName) it makes no bgfx calls, shaderc is run with the
+# profile of that renderer, so it can run on any thread
+def shader_blob(
+    name: str, shader_type: ShaderType, root_path: Path, renderer: Optional[str] = None
+):
+    if renderer is None:
+        renderer = bgfx.getRendererName(bgfx.getRendererType())
+
+    source_path = (Path(root_path) / name).absolute()
+    key = _shader_key(source_path, shader_type, renderer)
+    cache_file = shader_cache_path / f"{key}.bin"
+
+    data = _read_cached_shader(cache_file)
+    if data is None:
+        data = compile_shader(source_path, shader_type, renderer)
+        _write_cached_shader(cache_file, data)
+
+    return data
+
+
+# The shaderc profile for a renderer name, the same choice pybgfx makes for the
+# current renderer
+def shader_profile(shader_type: ShaderType, renderer: str):
+    system = platform.system()
+    if system == "Darwin":
+        return "metal"
+    if system == "Linux":
+        return "spirv" if renderer == "Vulkan" else "glsl"
+    if system == "Windows":
+        prefix = {
+            ShaderType.FRAGMENT: "ps_",
+            ShaderType.VERTEX: "vs_",
+            ShaderType.COMPUTE: "cs_",
+        }[shader_type]
+        return prefix + ("3_0" if renderer == "Direct3D 9" else "5_0")
+
+    raise ValueError(f"'{system}' is not supported")
+
+
+# Same options as pybgfx compile_shader, which asks bgfx for the renderer, and
+# returns the compiled shader
+def compile_shader(source_path: Path, shader_type: ShaderType, renderer: str):
+    platforms = {"Windows": "windows", "Linux": "linux", "Darwin": "osx"}
+
+    with tempfile.TemporaryDirectory() as temp_path:
+        output_path = Path(temp_path) / "shader.bin"
+        args = [
+            str(shaderc_path),
+            "-f",
+            str(source_path),
+            "-o",
+            str(output_path),
+            "-i",
+            str(shader_include_path),
+            "--platform",
+            platforms[platform.system()],
+            "--profile",
+            shader_profile(shader_type, renderer),
+            "--type",
+            shader_type.value,
+        ]
+        if platform.system() == "Windows":
+            args += ["-O", "1" if shader_type == ShaderType.COMPUTE else "3"]
+
+        if not os.access(shaderc_path, os.X_OK):
+            os.chmod(shaderc_path, 0o774)
+
+        result = subprocess.run(args, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(
+                f"Error compiling shader {source_path}:\n{result.stdout}"
+            )
+
+        return output_path.read_bytes()
+
+
+def create_shader(name: str, data):
+    handle = bgfx.createShader(bgfx.copy(as_void_ptr(data), len(data)))
+    bgfx.setName(handle, name)
+
+    return handle
+
+
+# The pybgfx version and the headers shipped with it, a new shaderc or bgfx
+# header misses the cache
+@lru_cache(maxsize=None)
+def _toolchain_key():
+    try:
+        from importlib.metadata import version
+    except ImportError:
+        # Python 3.7
+        from pkg_resources import get_distribution
+
+        pybgfx_version = get_distribution("bgfx-python").version
+    else:
+        pybgfx_version = version("bgfx-python")
+
+    key = hashlib.sha256(f"{pybgfx_version}\n".encode())
+    for header in sorted(shader_include_path.glob("*.sh")):
+        key.update(f"\n{header.name}\n".encode())
+        key.update(header.read_bytes())
+
+    return key.digest()
+
+
+def _shader_key(source_path: Path, shader_type: ShaderType, renderer: str):
+    key = hashlib.sha256()
+    key.update(_toolchain_key())
+    key.update(f"{platform.system()}\n{renderer}\n".encode())
+    key.update(f"{shader_type.value}\n".encode())
+    key.update(source_path.read_bytes())
+
+    # Anything the shader could include, sorted for a stable key
+    for header in sorted(source_path.parent.iterdir()):
+        if header.suffix in (".sh", ".sc"):
+            key.update(f"\n{header.name}\n".encode())
+            key.update(header.read_bytes())
+
+    return key.hexdigest()
+
+
+# A read-only view of the mapped file, which stays mapped until the view is
+# released. None when missing or not a shader binary, e.g. a truncated write
+def _read_cached_shader(cache_file: Path):
+    try:
+        with open(cache_file, "rb") as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    if data[:3] not in SHADER_MAGICS:
+        data.close()
+        return None
+
+    return np.frombuffer(data, dtype=np.uint8)
+
+
+def _write_cached_shader(cache_file: Path, data: bytes):
+    # Renamed into place, concurrent readers never see a partial file
+    temp_file = cache_file.with_name(
+        f"{cache_file.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    )
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        temp_file.write_bytes(data)
+        os.replace(temp_file, cache_file)
+    except OSError:
+        # Read-only cache directory, compile again next time
+        pass
+
+
+# Compute program created on its first use, from a blob prepared in the
+# background when an executor is given. load_time is the time the first use
+# took, in seconds
+class LazyKernel:
+    def __init__(self, name: str, root_path: Path, executor: Optional[Executor] = None):
+        self.name = name
+        self.root_path = root_path
+        self.load_time = None
+
+        self._handle = None
+        self._blob = None
+
+        if executor is not None:
+            renderer = bgfx.getRendererName(bgfx.getRendererType())
+            self._blob = executor.submit(
+                shader_blob, name, ShaderType.COMPUTE, root_path, renderer
+            )
+
+    @property
+    def loaded(self):
+        return self._handle is not None
+
+    @property
+    def handle(self):
+        if self._handle is None:
+            start = perf_counter()
+
+            if self._blob is not None:
+                data = self._blob.result()
+                self._blob = None
+            else:
+                data = shader_blob(self.name, ShaderType.COMPUTE, self.root_path)
+
+            self._handle = bgfx.createProgram(create_shader(self.name, data), True)
+            self.load_time = perf_counter() - start
+
+        return self._handle
+
+    def destroy(self):
+        if self._blob is not None:
+            self._blob.cancel()
+            self._blob = None
+
+        if self._handle is not None:
+            bgfx.destroy(self._handle)
+            self._handle = None
+
+
+# Structured buffer re-uploaded from the CPU, grows (never shrinks) to fit
+class DynamicBuffer:
+    def __init__(self, dimensions: int, vertex_layout: bgfx.VertexLayout):
+        self.dimensions = dimensions
+        self.vertex_layout = vertex_layout
+        self.capacity = 0
+        self.handle = None
+
+    @property
+    def memory(self):
+        return sizeof(c_float) * self.capacity * self.dimensions
+
+    # data is a ctypes array of length * dimensions floats
+    def upload(self, data, length: int):
+        if length > self.capacity:
+            if self.handle is not None:
+                bgfx.destroy(self.handle)
+            self.capacity = max(length, 2 * self.capacity)
+            self.handle = create_buffer(
+                self.capacity, self.dimensions, self.vertex_layout
+            )
+
+        bgfx.update(self.handle, 0, bgfx.copy(as_void_ptr(data), sizeof(data)))
+
+    def destroy(self):
+        if self.handle is not None:
+            bgfx.destroy(self.handle)
+            self.handle = None
+            self.capacity = 0
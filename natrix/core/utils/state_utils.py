@@ -0,0 +1,109 @@
+import json
+import os
+import struct
+from concurrent.futures import CancelledError, Future
+from pathlib import Path
+
+import numpy as np
+
+# Checkpoint layout: magic, version and header length, a JSON header describing
+# the arrays, then the raw arrays, each aligned so that it can be mapped in place
+STATE_MAGIC = b"NATRIXST"
+STATE_VERSION = 1
+STATE_ALIGNMENT = 64
+
+_prefix = struct.Struct("<8sII")
+
+
+def _align(offset: int):
+    return -(-offset // STATE_ALIGNMENT) * STATE_ALIGNMENT
+
+
+# metadata is JSON serialisable, arrays maps names to NumPy arrays
+def write_state(path: Path, metadata: dict, arrays: dict):
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+    # The offsets depend on the header length, which depends on the offsets
+    header_length = 0
+    while True:
+        offset = _align(_prefix.size + header_length)
+        layout = {}
+        for name, array in arrays.items():
+            layout[name] = {
+                "dtype": array.dtype.str,
+                "shape": list(array.shape),
+                "offset": offset,
+            }
+            offset = _align(offset + array.nbytes)
+
+        header = json.dumps({"metadata": metadata, "arrays": layout}).encode()
+        if len(header) <= header_length:
+            break
+        header_length = len(header)
+
+    # Written next to the target and renamed, a crash never leaves half a file
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(_prefix.pack(STATE_MAGIC, STATE_VERSION, header_length))
+        f.write(header.ljust(header_length))
+        for name, array in arrays.items():
+            f.seek(layout[name]["offset"])
+            f.write(array.data)
+    os.replace(tmp_path, path)
+
+
+# Returns the metadata and read-only memory maps of the arrays, nothing is read
+# until the arrays are accessed
+def read_state(path: Path):
+    with open(path, "rb") as f:
+        prefix = f.read(_prefix.size)
+        if len(prefix) < _prefix.size:
+            raise ValueError(f"'{path}' is not a simulator state")
+
+        magic, version, header_length = _prefix.unpack(prefix)
+        if magic != STATE_MAGIC:
+            raise ValueError(f"'{path}' is not a simulator state")
+        if version != STATE_VERSION:
+            raise ValueError(f"'{path}' has unsupported state version {version}")
+
+        header = json.loads(f.read(header_length).decode())
+
+    arrays = {}
+    for name, entry in header["arrays"].items():
+        shape = tuple(entry["shape"])
+        if int(np.prod(shape)) == 0:
+            arrays[name] = np.zeros(shape, dtype=entry["dtype"])
+            continue
+
+        arrays[name] = np.memmap(
+            path, dtype=entry["dtype"], mode="r", offset=entry["offset"], shape=shape
+        )
+
+    return header["metadata"], arrays
+
+
+# Writes the state once every future of arrays (name to Future of an array) is
+# done. Returns a Future of the path, failed if a readback or the write failed
+def write_state_when_done(path: Path, metadata: dict, arrays: dict):
+    result = Future()
+    remaining = [len(arrays)]
+
+    def on_done(_):
+        remaining[0] -= 1
+        if remaining[0] > 0:
+            return
+
+        try:
+            write_state(
+                path, metadata, {name: f.result() for name, f in arrays.items()}
+            )
+        except (Exception, CancelledError) as e:
+            result.set_exception(e)
+        else:
+            result.set_result(Path(path))
+
+    for future in arrays.values():
+        future.add_done_callback(on_done)
+
+    return result
@@ -0,0 +1,43 @@
+import json
+from pathlib import Path
+
+from decouple import config
+from pybgfx import bgfx
+
+# Fastest workgroup sizes found by the autotuner, one entry per renderer and GPU
+tuning_path = Path(
+    config("NATRIX__TUNING_PATH", default=str(Path.home() / ".natrix" / "tuning.json"))
+)
+
+
+# Needs bgfx to be initialized
+def device_key():
+    caps = bgfx.getCaps()
+    renderer = bgfx.getRendererName(caps.rendererType)
+
+    return f"{renderer}:{caps.vendorId:04x}:{caps.deviceId:04x}"
+
+
+def load_tuning(path: Path = tuning_path):
+    try:
+        return json.loads(Path(path).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+# The tuned (x, y) workgroup size of the current device, None if never tuned
+def load_group_size(path: Path = tuning_path):
+    entry = load_tuning(path).get(device_key())
+    if entry is None:
+        return None
+
+    return tuple(entry["group_size"])
+
+
+def save_group_size(group_size: tuple, results: list, path: Path = tuning_path):
+    tuning = load_tuning(path)
+    tuning[device_key()] = {"group_size": list(group_size), "results": results}
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(tuning, indent=2))
@@ -2,7 +2,7 @@ import tempfile
 
 import nox
 
-locations = "demo", "natrix", "tests", "noxfile.py"
+locations = "benchmarks", "demo", "natrix", "tests", "noxfile.py"
 
 
 def install_with_constraints(session, *args, **kwargs):
@@ -0,0 +1,60 @@
+import json
+
+from benchmarks.compare import compare_results, format_row, load_results, main
+
+
+def result(steps_per_second, advect, solve, width=64, iterations=50):
+    return {
+        "width": width,
+        "height": width,
+        "iterations": iterations,
+        "steps_per_second": steps_per_second,
+        "stages": {"advect": advect, "solve": solve},
+    }
+
+
+def test_changes_are_positive_when_faster():
+    baseline = {(64, 64, 50): result(100.0, 0.002, 0.004)}
+    candidate = {(64, 64, 50): result(125.0, 0.001, 0.004)}
+
+    rows = {row[1]: row for row in compare_results(baseline, candidate, 0.1)}
+
+    assert rows["steps/s"][4] == 0.25
+    assert rows["advect"][4] == 0.5
+    assert rows["solve"][4] == 0.0
+    assert not any(row[5] for row in rows.values())
+
+
+def test_slowdowns_past_the_threshold_regress():
+    baseline = {(64, 64, 50): result(100.0, 0.002, 0.004)}
+    candidate = {(64, 64, 50): result(95.0, 0.002, 0.005)}
+
+    rows = {row[1]: row for row in compare_results(baseline, candidate, 0.1)}
+
+    assert not rows["steps/s"][5]
+    assert rows["solve"][5]
+    assert "REGRESSION" in format_row(rows["solve"])
+
+
+def test_only_common_sizes_are_compared():
+    baseline = {(64, 64, 50): result(100.0, 0.002, 0.004)}
+    candidate = {
+        (64, 64, 50): result(100.0, 0.002, 0.004),
+        (128, 128, 50): result(50.0, 0.004, 0.008, width=128),
+    }
+
+    rows = compare_results(baseline, candidate, 0.1)
+
+    assert {row[0] for row in rows} == {(64, 64, 50)}
+
+
+def test_main_exits_with_one_on_regressions(tmp_path, capsys):
+    baseline = tmp_path / "baseline.json"
+    candidate = tmp_path / "candidate.json"
+    baseline.write_text(json.dumps({"results": [result(100.0, 0.002, 0.004)]}))
+    candidate.write_text(json.dumps({"results": [result(50.0, 0.002, 0.004)]}))
+
+    assert list(load_results(str(baseline))) == [(64, 64, 50)]
+    assert main([str(baseline), str(baseline)]) == 0
+    assert main([str(baseline), str(candidate)]) == 1
+    assert "REGRESSION" in capsys.readouterr().out
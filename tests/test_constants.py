@@ -0,0 +1,14 @@
+from natrix.core.common.constants import ScratchSlots, TemplateConstants
+
+
+def test_template_constants_have_no_aliases():
+    assert len(TemplateConstants.__members__) == len(TemplateConstants)
+
+
+def test_scratch_slots_come_after_the_template_constants():
+    slots = [
+        value for name, value in vars(ScratchSlots).items() if not name.startswith("_")
+    ]
+
+    assert min(slots) > TemplateConstants.RESIDUAL
+    assert max(slots) <= 15
@@ -0,0 +1,73 @@
+import pytest
+
+pytest.importorskip("pybgfx")
+
+from natrix.core import fluid_simulator, profiler, readback  # noqa: E402
+from natrix.core.common.constants import Field, PressureSolver  # noqa: E402
+from natrix.core.utils import shaders_utils  # noqa: E402
+from natrix.core.utils.shaders_utils import LazyKernel  # noqa: E402
+
+real_bgfx = fluid_simulator.bgfx
+
+
+# Stands in for bgfx, records the views of the dispatches and blits. Enums come
+# from the real module, every other call does nothing
+class FakeBgfx:
+    def __init__(self):
+        self.dispatches = []
+        self.blits = []
+
+    def dispatch(self, view, kernel, *args):
+        self.dispatches.append((view, kernel))
+
+    def blit(self, view, *args):
+        self.blits.append(view)
+
+    def readTexture(self, texture, data):
+        return 2
+
+    def __getattr__(self, name):
+        attribute = getattr(real_bgfx, name)
+        if isinstance(attribute, type):
+            return attribute
+
+        return lambda *args, **kwargs: object()
+
+
+@pytest.fixture
+def bgfx(monkeypatch):
+    fake = FakeBgfx()
+    for module in (fluid_simulator, profiler, readback, shaders_utils):
+        monkeypatch.setattr(module, "bgfx", fake)
+    monkeypatch.setattr(LazyKernel, "handle", property(lambda kernel: kernel.name))
+    return fake
+
+
+def test_fields_are_read_after_the_update_while_profiling(bgfx):
+    simulator = fluid_simulator.FluidSimulator(64, 64, object(), group_size=(16, 16))
+    simulator.enable_profiling()
+
+    simulator.update(1.0 / 60.0)
+    update_views = [view for view, _ in bgfx.dispatches]
+
+    simulator.read_field(Field.PRESSURE)
+    simulator.measure_max_velocity()
+    readback_views = [view for view, _ in bgfx.dispatches[len(update_views) :]]
+
+    # Views run in order, the blits of a view before its dispatches
+    assert len(readback_views) == 3
+    assert min(readback_views) > max(update_views)
+    assert bgfx.blits
+    assert min(bgfx.blits) > max(readback_views)
+
+
+def test_multigrid_reports_its_v_cycles(bgfx):
+    simulator = fluid_simulator.FluidSimulator(
+        64, 64, object(), PressureSolver.MULTIGRID, group_size=(16, 16)
+    )
+    simulator.v_cycles = 3
+
+    simulator.update(1.0 / 60.0)
+
+    assert simulator.last_iterations == 3
+    assert simulator.last_residual is None
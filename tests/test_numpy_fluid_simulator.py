@@ -0,0 +1,191 @@
+import numpy as np
+import pytest
+
+from natrix.core.common.constants import ObstacleLayer, Precision, PressureSolver
+from natrix.core.numpy_fluid_simulator import NumpyFluidSimulator
+
+
+def create_simulator(solver=PressureSolver.JACOBI, iterations=4, **kwargs):
+    simulator = NumpyFluidSimulator(64, 64, solver, **kwargs)
+    if solver == PressureSolver.MULTIGRID:
+        simulator.v_cycles = iterations
+    else:
+        simulator.iterations = iterations
+
+    return simulator
+
+
+def step(simulator, steps=1):
+    for _ in range(steps):
+        simulator.add_velocity((0.5, 0.5), (0.2, 0.1), 8.0)
+        simulator.update(1.0 / 60.0)
+
+
+# Of the last pressure solve
+def residual(simulator):
+    return simulator._max_residual()
+
+
+def test_invalid_parameters():
+    simulator = create_simulator()
+
+    with pytest.raises(ValueError):
+        simulator.speed = 0.0
+    with pytest.raises(ValueError):
+        simulator.iterations = 0
+
+
+def test_splat_stays_inside_its_radius():
+    simulator = create_simulator()
+    simulator.add_velocity((0.5, 0.5), (0.2, 0.1), 4.0)
+
+    velocity = simulator.get_velocity_buffer().reshape(64, 64, 2)
+    assert velocity[32, 32] == pytest.approx((0.2, 0.1))
+    assert not velocity[:26].any()
+    assert not velocity[:, :26].any()
+
+
+@pytest.mark.parametrize("solver", list(PressureSolver))
+def test_solver_converges(solver):
+    def projected(iterations):
+        simulator = create_simulator(solver, iterations)
+        step(simulator)
+        return simulator.get_velocity_buffer()
+
+    # Distance to a fully converged projection
+    converged = projected(1000)
+    errors = [
+        float(np.abs(projected(iterations) - converged).max())
+        for iterations in (1, 4, 20, 100)
+    ]
+
+    assert errors == sorted(errors, reverse=True)
+    assert errors[-1] < 0.25 * errors[0]
+
+
+def test_sor_has_a_single_pressure_buffer():
+    jacobi = create_simulator(PressureSolver.JACOBI)
+    sor = create_simulator(PressureSolver.SOR)
+
+    assert sor.buffer_memory == jacobi.buffer_memory - 64 * 64 * 4
+
+
+@pytest.mark.parametrize("solver", list(PressureSolver))
+def test_warm_start_lowers_the_residual(solver):
+    cold = create_simulator(solver, 1 if solver == PressureSolver.MULTIGRID else 4)
+    warm = create_simulator(solver, 1 if solver == PressureSolver.MULTIGRID else 4)
+    warm.warm_start = True
+
+    step(cold, 10)
+    step(warm, 10)
+
+    assert residual(warm) < residual(cold)
+
+
+def test_fp16_stores_rounded_velocities():
+    simulator = create_simulator(precision=Precision.FP16)
+
+    simulator.add_velocity((0.5, 0.5), (0.123456, 0.654321), 4.0)
+    velocity = simulator.get_velocity_buffer()
+    assert np.array_equal(velocity, velocity.astype(np.float16))
+
+    step(simulator, 3)
+    velocity = simulator.get_velocity_buffer()
+    assert velocity.dtype == np.float32
+    assert velocity.any()
+    assert np.array_equal(velocity, velocity.astype(np.float16))
+
+
+def test_fp16_stays_close_to_fp32():
+    fp32 = create_simulator()
+    fp16 = create_simulator(precision=Precision.FP16)
+
+    step(fp32, 3)
+    step(fp16, 3)
+
+    np.testing.assert_allclose(
+        fp16.get_velocity_buffer(), fp32.get_velocity_buffer(), atol=2e-3
+    )
+
+
+@pytest.mark.parametrize("solver", [PressureSolver.JACOBI, PressureSolver.SOR])
+def test_tolerance_stops_the_solve_early(solver):
+    simulator = create_simulator(solver, 1000)
+    simulator.tolerance = 1e-3
+    simulator.residual_check_interval = 4
+    step(simulator)
+
+    assert simulator.last_iterations < 1000
+    assert simulator.last_iterations % 4 == 0
+    assert simulator.last_residual < 1e-3
+    assert residual(simulator) == pytest.approx(simulator.last_residual)
+
+
+def test_without_tolerance_every_iteration_runs():
+    simulator = create_simulator(PressureSolver.JACOBI, 30)
+    step(simulator)
+
+    assert simulator.last_iterations == 30
+    assert simulator.last_residual is None
+
+
+@pytest.mark.parametrize("tolerance", [0.0, 1e-3])
+def test_multigrid_reports_its_v_cycles(tolerance):
+    simulator = create_simulator(PressureSolver.MULTIGRID, 3)
+    simulator.tolerance = tolerance
+    step(simulator)
+
+    assert simulator.last_iterations == 3
+    if tolerance:
+        assert simulator.last_residual == pytest.approx(residual(simulator))
+    else:
+        assert simulator.last_residual is None
+
+
+def test_invalid_tolerance():
+    simulator = create_simulator()
+
+    with pytest.raises(ValueError):
+        simulator.tolerance = -1.0
+    with pytest.raises(ValueError):
+        simulator.residual_check_interval = 0
+
+
+def test_set_fields():
+    simulator = create_simulator()
+    velocity = np.random.default_rng(2).uniform(-1.0, 1.0, (64, 64, 2))
+    pressure = np.linspace(0.0, 1.0, 64 * 64).reshape(64, 64)
+    mask = np.zeros((64, 64), dtype=bool)
+    mask[10:20, 30:40] = True
+
+    simulator.set_velocity(velocity)
+    simulator.set_pressure(pressure)
+    simulator.set_obstacles(mask)
+
+    np.testing.assert_allclose(
+        simulator.get_velocity_buffer(), velocity.reshape(-1, 2), rtol=1e-6
+    )
+    np.testing.assert_allclose(
+        simulator._pressure_buffer[simulator.PRESSURE_READ], pressure.ravel()
+    )
+    np.testing.assert_array_equal(
+        simulator._obstacles_buffer, np.where(mask, ObstacleLayer.STATIC, 0).ravel()
+    )
+
+
+def test_set_fields_of_the_wrong_size():
+    simulator = create_simulator()
+
+    with pytest.raises(ValueError):
+        simulator.set_velocity(np.zeros((32, 32, 2)))
+    with pytest.raises(ValueError):
+        simulator.set_pressure(np.zeros((64, 32)))
+    with pytest.raises(ValueError):
+        simulator.set_obstacles(np.zeros((64, 65), dtype=bool))
+
+
+def test_set_velocity_rounds_fp16():
+    simulator = create_simulator(precision=Precision.FP16)
+    simulator.set_velocity(np.full((64, 64, 2), 0.1))
+
+    assert simulator.get_velocity_buffer()[0, 0] == np.float32(np.float16(0.1))
@@ -0,0 +1,95 @@
+import pytest
+
+from natrix.core.utils.obstacle_utils import (
+    CIRCLE,
+    TRIANGLE,
+    bin_primitives,
+    bounding_box_groups,
+    circle_bounds,
+    mesh_triangles,
+    pack_primitives,
+    union_bounds,
+)
+
+
+def test_bounding_box_groups():
+    # Cells 10 to 26, three workgroups of 8
+    assert bounding_box_groups(10.5, 3.0, 25.5, 4.0, 64, 64, (8, 8)) == (10, 3, 3, 1)
+
+
+def test_bounding_box_groups_clamps_to_the_grid():
+    assert bounding_box_groups(-5.0, -5.0, 100.0, 3.0, 64, 32, (16, 16)) == (
+        0,
+        0,
+        4,
+        1,
+    )
+
+
+def test_bounding_box_groups_outside_the_grid():
+    assert bounding_box_groups(70.0, 0.0, 80.0, 10.0, 64, 64, (8, 8)) is None
+    assert bounding_box_groups(0.0, -10.0, 10.0, -1.0, 64, 64, (8, 8)) is None
+
+
+def test_union_of_circle_bounds():
+    bounds = [
+        circle_bounds((0.25, 0.5), 4.0, 64, 64),
+        circle_bounds((0.75, 0.5), 2.0, 64, 64),
+    ]
+
+    assert union_bounds(bounds) == (12.0, 28.0, 50.0, 36.0)
+    assert bounding_box_groups(*union_bounds(bounds), 64, 64, (8, 8)) == (
+        12,
+        28,
+        5,
+        2,
+    )
+
+
+def test_bin_primitives():
+    # A 2x2 tile region starting at cell (8, 8), with 8x8 tiles
+    region = (8, 8, 2, 2)
+    bounds = [
+        (9.0, 9.0, 12.0, 12.0),
+        (14.0, 9.0, 18.0, 12.0),
+        (0.0, 0.0, 40.0, 40.0),
+        (17.0, 17.0, 20.0, 20.0),
+    ]
+
+    ranges, indices = bin_primitives(bounds, region, (8, 8))
+
+    tiles = [
+        indices[ranges[2 * tile] : ranges[2 * tile] + ranges[2 * tile + 1]]
+        for tile in range(4)
+    ]
+    assert tiles == [[0, 1, 2], [1, 2], [2], [2, 3]]
+    assert len(indices) == 8
+
+
+def test_bin_primitives_without_primitives():
+    ranges, indices = bin_primitives([], (0, 0, 2, 1), (8, 8))
+
+    assert ranges == [0, 0, 0, 0]
+    assert indices == []
+
+
+def test_pack_primitives():
+    primitives = pack_primitives(
+        [((0.5, 0.25), 3.0)], [((0.0, 0.0), (1.0, 0.0), (0.0, 1.0))]
+    )
+
+    assert primitives == [
+        *(0.5, 0.25, 0.0, 0.0, 0.0, 0.0, 3.0, CIRCLE),
+        *(0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 0.0, TRIANGLE),
+    ]
+
+
+def test_mesh_triangles():
+    vertices = [(0.0, 0.0), (1.0, 0.0), (1.0, 1.0), (0.0, 1.0)]
+
+    assert mesh_triangles(vertices, [0, 1, 2, 0, 2, 3]) == [
+        ((0.0, 0.0), (1.0, 0.0), (1.0, 1.0)),
+        ((0.0, 0.0), (1.0, 1.0), (0.0, 1.0)),
+    ]
+    with pytest.raises(ValueError):
+        mesh_triangles(vertices, [0, 1])
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("pybgfx")
+
+from natrix.core import readback  # noqa: E402
+
+
+# Stands in for bgfx: readTexture completes two frames after the current one
+class FakeBgfx:
+    TextureFormat = readback.bgfx.TextureFormat
+
+    def __init__(self):
+        self.frame = 0
+        self.blits = []
+        self.destroyed = 0
+
+    def createTexture2D(self, *args):
+        return object()
+
+    def blit(self, view, dst, x, y, src):
+        self.blits.append(view)
+
+    def readTexture(self, texture, data):
+        return self.frame + 2
+
+    def destroy(self, handle):
+        self.destroyed += 1
+
+
+@pytest.fixture
+def bgfx(monkeypatch):
+    fake = FakeBgfx()
+    monkeypatch.setattr(readback, "bgfx", fake)
+    return fake
+
+
+def create_ring(**kwargs):
+    return readback.ReadbackRing(4, 2, FakeBgfx.TextureFormat.RGBA32F, **kwargs)
+
+
+def test_futures_complete_once_their_frame_is_reached(bgfx):
+    ring = create_ring(channels=4, components=2, view=200)
+
+    slot = ring.acquire()
+    slot.data[...] = np.arange(32, dtype=np.float32).reshape(2, 4, 4)
+    future = ring.submit(slot)
+
+    assert bgfx.blits == [200]
+    ring.poll(1)
+    assert not future.done()
+
+    ring.poll(2)
+    assert future.result().shape == (2, 4, 2)
+    np.testing.assert_array_equal(future.result()[0, 1], (4.0, 5.0))
+    assert ring.pending == 0
+
+
+def test_full_ring_returns_none(bgfx):
+    ring = create_ring(slots=2)
+
+    futures = [ring.submit(ring.acquire()) for _ in range(2)]
+    assert ring.pending == 2
+    assert ring.acquire() is None
+
+    ring.poll(2)
+    assert all(future.done() for future in futures)
+    assert ring.acquire() is not None
+
+
+def test_destroy_cancels_pending_readbacks(bgfx):
+    ring = create_ring(slots=2)
+    future = ring.submit(ring.acquire())
+
+    ring.destroy()
+
+    assert future.cancelled()
+    assert bgfx.destroyed == 4
+
+
+def test_invalid_slots(bgfx):
+    with pytest.raises(ValueError):
+        create_ring(slots=0)
@@ -0,0 +1,127 @@
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+
+from natrix.core.common.constants import Field
+from natrix.core.recorder import FieldRecorder, read_recording
+
+
+def done(array):
+    future = Future()
+    future.set_result(array)
+    return future
+
+
+def frame(step):
+    return np.full((4, 3, 2), step, dtype=np.float32)
+
+
+# Hands out finished readbacks, or None as if every staging slot was in flight
+class FakeSimulator:
+    def __init__(self, full=()):
+        self.full = full
+        self.reads = []
+
+    def read_field(self, field):
+        self.reads.append(field)
+        if field in self.full:
+            return None
+
+        return done(np.full((4, 3), int(field), dtype=np.float32))
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_round_trip(tmp_path, compress):
+    with FieldRecorder(tmp_path, compress=compress) as recorder:
+        for step in range(5):
+            recorder.record("velocity", step * 10, done(frame(step)))
+
+    stats = recorder.stats
+    assert (stats.recorded, stats.written, stats.dropped) == (5, 5, 0)
+    assert stats.bytes_written > 0
+
+    velocity = read_recording(tmp_path)["velocity"]
+    assert len(velocity) == 5
+    np.testing.assert_array_equal(velocity.steps, [0, 10, 20, 30, 40])
+    for step in range(5):
+        np.testing.assert_array_equal(velocity[step], frame(step))
+
+    if compress:
+        with pytest.raises(ValueError):
+            velocity.frames
+    else:
+        assert velocity.frames.shape == (5, 4, 3, 2)
+
+
+def test_sample_every_nth_step(tmp_path):
+    simulator = FakeSimulator(full=(Field.PRESSURE,))
+
+    with FieldRecorder(tmp_path, every=2) as recorder:
+        for step in range(4):
+            recorder.sample(simulator, step, (Field.VELOCITY, Field.PRESSURE))
+
+    assert simulator.reads == [Field.VELOCITY, Field.PRESSURE] * 2
+    assert recorder.stats.written == 2
+    assert recorder.stats.skipped == 2
+    assert list(read_recording(tmp_path)) == ["velocity"]
+
+
+def test_cancelled_readbacks_are_skipped(tmp_path):
+    future = Future()
+
+    with FieldRecorder(tmp_path) as recorder:
+        recorder.record("pressure", 0, future)
+        future.cancel()
+
+    assert recorder.stats.skipped == 1
+    assert recorder.stats.recorded == 0
+
+
+def test_full_queue_drops_frames(tmp_path):
+    recorder = FieldRecorder(tmp_path, queue_size=2)
+
+    # The writer blocks on the first frame until released
+    writing = threading.Event()
+    release = threading.Event()
+    write_frame = recorder._write_frame
+
+    def blocked_write_frame(*args):
+        writing.set()
+        release.wait()
+        return write_frame(*args)
+
+    recorder._write_frame = blocked_write_frame
+
+    recorder.record("velocity", 0, done(frame(0)))
+    assert writing.wait(5.0)
+    for step in range(1, 6):
+        recorder.record("velocity", step, done(frame(step)))
+
+    stats = recorder.stats
+    assert (stats.recorded, stats.dropped, stats.queued) == (3, 3, 2)
+    assert stats.max_queued == 2
+
+    release.set()
+    recorder.close()
+
+    # Close flushes what was queued
+    assert recorder.stats.written == 3
+    np.testing.assert_array_equal(read_recording(tmp_path)["velocity"].steps, [0, 1, 2])
+
+
+def test_write_errors_are_raised_by_close(tmp_path):
+    recorder = FieldRecorder(tmp_path)
+    recorder.record("velocity", 0, done(frame(0)))
+    recorder.record("velocity", 1, done(np.zeros((2, 2), dtype=np.float32)))
+
+    with pytest.raises(ValueError):
+        recorder.close()
+
+
+def test_invalid_parameters(tmp_path):
+    with pytest.raises(ValueError):
+        FieldRecorder(tmp_path, every=0)
+    with pytest.raises(ValueError):
+        FieldRecorder(tmp_path, queue_size=0)
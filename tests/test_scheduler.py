@@ -0,0 +1,145 @@
+from types import SimpleNamespace
+
+import pytest
+
+from natrix.core.scheduler import StepScheduler
+
+
+class FakeSimulator:
+    def __init__(self, max_velocity=None, gpu_time=None):
+        self.speed = 500.0
+        self.max_velocity = max_velocity
+        self.profiler = None
+        if gpu_time is not None:
+            frame = SimpleNamespace(gpu_time=gpu_time)
+            self.profiler = SimpleNamespace(last_frame=frame)
+
+        self.steps = []
+        self.measures = 0
+
+    def update(self, time_delta):
+        self.steps.append(time_delta)
+
+    def measure_max_velocity(self):
+        self.measures += 1
+
+
+def test_one_substep_per_frame():
+    simulator = FakeSimulator()
+    on_step = []
+    scheduler = StepScheduler(simulator, on_step=on_step.append)
+
+    report = scheduler.advance(1.0 / 60.0)
+
+    assert report.substeps == 1
+    assert report.time_step == pytest.approx(1.0 / 60.0)
+    assert not report.merged
+    assert report.skipped == 0.0
+    assert report.stable_step is None
+    assert simulator.steps == on_step == [report.time_step]
+    assert simulator.measures == 1
+
+
+def test_leftover_time_is_carried_over():
+    simulator = FakeSimulator()
+    scheduler = StepScheduler(simulator)
+
+    assert scheduler.advance(0.01).substeps == 0
+    assert scheduler.advance(0.01).substeps == 1
+    assert scheduler.advance(0.015).substeps == 1
+    assert sum(simulator.steps) == pytest.approx(2.0 / 60.0)
+
+
+def test_cfl_limits_the_substeps():
+    # The fastest cell moves 500 cells per second
+    simulator = FakeSimulator(max_velocity=1.0)
+    scheduler = StepScheduler(simulator, cfl=1.0, max_substeps=4)
+
+    report = scheduler.advance(1.0 / 60.0)
+
+    assert report.stable_step == pytest.approx(0.002)
+    assert report.substeps == 4
+    assert report.time_step == pytest.approx(0.002)
+    assert not report.merged
+    assert report.skipped == 0.0
+
+    # The rest is carried over, no time is lost
+    for _ in range(4):
+        assert scheduler.advance(0.0).skipped == 0.0
+    assert sum(simulator.steps) == pytest.approx(1.0 / 60.0, abs=0.002)
+    assert len(simulator.steps) == 8
+
+
+def test_slow_flows_merge_substeps():
+    simulator = FakeSimulator(max_velocity=1e-4)
+    scheduler = StepScheduler(simulator, max_substeps=4)
+
+    report = scheduler.advance(0.2)
+
+    assert report.substeps == 4
+    assert report.merged
+    assert report.time_step == pytest.approx(0.05)
+    assert report.skipped == 0.0
+
+
+def test_hitches_are_clamped_and_caught_up():
+    simulator = FakeSimulator()
+    scheduler = StepScheduler(simulator, max_substeps=4, max_frame_time=0.25)
+
+    report = scheduler.advance(10.0)
+
+    assert report.substeps == 4
+    assert not report.merged
+    assert report.skipped == 0.0
+
+    for _ in range(4):
+        scheduler.advance(0.0)
+    assert sum(simulator.steps) == pytest.approx(0.25, abs=1.0 / 60.0)
+
+
+def test_carried_time_is_capped_at_max_frame_time():
+    # A substep of 2 ms, far too short to keep up with real time
+    simulator = FakeSimulator(max_velocity=1.0)
+    scheduler = StepScheduler(simulator, max_substeps=4, max_frame_time=0.25)
+
+    skipped = sum(scheduler.advance(0.1).skipped for _ in range(10))
+
+    carried = scheduler._accumulator
+    assert sum(simulator.steps) + skipped + carried == pytest.approx(1.0)
+    assert carried <= 0.25
+    assert skipped > 0.0
+
+
+def test_frame_budget_limits_the_substeps():
+    # 40 ms of GPU time per frame, far over a 10 ms budget
+    simulator = FakeSimulator(gpu_time=40.0)
+    scheduler = StepScheduler(simulator, max_substeps=4, frame_budget=0.01)
+
+    assert scheduler.advance(1.0 / 60.0).substeps == 1
+    assert scheduler.substep_time == pytest.approx(0.04)
+
+    report = scheduler.advance(4.0 / 60.0)
+    assert report.substeps == 1
+    assert report.skipped == pytest.approx(3.0 / 60.0)
+
+
+def test_without_cfl_the_max_velocity_is_not_measured():
+    simulator = FakeSimulator(max_velocity=1.0)
+    scheduler = StepScheduler(simulator, cfl=None)
+
+    report = scheduler.advance(1.0 / 60.0)
+
+    assert report.stable_step is None
+    assert report.time_step == pytest.approx(1.0 / 60.0)
+    assert simulator.measures == 0
+
+
+def test_invalid_parameters():
+    simulator = FakeSimulator()
+
+    with pytest.raises(ValueError):
+        StepScheduler(simulator, time_step=0.0)
+    with pytest.raises(ValueError):
+        StepScheduler(simulator, cfl=0.0)
+    with pytest.raises(ValueError):
+        StepScheduler(simulator, max_substeps=0)
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from natrix.core.common.constants import ObstacleLayer
+from natrix.core.numpy_fluid_simulator import NumpyFluidSimulator
+from natrix.core.utils.sdf_utils import mask_sdf, polygon_sdf
+
+
+def brute_force_distance(mask, seeds):
+    ys, xs = np.nonzero(seeds)
+    distance = np.full(mask.shape, np.inf)
+    for y, x in np.ndindex(*mask.shape):
+        distance[y, x] = np.hypot(xs - x, ys - y).min()
+
+    return distance
+
+
+def test_mask_sdf_sign():
+    mask = np.zeros((32, 32), dtype=bool)
+    mask[8:16, 10:20] = True
+
+    sdf = mask_sdf(mask)
+
+    assert sdf.dtype == np.float32
+    assert (sdf[mask] < 0.0).all()
+    assert (sdf[~mask] > 0.0).all()
+    np.testing.assert_array_equal(sdf <= 0.0, mask)
+
+
+def test_mask_sdf_is_exact_up_to_max_distance():
+    mask = np.random.default_rng(1).random((24, 20)) < 0.05
+
+    sdf = mask_sdf(mask, max_distance=6.0)
+
+    outside = brute_force_distance(mask, mask) - 0.5
+    inside = 0.5 - brute_force_distance(mask, ~mask)
+    expected = np.clip(np.where(mask, inside, outside), -6.0, 6.0)
+    np.testing.assert_allclose(sdf, expected, atol=1e-5)
+
+
+def test_polygon_sdf_of_a_square():
+    square = [(0.25, 0.25), (0.75, 0.25), (0.75, 0.75), (0.25, 0.75)]
+
+    sdf = polygon_sdf([square], 32, 32)
+
+    # Edges on cells 8 and 24
+    assert sdf[16, 16] == pytest.approx(-8.0)
+    assert sdf[16, 8] == pytest.approx(0.0)
+    assert sdf[16, 4] == pytest.approx(4.0)
+    assert sdf[2, 2] == pytest.approx(np.hypot(6.0, 6.0))
+
+
+def test_set_obstacle_sdf_thresholds_the_field():
+    simulator = NumpyFluidSimulator(32, 32)
+    square = [(0.25, 0.25), (0.75, 0.25), (0.75, 0.75), (0.25, 0.75)]
+    sdf = polygon_sdf([square], 32, 32)
+
+    simulator.set_obstacle_sdf(sdf, offset=-2.0)
+
+    obstacles = simulator._obstacles_buffer.reshape(32, 32)
+    expected = np.where(sdf <= -2.0, ObstacleLayer.STATIC, 0)
+    np.testing.assert_array_equal(obstacles, expected)
+    assert obstacles[16, 16] == ObstacleLayer.STATIC
+    assert obstacles[16, 9] == 0
+
+    with pytest.raises(ValueError):
+        simulator.set_obstacle_sdf(sdf[:16])
+
+
+def test_set_obstacle_sdf_keeps_the_other_layer():
+    simulator = NumpyFluidSimulator(32, 32)
+    simulator.add_circle_obstacle((0.5, 0.5), 2.0)
+    simulator.add_circle_obstacle((0.1, 0.1), 2.0, static=True)
+    dynamic = simulator._obstacles_buffer & ObstacleLayer.DYNAMIC
+    assert dynamic.any()
+
+    sdf = np.full((32, 32), 1.0, dtype=np.float32)
+    sdf[10:20, 10:20] = -1.0
+    simulator.set_obstacle_sdf(sdf)
+
+    obstacles = simulator._obstacles_buffer
+    np.testing.assert_array_equal(obstacles & ObstacleLayer.DYNAMIC, dynamic)
+    np.testing.assert_array_equal(
+        obstacles & ObstacleLayer.STATIC,
+        np.where(sdf <= 0.0, ObstacleLayer.STATIC, 0).ravel(),
+    )
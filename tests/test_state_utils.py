@@ -0,0 +1,114 @@
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+
+from natrix.core.common.constants import Precision, PressureSolver
+from natrix.core.numpy_fluid_simulator import NumpyFluidSimulator
+from natrix.core.utils.state_utils import (
+    STATE_ALIGNMENT,
+    read_state,
+    write_state,
+    write_state_when_done,
+)
+
+
+def test_write_read_round_trip(tmp_path):
+    path = tmp_path / "state.bin"
+    arrays = {
+        "velocity": np.random.default_rng(3).random((8, 5, 2), dtype=np.float32),
+        "obstacles": np.arange(40, dtype=np.uint32).reshape(8, 5),
+        "empty": np.zeros((0, 5), dtype=np.float32),
+    }
+
+    write_state(path, {"width": 5, "name": "test"}, arrays)
+    metadata, loaded = read_state(path)
+
+    assert metadata == {"width": 5, "name": "test"}
+    assert loaded.keys() == arrays.keys()
+    for name, array in arrays.items():
+        assert loaded[name].dtype == array.dtype
+        np.testing.assert_array_equal(loaded[name], array)
+
+    # Mapped in place, read-only and aligned
+    assert isinstance(loaded["velocity"], np.memmap)
+    assert not loaded["velocity"].flags.writeable
+    assert loaded["velocity"].offset % STATE_ALIGNMENT == 0
+    assert loaded["obstacles"].offset % STATE_ALIGNMENT == 0
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_read_rejects_other_files(tmp_path):
+    path = tmp_path / "state.bin"
+
+    path.write_bytes(b"")
+    with pytest.raises(ValueError):
+        read_state(path)
+
+    path.write_bytes(b"NOTASTATE" * 4)
+    with pytest.raises(ValueError):
+        read_state(path)
+
+
+def test_write_state_when_done(tmp_path):
+    path = tmp_path / "state.bin"
+    futures = {"a": Future(), "b": Future()}
+
+    result = write_state_when_done(path, {}, futures)
+    futures["a"].set_result(np.ones(4, dtype=np.float32))
+    assert not result.done()
+
+    futures["b"].set_result(np.zeros(2, dtype=np.float32))
+    assert result.result() == path
+    np.testing.assert_array_equal(read_state(path)[1]["a"], np.ones(4))
+
+
+def test_write_state_when_done_fails_with_a_readback(tmp_path):
+    path = tmp_path / "state.bin"
+    futures = {"a": Future(), "b": Future()}
+
+    result = write_state_when_done(path, {}, futures)
+    futures["a"].cancel()
+    futures["b"].set_result(np.zeros(2, dtype=np.float32))
+
+    assert result.exception() is not None
+    assert not path.exists()
+
+
+def test_simulator_state_round_trip(tmp_path):
+    path = tmp_path / "state.bin"
+    simulator = NumpyFluidSimulator(32, 32, PressureSolver.SOR, Precision.FP16)
+    simulator.speed = 250.0
+    simulator.warm_start = True
+    simulator.add_velocity((0.5, 0.5), (0.2, 0.1), 6.0)
+    simulator.add_circle_obstacle((0.25, 0.25), 3.0, static=True)
+    simulator.update(1.0 / 60.0)
+    simulator.save_state(path)
+
+    restored = NumpyFluidSimulator(32, 32)
+    restored.load_state(path)
+
+    assert restored.speed == 250.0
+    assert restored.warm_start
+    assert restored.pressure_solver == PressureSolver.SOR
+    np.testing.assert_array_equal(
+        restored.get_velocity_buffer(), simulator.get_velocity_buffer()
+    )
+    np.testing.assert_array_equal(
+        restored._obstacles_buffer, simulator._obstacles_buffer
+    )
+
+    # Both continue the same way
+    simulator.update(1.0 / 60.0)
+    restored.update(1.0 / 60.0)
+    np.testing.assert_allclose(
+        restored.get_velocity_buffer(), simulator.get_velocity_buffer(), atol=1e-3
+    )
+
+
+def test_load_state_of_another_size(tmp_path):
+    path = tmp_path / "state.bin"
+    NumpyFluidSimulator(32, 32).save_state(path)
+
+    with pytest.raises(ValueError):
+        NumpyFluidSimulator(16, 16).load_state(path)